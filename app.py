@@ -1,38 +1,164 @@
-from flask import Flask, flash, redirect, render_template, request, session
-from flask_session import Session
+from flask import Flask, Response, before_render_template, flash, g, jsonify, make_response, redirect, render_template, request, session
+from flask import template_rendered
 from werkzeug.security import check_password_hash, generate_password_hash
-from helpers import login_required, get_matches_FCH, get_league_table, get_current_datetime, update_FCH_matches_db, update_league_table, is_update_needed_FCH_matches, is_update_needed_league_table, update_user_scores, convert_to_6_decimals, convert_iso_datetime_to_human_readable, get_insights, get_rangliste_data
-from datetime import timedelta
-from cs50 import SQL
+from helpers import login_required, admin_required, is_admin, get_matches_FCH, get_league_table, get_league_table_matchdays, get_current_timestamp, format_timestamp, convert_iso_datetime_to_human_readable, get_insights, get_rangliste_page_data
+from helpers import get_rangliste_user, parse_rangliste_cursor, rangliste_page_size, max_rangliste_page_size, get_live_match_id, get_data_versions, bump_data_version, get_user_history, get_league_history
+from helpers import parse_history_cursor, history_page_size, max_history_page_size, get_predictions_version, bump_predictions_version
+from cache import get_cached
+from datetime import datetime
+from scheduler import start_scheduler, run_in_one_process
+from scoring import add_to_standings
+from migrations import migrate
+from sessions import init_app as init_sessions
+from live import start_live_poller, start_live_follower, stream as live_stream, open_stream as open_live_stream, close_stream as close_live_stream
+from live import get_state as get_live_state, retry_after as live_retry_after
+from provisional import get_provisional_standings, standings_size as provisional_standings_size, max_standings_size as max_provisional_standings_size
+import logging
+import os
+import time
+import metrics
+import openliga
+import profiler
+from database import db
 
 # Configure application
 app = Flask(__name__)
 
+# Log messages of all modules (TIPPSPIEL_LOG_LEVEL=DEBUG shows the details of every sync)
+logging.basicConfig(level=os.environ.get("TIPPSPIEL_LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 
-# Configure http headers for correct image loading
-headers={"Accept": "*/*", "User-Agent": "python-requests"}
-
-# Configure session to use filesystem (instead of signed cookies)
+# Sessions end when the browser is closed
 app.config["SESSION_PERMANENT"] = False
-app.config["SESSION_TYPE"] = "filesystem"
-Session(app)
 
-# Connect to the SQLite database
-db = SQL("sqlite:///tippspiel.db")
+# Bring the database schema up to date
+migrate()
+
+# Store sessions in the database (instead of signed cookies or one file per session)
+init_sessions(app)
+
+# Keep league table, matches and scores up to date in the background (set TIPPSPIEL_SYNC=0 to disable, e. g. for benchmarks).
+# Only one process syncs and polls the live match, the others get the live state from the database
+if os.environ.get("TIPPSPIEL_SYNC", "1") == "1":
+    run_in_one_process(start_scheduler, start_live_poller)
+    start_live_follower()
+
+
+@app.teardown_appcontext
+def release_connection(exception):
+    """Give the database connection of this request back to the pool"""
+    db.release()
+
+
+# Opt-in cProfile of single requests (TIPPSPIEL_PROFILE=1). Registered first so the profile covers the other hooks too
+if profiler.enabled:
+    @app.before_request
+    def start_profile():
+        """Profile if an admin asked for it (?profile=1, always saved) or the request is sampled (saved if slow)"""
+        force = request.args.get("profile") == "1" and is_admin()
+
+        if force or profiler.is_sampled():
+            g.profile = profiler.Profiled(f"{request.method} {request.path}", force)
+
+    @app.teardown_request
+    def stop_profile(exception):
+        if "profile" in g:
+            g.pop("profile").stop()
+
+
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    db.reset_query_stats()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Latency of the route and the SQL statements of the request (only with TIPPSPIEL_METRICS=1)"""
+    if metrics.enabled and "request_start" in g:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        queries, query_seconds = db.get_query_stats()
+
+        metrics.observe("http_request_duration_seconds", time.perf_counter() - g.request_start,
+                        route=route, method=request.method, status=response.status_code)
+        metrics.observe("sql_queries_per_request", queries, buckets=metrics.query_count_buckets, route=route)
+        metrics.observe("sql_seconds_per_request", query_seconds, route=route)
+
+    return response
+
+
+@before_render_template.connect_via(app)
+def start_template_metrics(sender, template, context, **extra):
+    g.template_start = time.perf_counter()
+
+
+@template_rendered.connect_via(app)
+def record_template_metrics(sender, template, context, **extra):
+    if "template_start" in g:
+        metrics.observe("template_render_seconds", time.perf_counter() - g.template_start, template=template.name)
 
 
 @app.after_request
 def after_request(response):
-    """Ensure responses aren't cached"""
-    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    response.headers["Expires"] = 0
-    response.headers["Pragma"] = "no-cache"
+    """Ensure responses aren't cached (except pages with an ETag, see cacheable)"""
+    if "ETag" not in response.headers:
+        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+        response.headers["Expires"] = 0
+        response.headers["Pragma"] = "no-cache"
     return response
 
 
+def is_not_modified(etag):
+    """True if the browser already has this version of the page. Pending flash messages always get a fresh page"""
+    return request.if_none_match.contains(etag) and not session.get("_flashes")
+
+
+def cacheable(response, etag):
+    # The browser may keep the page, but has to ask with If-None-Match before showing it again.
+    # The pages depend on the logged in user, so a cache must never hand them to another session cookie
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.vary.add("Cookie")
+    return response
+
+
+def not_modified(etag):
+    """Empty 304 for is_not_modified, with the validator and caching headers of the full page but without body headers"""
+    response = Response(status=304)
+    response.headers.pop("Content-Type", None)
+    response.headers.pop("Content-Length", None)
+    return cacheable(response, etag)
+
+
+def get_rangliste_window(season, first_name, last_name):
+    """Matchdays from ?<first_name>= to ?<last_name>= (default: the whole season) and the matches of season within them"""
+    first = request.args.get(first_name, 1, type=int)
+    last = request.args.get(last_name, max((match["matchday"] for match in season), default=34), type=int)
+
+    return first, last, [match for match in season if first <= match["matchday"] <= last]
+
+
+def rangliste_json(user):
+    return {key: user[key] for key in ("id", "username", "rank", "total_points", "correct_result", "correct_goal_diff", "correct_tendency", "cells")}
+
+
 @app.route("/rangliste")
 @login_required
 def rangliste():
+    """The first page of the ranking (and the own row on top), the rest is loaded from /api/rangliste while scrolling"""
+    user_id = session["user_id"]
+    versions = get_data_versions()
+
+    # Predictions of the match that is underway are shown to everyone
+    live_match_id = get_live_match_id()
+    season = get_matches_FCH()
+    first, last, matches = get_rangliste_window(season, "von", "bis")
+
+    # The own row (highlighted, with the own predictions before kickoff) makes the page different for every user.
+    # Other users' tips only show from kickoff on, which live_match_id covers
+    etag = f"rangliste-{versions['ranking']}-{get_predictions_version(user_id)}-{live_match_id}-{user_id}-{first}-{last}"
+
+    if is_not_modified(etag):
+        return not_modified(etag)
 
     # Get last update
     last_update = db.execute("""
@@ -40,51 +166,194 @@ def rangliste():
                              ORDER BY evaluation_Date DESC
                              LIMIT 1
                              """)[0]["evaluation_Date"]
-    
-    last_update = convert_iso_datetime_to_human_readable(last_update)
-
-    # Get next kickoff, to be able to display the predictions of users when the match is underway but not yet finished
-    next_match = db.execute("""
-                              SELECT id, matchDateTime FROM FCH_matches
-                              WHERE matchIsFinished = 0
-                              ORDER BY matchDateTime ASC
-                              LIMIT 1
-                              """)
-    
-    if next_match:
-        next_match = dict(next_match) # Convert Row object to dict
-        next_match["is_live"] = False
 
-        current_datetime = get_current_datetime()
-        match_start_time = next_match["matchDateTime"]
-        match_duration = timedelta(minutes=90+15+10)  # Assuming each match lasts 90 minutes
-        match_end_time = match_start_time + match_duration
+    users, next_cursor = get_rangliste_page_data(matches, user_id, live_match_id)
 
-        if match_start_time <= current_datetime <= match_end_time:
-            next_match["is_live"] = True
+    response = make_response(render_template("rangliste.html",
+                                              matchdata=matches,
+                                              users=users,
+                                              own_user=get_rangliste_user(matches, user_id, live_match_id),
+                                              next_cursor=next_cursor,
+                                              first=first,
+                                              last=last,
+                                              matchdays=sorted({match["matchday"] for match in season}),
+                                              last_update=convert_iso_datetime_to_human_readable(last_update)))
+
+    return cacheable(response, etag)
+
+
+@app.route("/api/rangliste")
+@login_required
+def api_rangliste():
+    """
+    A page of the ranking as JSON: ?limit= users (at most max_rangliste_page_size) after the cursor ?after= (the next of the
+    previous page, none for the top), with their cells for the matches of the matchdays ?first= to ?last=
+    """
+    user_id = session["user_id"]
+    versions = get_data_versions()
+    live_match_id = get_live_match_id()
+    first, last, matches = get_rangliste_window(get_matches_FCH(), "first", "last")
+    limit = min(max(request.args.get("limit", rangliste_page_size, type=int), 1), max_rangliste_page_size)
+
+    cursor = request.args.get("after")
+    after = parse_rangliste_cursor(cursor) if cursor else None
+
+    if cursor and after is None:
+        return jsonify({"error": "invalid cursor"}), 400
+
+    etag = f"api-rangliste-{versions['ranking']}-{get_predictions_version(user_id)}-{live_match_id}-{user_id}-{first}-{last}-{cursor}-{limit}"
+
+    if is_not_modified(etag):
+        return not_modified(etag)
+
+    users, next_cursor = get_rangliste_page_data(matches, user_id, live_match_id, after, limit)
+
+    return cacheable(jsonify({
+        "matches": [{"id": match["id"], "matchday": match["matchday"]} for match in matches],
+        "users": [rangliste_json(user) for user in users],
+        "next": next_cursor,
+    }), etag)
 
-    else:
-        next_match = None
 
-    return render_template("rangliste.html",
-                           matchdata=get_matches_FCH(),
-                           users=get_rangliste_data(),
-                           user_id=session["user_id"],
-                           next_match=next_match,
-                           last_update=last_update)
+@app.route("/live")
+@login_required
+def live():
+    """Score and provisional points of the running match as Server-Sent Events (see live.py)"""
+    # Every stream holds a worker thread, beyond the limit the page has to try again later
+    if not open_live_stream():
+        response = make_response("", 503)
+        response.headers["Retry-After"] = live_retry_after
+        return response
+
+    response = Response(live_stream(), mimetype="text/event-stream")
+    response.call_on_close(close_live_stream)
+
+    # Don't let a proxy (e. g. nginx) hold the events back
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+if metrics.enabled:
+    @app.route("/metrics")
+    def metrics_page():
+        """Prometheus text format: route latencies, SQL per request, templates, OpenLigaDB, sync and scoring"""
+        openliga_stats = openliga.get_stats()
+        openliga_counters = [
+            (f"openliga_{name}_total", description, {(("endpoint", endpoint),): counters[name] for endpoint, counters in openliga_stats.items()})
+            for name, description in (
+                ("calls", "Requests to OpenLigaDB (every attempt)"),
+                ("errors", "Failed requests to OpenLigaDB (connection errors and error responses)"),
+                ("retries", "Retried requests to OpenLigaDB"),
+                ("not_modified", "Responses of OpenLigaDB that were not modified (304)"),
+                ("bytes", "Bytes received from OpenLigaDB"),
+            )
+        ]
+
+        return Response(metrics.render(openliga_counters), mimetype="text/plain; version=0.0.4")
+
+
+if profiler.enabled:
+    @app.route("/admin/profiles")
+    @admin_required
+    def admin_profiles():
+        """Saved profiles and their hottest functions (of one profile with ?file=..., otherwise of all)"""
+        profiles = profiler.list_profiles()
+        selected = request.args.get("file")
+        sort = "cumtime" if request.args.get("sort") == "cumtime" else "tottime"
+        functions = profiler.get_hot_functions([selected] if selected else [profile["file"] for profile in profiles], sort=sort)
+
+        return render_template("admin_profiles.html", profiles=profiles, selected=selected, sort=sort, functions=functions,
+                               threshold=profiler.slow_threshold, sample_rate=profiler.sample_rate)
+
+
+@app.route("/live/standings")
+@login_required
+def live_standings():
+    """Standings if the running match ended with the current score (or ?team1_score=&team2_score=), as JSON"""
+    state = get_live_state()
+
+    if not state["match_id"]:
+        return jsonify({"match_id": None})
+
+    team1_score = request.args.get("team1_score", state["team1_score"], type=int)
+    team2_score = request.args.get("team2_score", state["team2_score"], type=int)
+    limit = min(max(request.args.get("limit", provisional_standings_size, type=int), 1), max_provisional_standings_size)
+
+    provisional = get_provisional_standings(state["match_id"], team1_score, team2_score, limit, session["user_id"])
+
+    return jsonify({
+        "match_id": state["match_id"],
+        "team1_score": team1_score,
+        "team2_score": team2_score,
+        "standings": provisional["standings"],
+        "me": provisional["user"],
+    })
+
+
+@app.route("/history")
+@login_required
+def history():
+    """Points and rank of a user (?user_id=, default: the own) after every evaluated matchday, as JSON"""
+    user_id = request.args.get("user_id", session["user_id"], type=int)
+    etag = f"history-{get_data_versions()['ranking']}-{user_id}"
+
+    if is_not_modified(etag):
+        return not_modified(etag)
+
+    return cacheable(jsonify({"user_id": user_id, "history": get_user_history(user_id)}), etag)
+
+
+@app.route("/history/league")
+@login_required
+def league_history():
+    """
+    Standings after each matchday from ?first= to ?last= (default: the whole season) as JSON. Per matchday ?limit= users
+    around the own rank, or the ones after the cursor ?after= (the next of a matchday)
+    """
+    user_id = session["user_id"]
+    first = request.args.get("first", 1, type=int)
+    last = request.args.get("last", 34, type=int)
+    limit = min(max(request.args.get("limit", history_page_size, type=int), 1), max_history_page_size)
+
+    cursor = request.args.get("after")
+    after = parse_history_cursor(cursor) if cursor else None
+
+    if cursor and after is None:
+        return jsonify({"error": "invalid cursor"}), 400
+
+    etag = f"history-league-{get_data_versions()['ranking']}-{user_id}-{first}-{last}-{cursor}-{limit}"
+
+    if is_not_modified(etag):
+        return not_modified(etag)
+
+    history = get_league_history(first, last, user_id, after, limit)
+
+    return cacheable(jsonify({"matchdays": [{"matchday": matchday, "standings": standings, "next": next_cursor}
+                                            for matchday, (standings, next_cursor) in history.items()]}), etag)
 
 
 @app.route("/tippen", methods=["GET", "POST"])
 @login_required
 def tippen():
+    user_id = session["user_id"]
+
+    # One timestamp for the whole request: a match that kicks off while the request runs is either open or closed, not both
+    now = get_current_timestamp()
+    prediction_date = datetime.fromtimestamp(now).isoformat()
+
     fch_matches = get_matches_FCH()
     valid_matches = []
 
     for match in fch_matches:
-        if match["matchIsFinished"] == 0 and get_current_datetime() < match["matchDateTime"]:
+        if match["matchIsFinished"] == 0 and now < match["kickoff"]:
            valid_matches.append(match)
 
     if request.method =="POST":
+        # Load the existing predictions once, instead of once per match
+        existing_predictions = {prediction["match_id"]: prediction for prediction in db.execute(
+            "SELECT match_id, team1_score, team2_score FROM predictions WHERE user_id = ?", user_id)}
+        changed_predictions = []
+
         # Iterate through every match
         for match in valid_matches:
             match_id = match["id"]
@@ -104,47 +373,66 @@ def tippen():
             
             else:
                 continue
-            
-            # Get the last prediction for the match
-            prediction = db.execute("SELECT * FROM predictions WHERE user_id = ? AND match_id = ?", session["user_id"], match_id)
-            winner = 1 if team1_score > team2_score else 2 if team1_score < team2_score else 0
 
-            # If it exists and differs from the original prediction, update the prediction
-            if prediction:
-                if team1_score != prediction[0]["team1_score"] or team2_score != prediction[0]["team2_score"]:
-                    db.execute("UPDATE predictions SET team1_score = ?, team2_score = ?, goal_diff = ?, winner = ?, prediction_date = ? WHERE user_id = ? AND match_id = ?",
-                            team1_score, team2_score, team1_score-team2_score, winner, get_current_datetime(), session["user_id"], match_id)
+            # Skip predictions that did not change
+            prediction = existing_predictions.get(match_id)
+
+            if prediction and team1_score == prediction["team1_score"] and team2_score == prediction["team2_score"]:
+                continue
+
+            winner = 1 if team1_score > team2_score else 2 if team1_score < team2_score else 0
+            changed_predictions.append((user_id, matchday, match_id, team1_score, team2_score, team1_score-team2_score, winner, prediction_date))
+
+        # Insert new and update existing predictions in one batch and one transaction
+        if changed_predictions:
+            with db.transaction():
+                db.executemany("""
+                               INSERT INTO predictions (user_id, matchday, match_id, team1_score, team2_score, goal_diff, winner, prediction_date)
+                               VALUES(?, ?, ?, ?, ?, ?, ?, ?)
+                               ON CONFLICT (user_id, match_id) DO UPDATE SET
+                               team1_score = excluded.team1_score,
+                               team2_score = excluded.team2_score,
+                               goal_diff = excluded.goal_diff,
+                               winner = excluded.winner,
+                               prediction_date = excluded.prediction_date
+                               """, changed_predictions)
+
+                # The own row of the ranking changed (the predictions version is for the title odds)
+                bump_predictions_version(user_id)
+                bump_data_version("predictions")
 
-            # If there is no prediction in the db, insert it
-            else:
-                db.execute("""
-                        INSERT INTO predictions (user_id, matchday, match_id, team1_score, team2_score, goal_diff, winner, prediction_date)
-                        VALUES(?, ?, ?, ?, ?, ?, ?, ?)
-                        """,
-                        session["user_id"], matchday, match_id, team1_score, team2_score, team1_score-team2_score, winner, get_current_datetime())
-    
     # Get all predictions from the user
-    predictions = db.execute("SELECT * FROM predictions WHERE user_id = ?", session["user_id"])
+    predictions = db.execute("SELECT * FROM predictions WHERE user_id = ?", user_id)
 
     # Get time of last update
     last_update = db.execute("""
-                                SELECT lastUpdateDateTime FROM FCH_matches
-                                ORDER BY lastUpdateDateTime DESC
+                                SELECT last_update FROM FCH_matches
+                                ORDER BY last_update DESC
                                 LIMIT 1
-                                """)[0]["lastUpdateDateTime"]
+                                """)[0]["last_update"]
     
     # If an entry for last update exists, format for displaying
     if last_update:
-        last_update = convert_to_6_decimals(last_update)
-        last_update = convert_iso_datetime_to_human_readable(last_update)
+        last_update = format_timestamp(last_update)
 
     return render_template("tippen.html", matches=fch_matches, predictions=predictions, valid_matches=valid_matches, last_update=last_update)
 
 
 @app.route("/tabelle")
 @login_required
-def tabelle():    
-    return render_template("tabelle.html", table_data=get_league_table())
+def tabelle():
+    # Same page for every user, it only changes with the league table. ?spieltag=N shows the table after matchday N
+    version = get_data_versions()["league_table"]
+    matchday = request.args.get("spieltag", type=int)
+    etag = f"tabelle-{version}-{matchday}"
+
+    if is_not_modified(etag):
+        return not_modified(etag)
+
+    table_data = get_cached(("tabelle", matchday), version, lambda: get_league_table(matchday))
+    matchdays = get_cached("tabelle-matchdays", version, get_league_table_matchdays)
+
+    return cacheable(make_response(render_template("tabelle.html", table_data=table_data, matchday=matchday, matchdays=matchdays)), etag)
 
 
 @app.route("/regeln")
@@ -182,43 +470,12 @@ def login():
             flash("Ungültiger Benutzername und/oder Passwort", 'error')
             return redirect("/login")
 
+        # New session id for the logged in user, one planted before the login is no longer valid
+        app.session_interface.regenerate(session)
+
         # Remember which user has logged in
         session["user_id"] = rows[0]["id"]
 
-        # Update database
-        print("Is update needed for the league table?")
-
-        try:
-
-            if is_update_needed_league_table():
-                print("Yes. Updating...")
-                update_league_table()
-                print("Update finished.")
-
-            else:
-                print("No update needed.")
-        
-        except Exception as e:
-            print(f"Updating league table failed: {e}")
-
-        print("Is update needed for the FCH matches db?")
-
-        try:
-            if is_update_needed_FCH_matches():
-                print("Yes, updating...")
-                update_FCH_matches_db()
-                print("Updating done.")
-
-                # Updating user scores
-                print("Updating user scores...")
-                update_user_scores()
-                print("Scores done.")
-            else:
-                print("No update needed.")
-
-        except Exception as e:
-            print(f"Updating fch matches failed: {e}")
-
         # Redirect user to home page
         return redirect("/")
 
@@ -272,8 +529,11 @@ def register():
         # Hash the pw
         hashed_pw = generate_password_hash(password)
 
-        # Insert user into database
-        db.execute("INSERT INTO users (username, hash) VALUES(?, ?)", username, hashed_pw)
+        # Insert user into database, together with the (last) place in the standings
+        with db.transaction():
+            user_id = db.execute("INSERT INTO users (username, hash) VALUES(?, ?)", username, hashed_pw)
+            add_to_standings(user_id)
+            bump_data_version("ranking")
 
         # Show message
         flash("Erfolgreich registriert!", 'success')
@@ -0,0 +1,89 @@
+"""
+Read latency while the background sync writes, with the previous rollback journal and with WAL.
+
+A writer thread keeps rewriting the points of all predictions (like a recompute during a sync), while
+the main thread reads the ranking query. With the rollback journal every commit locks out the readers,
+with WAL the readers keep working on the last committed state. Commits cost most on a real disk, so
+use --dir to run on the disk the app runs on (the temp directory may be in memory).
+
+Usage: python benchmarks/bench_database.py [--users 2000] [--seconds 3] [--dir DIR]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+
+from common import create_database
+
+
+def measure(database, seconds):
+    """ Latencies (in seconds) of the ranking query while a second thread writes, and the number of write transactions """
+    db = database.Database(database.database_path)
+    stop = threading.Event()
+    writes = 0
+
+    def write():
+        nonlocal writes
+        while not stop.is_set():
+            with db.transaction():
+                db.execute("UPDATE predictions SET points = (points + 1) % 5")
+            writes += 1
+        db.release()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+
+    latencies = []
+    end = time.perf_counter() + seconds
+
+    while time.perf_counter() < end:
+        start = time.perf_counter()
+        db.execute("SELECT * FROM predictions WHERE user_id = ?", 1)
+        db.execute("SELECT total_points FROM users WHERE id = ?", 1)
+        latencies.append(time.perf_counter() - start)
+
+    stop.set()
+    writer.join()
+    db.close()
+
+    return latencies, writes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--dir", help="directory for the database (default: temp directory)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(dir=args.dir)
+    db_path = os.path.join(workdir, "tippspiel.db")
+    os.chdir(workdir)
+
+    try:
+        create_database(db_path, args.users)
+
+        import database
+        database.db.close()
+
+        print(f"{args.users} users × 34 matches, {args.seconds:.0f} s of reads per mode")
+        print(f"{'':<18}{'reads':>8}{'median':>12}{'p99':>12}{'max':>12}{'writes':>8}")
+
+        for name, journal_mode, synchronous in [("rollback journal", "DELETE", "FULL"), ("WAL", "WAL", "NORMAL")]:
+            database.pragmas["journal_mode"] = journal_mode
+            database.pragmas["synchronous"] = synchronous
+
+            latencies, writes = measure(database, args.seconds)
+            p99 = statistics.quantiles(latencies, n=100)[98]
+            print(f"{name:<18}{len(latencies):>8}{statistics.median(latencies) * 1000:>9.1f} ms{p99 * 1000:>9.1f} ms"
+                  f"{max(latencies) * 1000:>9.1f} ms{writes:>8}")
+
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
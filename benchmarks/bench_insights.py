@@ -0,0 +1,102 @@
+"""
+Latency of the home page statistics (helpers.get_insights) for growing numbers of users.
+
+Compares the previous eight queries (among them a ROW_NUMBER() window over all users to find one rank)
+with the single query of build_insights and with a cached call of get_insights.
+
+Usage: python benchmarks/bench_insights.py [--users 1000 10000] [--repeat 20]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from common import create_database
+
+
+def get_insights_before(db, user_id):
+    # The queries of get_insights before it was collapsed into one
+    predictions_rated = db.execute("""
+                                SELECT COUNT(*) AS predictions_rated
+                                FROM predictions AS p
+                                JOIN FCH_matches AS m ON m.id = p.match_id
+                                WHERE p.user_id = ?
+                                AND m.matchIsFinished = 1
+                                """, user_id)
+    db.execute("SELECT COUNT(*) AS prediction_count FROM predictions AS p WHERE p.user_id = ?", user_id)
+    db.execute("SELECT COUNt(*) AS completed_matches FROM FCH_matches WHERE matchIsFinished = 1")
+    db.execute("SELECT total_points FROM users WHERE id = ?", user_id)
+    db.execute("""
+               SELECT rank
+               FROM (SELECT id, ROW_NUMBER()
+               OVER (
+                 ORDER BY total_points DESC) AS rank
+                 FROM users
+               ) AS ranked_users
+               WHERE id = ?
+               """, user_id)
+    db.execute("SELECT correct_result, correct_goal_diff, correct_tendency FROM users WHERE id = ?", user_id)
+    db.execute("SELECT COUNT(*) AS no_users FROM users")
+    db.execute("SELECT username FROM users WHERE id = ?", user_id)
+    return predictions_rated
+
+
+def best_of(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, "tippspiel.db")
+    os.chdir(workdir)
+
+    try:
+        from flask import Flask, session
+
+        print(f"{'users':>8}{'before':>12}{'one query':>12}{'cached':>12}")
+
+        for users in args.users:
+            # Start from a new file for every size
+            import database
+            database.db.close()
+            create_database(db_path, users)
+
+            import cache
+            import helpers
+            import scoring
+            scoring.update_user_scores()
+
+            # Somebody in the middle of the ranking
+            user_id = users // 2
+            app = Flask(__name__)
+            app.secret_key = "bench"
+
+            with app.test_request_context():
+                session["user_id"] = user_id
+
+                before = best_of(lambda: get_insights_before(helpers.db, user_id), args.repeat)
+                one_query = best_of(lambda: helpers.build_insights(user_id), args.repeat)
+
+                helpers.get_insights()
+                cached = best_of(helpers.get_insights, args.repeat)
+                cache.clear()
+
+            print(f"{users:>8}{before * 1000:>9.2f} ms{one_query * 1000:>9.2f} ms{cached * 1000:>9.2f} ms")
+
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Fan-out of the live score (live.py): many open ranking pages share one upstream poll.
+
+Starts --subscribers event streams (each in its own thread, like one request thread per open page),
+publishes --updates score changes and measures how long it takes until every stream got each of them.
+Upstream requests and database queries do not depend on the number of subscribers: one poll per interval.
+
+Usage: python benchmarks/bench_live.py [--subscribers 500] [--updates 5]
+"""
+import argparse
+import statistics
+import threading
+import time
+
+import common  # noqa: F401 (puts the repo on sys.path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers", type=int, default=500)
+    parser.add_argument("--updates", type=int, default=5)
+    args = parser.parse_args()
+
+    import live
+
+    received = threading.Semaphore(0)
+    stop = threading.Event()
+
+    def subscribe():
+        for event in live.stream():
+            if stop.is_set():
+                return
+            if event.startswith("id:"):
+                received.release()
+
+    threads = [threading.Thread(target=subscribe, daemon=True) for _ in range(args.subscribers)]
+    for thread in threads:
+        thread.start()
+
+    # Every stream sends the current state first
+    for _ in range(args.subscribers):
+        received.acquire()
+
+    latencies = []
+    for update in range(1, args.updates + 1):
+        start = time.perf_counter()
+        live.publish({"match_id": 1, "team1_score": update, "team2_score": 0, "finished": False, "points": {}})
+
+        for _ in range(args.subscribers):
+            received.acquire()
+
+        latencies.append(time.perf_counter() - start)
+
+    stop.set()
+
+    print(f"{args.subscribers} open streams, {args.updates} score updates")
+    print(f"all streams notified after: median {statistics.median(latencies) * 1000:.1f} ms, max {max(latencies) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
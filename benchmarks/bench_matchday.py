@@ -0,0 +1,114 @@
+"""
+A matchday played out by the fake OpenLigaDB server (tools/fake_openliga.py), synced by the scheduler, without network.
+
+The last match of the season kicks off, has its goals, the final whistle and a late correction of the result, sped up.
+Meanwhile scheduler.run_sync runs every --interval seconds against a server that is slow and fails at random, so the
+retries and backoff of openliga.py are part of the timings. Afterwards the result is checked: the stored score and
+league table have to match the server, and the users' totals have to match a recompute from scratch.
+
+Usage: python benchmarks/bench_matchday.py [--users 1000] [--speed 600] [--interval 0.5] [--latency 0.02]
+                                           [--error-rate 0.1] [--drop-rate 0.02]
+"""
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from common import create_database
+from fake_openliga import FakeOpenLiga, MatchdayScenario, build_fixture
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--speed", type=float, default=600, help="match seconds per real second")
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds between two syncs")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds the fake server needs per response")
+    parser.add_argument("--error-rate", type=float, default=0.1, help="share of requests answered with 429/5xx")
+    parser.add_argument("--drop-rate", type=float, default=0.02, help="share of connections closed without an answer")
+    parser.add_argument("--backoff-base", type=float, default=0.05, help="openliga.backoff_base (0.5 in the app)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, "tippspiel.db")
+    os.chdir(workdir)
+
+    try:
+        create_database(db_path, args.users)
+
+        import openliga
+        import scheduler
+        import scoring
+        from database import db
+        scoring.update_user_scores()
+
+        # Keep the output to the summary
+        logging.basicConfig(level=logging.WARNING)
+
+        server = FakeOpenLiga(build_fixture(db_path), latency=args.latency, error_rate=args.error_rate,
+                              drop_rate=args.drop_rate, seed=1846).start()
+        openliga.base_url = server.url
+        openliga.backoff_base = args.backoff_base
+        openliga.reset()
+
+        scenario = MatchdayScenario(server, correction=(2, 2), speed=args.speed).start()
+        match_id = scenario.match["matchID"]
+        print(f"{args.users} users, match {match_id}, {args.speed:g}x speed, sync every {args.interval} s, "
+              f"{args.latency * 1000:.0f} ms latency, {args.error_rate:.0%} errors, {args.drop_rate:.0%} dropped")
+
+        durations = []
+        failed = 0
+        seen_scores = []
+
+        # Sync until the match (including the correction) is over, then once more
+        while True:
+            finished = scenario.finished
+
+            start = time.perf_counter()
+            failed += not scheduler.run_sync()
+            durations.append(time.perf_counter() - start)
+
+            score = db.execute("SELECT team1_score, team2_score, matchIsFinished FROM FCH_matches WHERE id = ?", match_id)[0]
+            if not seen_scores or seen_scores[-1] != tuple(score.values()):
+                seen_scores.append(tuple(score.values()))
+
+            if finished:
+                break
+
+            time.sleep(args.interval)
+
+        server.stop()
+        stats = openliga.get_stats()
+
+        print(f"syncs: {len(durations)} ({failed} with a failed step), "
+              f"mean {sum(durations) / len(durations) * 1000:.0f} ms, max {max(durations) * 1000:.0f} ms")
+        print(f"requests: {server.requests} ({server.errors} failed on purpose, {server.not_modified} not modified), "
+              f"client retries: {sum(counters['retries'] for counters in stats.values())}")
+        print("stored results seen: " + ", ".join("-" if not finished else f"{team1}:{team2}"
+                                                   for team1, team2, finished in seen_scores))
+
+        # Correctness: score, league table and totals
+        stored = db.execute("SELECT team1_score, team2_score FROM FCH_matches WHERE id = ?", match_id)[0]
+        score_ok = (stored["team1_score"], stored["team2_score"]) == scenario.final_score
+
+        teams = {team["id"]: team for team in db.execute("SELECT id, points, goals, opponentGoals, matches, rank FROM teams")}
+        table_ok = all(teams[team["teamInfoId"]]["points"] == team["points"] and teams[team["teamInfoId"]]["goals"] == team["goals"]
+                       and teams[team["teamInfoId"]]["rank"] == rank
+                       for rank, team in enumerate(server.fixture["table"], start=1))
+
+        totals = "SELECT id, total_points, correct_result, correct_goal_diff, correct_tendency FROM users ORDER BY id"
+        synced_totals = db.execute(totals)
+        scoring.recompute_all()
+        totals_ok = synced_totals == db.execute(totals)
+
+        print(f"final score {'ok' if score_ok else 'WRONG'}, league table {'ok' if table_ok else 'WRONG'}, "
+              f"user totals {'ok' if totals_ok else 'WRONG'}")
+
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Provisional standings for a live match (provisional.py) on a generated league (default 10k users).
+
+Times one recompute per goal: the vectorized pass (score all predictions, add to the totals, re-rank)
+and, for comparison, the same in plain Python (one prediction at a time, then sorted()).
+
+Usage: python benchmarks/bench_provisional.py [--users 10000] [--repeat 5]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from common import create_database
+
+
+def get_provisional_standings_python(match, team1_score, team2_score):
+    # One prediction at a time, like the scoring rules before they were set-based
+    goal_diff = team1_score - team2_score
+    winner = 1 if team1_score > team2_score else 2 if team1_score < team2_score else 0
+    users = []
+
+    for index in range(len(match["id"])):
+        if match["team1_score"][index] == team1_score and match["team2_score"][index] == team2_score:
+            points = 4
+        elif match["predicted"][index] and match["goal_diff"][index] == goal_diff:
+            points = 3
+        elif match["winner"][index] == winner:
+            points = 2
+        else:
+            points = 0
+
+        users.append((-(match["total_points"][index] + points), -(match["correct_result"][index] + (points == 4)),
+                      -(match["correct_goal_diff"][index] + (points == 3)), -(match["correct_tendency"][index] + (points == 2)),
+                      match["id"][index]))
+
+    return sorted(users)
+
+
+def best_of(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, "tippspiel.db")
+    os.chdir(workdir)
+
+    try:
+        create_database(db_path, args.users)
+
+        import provisional
+        import scoring
+        from database import db
+        scoring.update_user_scores()
+
+        # The last match is live
+        match_id = db.execute("SELECT id FROM FCH_matches ORDER BY matchday DESC LIMIT 1")[0]["id"]
+        scoring.score_match(match_id, None, None)
+
+        start = time.perf_counter()
+        provisional.get_provisional_standings(match_id, 0, 0)
+        load = time.perf_counter() - start
+
+        match = provisional.load_match(match_id)
+        python_lists = {name: column.tolist() if hasattr(column, "tolist") else column for name, column in match.items()}
+
+        vectorized = best_of(lambda: provisional.get_provisional_standings(match_id, 2, 1, limit=20, user_id=1), args.repeat)
+        vectorized_all = best_of(lambda: provisional.get_provisional_standings(match_id, 2, 1), args.repeat)
+        numpy_only = best_of(lambda: provisional.rank(match["total_points"] + provisional.score(match, 2, 1), match["correct_result"],
+                                                      match["correct_goal_diff"], match["correct_tendency"], match["id"]), args.repeat)
+        python = best_of(lambda: get_provisional_standings_python(python_lists, 2, 1), args.repeat)
+
+        print(f"{args.users} users, one recompute per goal (best of {args.repeat})")
+        print(f"first call (loads the arrays):   {load * 1000:>8.1f} ms")
+        print(f"vectorized, top 20 + own entry:  {vectorized * 1000:>8.1f} ms")
+        print(f"vectorized, all users:           {vectorized_all * 1000:>8.1f} ms")
+        print(f"vectorized, scoring + ranks only:{numpy_only * 1000:>8.1f} ms")
+        print(f"plain Python:                    {python * 1000:>8.1f} ms")
+
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Memory and render time of the /rangliste page on a generated league (default 5k users × 34 matches).
+
+Compares the page with all users as it was first built (one dict per prediction, selectattr lookup in every
+cell) with the first page of the ranking that /rangliste sends now (get_rangliste_page_data, the rest is loaded
+from /api/rangliste while scrolling). Then times the whole /rangliste route: first view after a data change,
+view of another user and a revalidation with If-None-Match (304).
+
+Usage: python benchmarks/bench_rangliste.py [--users 5000] [--repeat 3]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from common import create_database
+
+# Row part of templates/rangliste.html before the grid
+template_before = """
+{% for user in users %}
+<tr{% if user.id == user_id %} class="table-primary"{% endif %}>
+    <td>{{ loop.index }}</td>
+    <td>{{ user.username }}</td>
+    {% for match in matchdata %}
+        {% set prediction = user.predictions|selectattr("matchday", "equalto", match.matchday)|list|first %}
+        <td>
+            {% if prediction %}
+                {% if match.matchIsFinished == 1 or (next_match and next_match.is_live and next_match.id == match.id) or user.id == user_id%}
+                    {{ prediction.team1_score }}:{{ prediction.team2_score }}
+                        {% if match.predictions_evaluated == 1 %}
+                            <sub>{{ prediction.points }}</sub>
+                        {% else %}
+                            <sub>?</sub>
+                        {% endif %}
+                {% else %}
+                    -:-
+                {% endif %}
+            {% else %}
+                -:-
+            {% endif %}
+        </td>
+    {% endfor %}
+    <td>{{ user.total_points }}</td>
+</tr>
+{% endfor %}
+"""
+
+# Row part of templates/rangliste.html now
+template_after = """
+{% from "rangliste_row.html" import rangliste_row %}
+{% for user in users %}
+    {{ rangliste_row(user, highlight=user.id == user_id) }}
+{% endfor %}
+"""
+
+
+def get_rangliste_data_before(db):
+    # get_rangliste_data before the grid
+    predictions = db.execute("""SELECT u.id, u.username, u.total_points, u.correct_result, u.correct_goal_diff, u.correct_tendency,
+                             s.matchday, s.match_id, s.team1_score, s.team2_score, s.points
+                             FROM users AS u
+                             LEFT JOIN (
+                                SELECT p.user_id, p.matchday, p.match_id, p.team1_score, p.team2_score, p.points
+                                FROM predictions AS p
+                                ORDER BY p.matchday ASC
+                             ) AS s
+                             ON u.id = s.user_id
+                             ORDER BY u.total_points DESC, u.correct_result DESC, u.correct_goal_diff DESC, u. correct_tendency
+                    """)
+
+    user_predictions = {}
+    for prediction in predictions:
+        id, username, total_points, correct_result, correct_goal_diff, correct_tendency, matchday, match_id, team1_score, team2_score, points = prediction.values()
+        if id not in user_predictions:
+            user_predictions[id] = {'username': username, 'id': id, 'total_points': total_points, 'correct_result': correct_result,
+                                    'correct_goal_diff': correct_goal_diff, 'correct_tendency': correct_tendency, 'predictions': []}
+
+        user_predictions[id]['predictions'].append({
+            'matchday': matchday,
+            'match_id': match_id,
+            'team1_score': team1_score,
+            'team2_score': team2_score,
+            'points': points})
+
+    return list(user_predictions.values())
+
+
+def measure(build, render, repeat):
+    """ Best build and render time in seconds, and peak memory in MB of one build + render """
+    build_times, render_times = [], []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        data = build()
+        build_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        render(data)
+        render_times.append(time.perf_counter() - start)
+        del data
+
+    tracemalloc.start()
+    render(build())
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return min(build_times), min(render_times), peak / 1024 / 1024
+
+
+def time_request(client, headers=None):
+    start = time.perf_counter()
+    response = client.get("/rangliste", headers=headers)
+    return time.perf_counter() - start, response
+
+
+def measure_route(app, repeat):
+    """ Best time in seconds of a first view, a view of another user and a 304 """
+    import helpers
+    cold, warm, revalidate = [], [], []
+
+    for _ in range(repeat):
+        # New data version, as after a sync
+        helpers.bump_data_version("ranking")
+
+        with app.test_client() as client:
+            with client.session_transaction() as session:
+                session["user_id"] = 1
+
+            elapsed, response = time_request(client)
+            cold.append(elapsed)
+
+            elapsed, _ = time_request(client, {"If-None-Match": response.headers["ETag"]})
+            revalidate.append(elapsed)
+
+        with app.test_client() as client:
+            with client.session_transaction() as session:
+                session["user_id"] = 2
+
+            warm.append(time_request(client)[0])
+
+    return min(cold), min(warm), min(revalidate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, "tippspiel.db")
+    os.chdir(workdir)
+    os.environ["TIPPSPIEL_SYNC"] = "0"
+
+    try:
+        create_database(db_path, args.users)
+
+        from app import app
+        import helpers
+        import scoring
+
+        scoring.update_user_scores()
+        matches = helpers.get_local_FCH_matches()
+        user_id = 1
+
+        with app.test_request_context():
+            before_template = app.jinja_env.from_string(template_before)
+            after_template = app.jinja_env.from_string(template_after)
+
+            before = measure(lambda: get_rangliste_data_before(helpers.db),
+                             lambda users: before_template.render(users=users, matchdata=matches, user_id=user_id, next_match=None),
+                             args.repeat)
+            after = measure(lambda: helpers.get_rangliste_page_data(matches, user_id)[0],
+                            lambda users: after_template.render(users=users, matchdata=matches, user_id=user_id),
+                            args.repeat)
+
+        print(f"{args.users} users × {len(matches)} matches, best of {args.repeat}")
+        print(f"{'':<12}{'data':>12}{'render':>12}{'peak memory':>16}")
+        for name, (build_time, render_time, peak) in [("all users", before), ("first page", after)]:
+            print(f"{name:<12}{build_time * 1000:>9.0f} ms{render_time * 1000:>9.0f} ms{peak:>13.1f} MB")
+
+        cold, warm, revalidate = measure_route(app, args.repeat)
+        print()
+        print(f"GET /rangliste, first view:  {cold * 1000:>9.1f} ms")
+        print(f"GET /rangliste, other user:  {warm * 1000:>9.1f} ms")
+        print(f"GET /rangliste, 304:         {revalidate * 1000:>9.1f} ms")
+
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
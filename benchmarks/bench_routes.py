@@ -0,0 +1,326 @@
+"""
+End-to-end benchmark suite: the routes of the app and the heavy helpers, on generated databases of increasing size.
+
+For every size, generate_data.py fills a copy of tippspiel.db with users that predicted every match. The second half
+of the season is moved into the future (so /tippen has open matches) and OpenLigaDB is replaced by the fake server
+(tools/fake_openliga.py). Then it measures:
+- update_user_scores for the first half of the season (3 samples per run, all points are taken back before each)
+- a page of the ranking (get_rangliste_page_data) from a random position and one scheduler sync that finds nothing new
+- GET /, /tippen, /rangliste, /api/rangliste (a page from the middle of the ranking) and /tabelle, POST /tippen and
+  POST /login through Flask's test client, without If-None-Match (server-side caches are warm, every page is built and sent)
+
+Every measurement starts with --warmup untimed calls and is then run --repeat times with --requests samples each. It
+gets p50/p95/mean latency and the throughput (with --threads clients at once), each the median over the runs, so that
+one noisy run doesn't decide. --output stores the results as JSON. --baseline compares with an earlier file: the suite
+fails (exit code 1) if a p50 (--metric) got slower by more than --threshold percent and by more than --min-delta ms
+(a few tenths of a millisecond are noise on the fast routes, whatever the percentage).
+
+Usage: python benchmarks/bench_routes.py [--sizes 1000,10000] [--requests 50] [--repeat 3] [--warmup 5] [--threads 1]
+                                         [--output results.json] [--baseline old.json] [--threshold 20] [--min-delta 1]
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from common import repo_root
+from fake_openliga import FakeOpenLiga, build_fixture
+
+# Matchdays after this one are moved into the future
+open_from_matchday = 18
+
+
+def percentile(values, share):
+    """ Nearest-rank percentile, share in percent """
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(share / 100 * len(ordered)) - 1)]
+
+
+def summarize(latencies, wall):
+    return {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "throughput_per_s": round(len(latencies) / wall, 2),
+        "samples": len(latencies),
+    }
+
+
+def measure(function, args, count=None, warmup=None, prepare=None):
+    """
+    Run function(index) (it returns its own latency in seconds) warmup times (default args.warmup) untimed, then
+    args.repeat runs of count calls (default args.requests), spread over args.threads. prepare() runs untimed before every
+    call, the calls then go one after the other. Every figure is the median over the runs
+    """
+    count = args.requests if count is None else count
+    warmup = args.warmup if warmup is None else warmup
+    threads = 1 if prepare else args.threads
+
+    def call(index):
+        if prepare:
+            prepare()
+        return function(index)
+
+    for index in range(warmup):
+        call(index)
+
+    runs = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+
+        if threads == 1:
+            latencies = [call(index) for index in range(count)]
+        else:
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                latencies = list(executor.map(call, range(count)))
+
+        # The throughput leaves out prepare()
+        runs.append(summarize(latencies, sum(latencies) if prepare else time.perf_counter() - start))
+
+    medians = {name: round(statistics.median(run[name] for run in runs), 3)
+               for name in ("p50_ms", "p95_ms", "mean_ms", "throughput_per_s")}
+    return dict(medians, samples=count, runs=args.repeat)
+
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def open_second_half(db):
+    """ Move the matches from open_from_matchday on into the future (one a week), unplayed """
+    now = int(time.time())
+    matches = db.execute("SELECT id, matchday FROM FCH_matches WHERE matchday >= ?", open_from_matchday)
+
+    with db.transaction():
+        for match in matches:
+            kickoff = now + (match["matchday"] - open_from_matchday + 1) * 7 * 24 * 60 * 60
+            db.execute("""
+                       UPDATE FCH_matches SET matchIsFinished = 0, team1_score = NULL, team2_score = NULL,
+                       predictions_evaluated = 0, evaluation_Date = NULL, matchDateTime = ?, kickoff = ?,
+                       lastUpdateDateTime = ?, last_update = ?
+                       WHERE id = ?
+                       """, datetime.fromtimestamp(kickoff).isoformat(), kickoff,
+                       datetime.fromtimestamp(now).isoformat(timespec="milliseconds"), now, match["id"])
+
+
+def reset_scores(db):
+    """ Take all points back, as right after generate_data (so that update_user_scores can be measured again) """
+    from scoring import update_standings
+
+    with db.transaction():
+        db.execute("UPDATE predictions SET points = NULL")
+        db.execute("UPDATE users SET total_points = 0, correct_result = 0, correct_goal_diff = 0, correct_tendency = 0")
+        db.execute("DELETE FROM standings_history")
+        db.execute("UPDATE FCH_matches SET predictions_evaluated = 0, evaluation_Date = NULL")
+        update_standings()
+
+
+def make_request(app, method, path, status, user_ids, data=None):
+    """ function(index) for measure(): one request as a random user (expecting status), with a test client per thread """
+    local = threading.local()
+
+    def request(index):
+        if not hasattr(local, "client"):
+            local.client = app.test_client()
+
+        client = local.client
+        user_id = random.choice(user_ids)
+
+        with client.session_transaction() as session:
+            session["user_id"] = user_id
+
+        form = data(user_id) if data else None
+
+        start = time.perf_counter()
+        response = client.open(path, method=method, data=form)
+        elapsed = time.perf_counter() - start
+
+        if response.status_code != status:
+            raise RuntimeError(f"{method} {path}: {response.status_code}")
+
+        return elapsed
+
+    return request
+
+
+def run_size(users, args, server_holder):
+    """ All measurements for one database size, as {name: summary} """
+    import generate_data
+    import helpers
+    import openliga
+    import scheduler
+    import scoring
+    import title_odds
+    from app import app
+    from database import db
+
+    generate_data.generate(users, replace=True)
+    open_second_half(db)
+
+    # A fake OpenLigaDB that agrees with the database, so the sync finds nothing new
+    if server_holder:
+        server_holder.pop().stop()
+    server = FakeOpenLiga(build_fixture("tippspiel.db")).start()
+    server_holder.append(server)
+    openliga.base_url = server.url
+    openliga.reset()
+
+    results = {}
+
+    # Few samples per run (each scores the whole first half of the season), the points are taken back before each
+    results["update_user_scores"] = measure(lambda index: timed(scoring.update_user_scores), args, count=3, warmup=1,
+                                            prepare=lambda: reset_scores(db))
+
+    matches = helpers.get_local_FCH_matches()
+    user_ids = [row["id"] for row in db.execute("SELECT id FROM users")]
+    cursors = [helpers.get_rangliste_cursor(user) for user in db.execute("""
+               SELECT id, total_points, correct_result, correct_goal_diff, correct_tendency FROM users
+               ORDER BY total_points DESC, correct_result DESC, correct_goal_diff DESC, correct_tendency DESC, id
+               """)]
+
+    def rangliste_page():
+        after = helpers.parse_rangliste_cursor(random.choice(cursors))
+        helpers.get_rangliste_page_data(matches, random.choice(user_ids), None, after)
+
+    results["get_rangliste_page_data"] = measure(lambda index: timed(rangliste_page), args)
+
+    # The title odds have their own benchmark, the first sync also compares the whole season
+    title_odds._computed_versions = helpers.get_data_versions()
+    title_odds._computed_kicked_off = title_odds.get_kicked_off_count()
+    scheduler.run_sync()
+    results["sync"] = measure(lambda index: timed(scheduler.run_sync), args)
+
+    open_matches = [match for match in matches if match["matchday"] >= open_from_matchday]
+
+    def predictions(user_id):
+        return {f"team{team}Score_{match['id']}": str(random.randint(0, 3)) for match in open_matches for team in (1, 2)}
+
+    def login(user_id):
+        return {"username": f"user{user_id}", "password": generate_data.default_password}
+
+    routes = [
+        ("GET /", "GET", "/", 200, None),
+        ("GET /tippen", "GET", "/tippen", 200, None),
+        ("GET /rangliste", "GET", "/rangliste", 200, None),
+        ("GET /api/rangliste", "GET", f"/api/rangliste?after={cursors[len(cursors) // 2]}", 200, None),
+        ("GET /tabelle", "GET", "/tabelle", 200, None),
+        ("POST /tippen", "POST", "/tippen", 200, predictions),
+        ("POST /login", "POST", "/login", 302, login),     # Redirects to / if the password is right
+    ]
+
+    for name, method, path, status, data in routes:
+        results[name] = measure(make_request(app, method, path, status, user_ids, data), args)
+
+    return results
+
+
+def compare(results, baseline, metric, threshold, min_delta):
+    """
+    Print the change of every measurement that is in both, return the regressions: slower by more than threshold percent
+    and by more than min_delta ms
+    """
+    regressions = []
+    print()
+    print(f"{'compared with baseline (' + metric + ')':<40}{'before':>12}{'now':>12}{'change':>10}")
+
+    for size, measurements in results.items():
+        for name, summary in measurements.items():
+            before = baseline.get(size, {}).get(name)
+
+            if not before or not before[metric]:
+                continue
+
+            delta = summary[metric] - before[metric]
+            change = delta / before[metric] * 100
+            regressed = change > threshold and delta > min_delta
+            print(f"{size + ' users, ' + name:<40}{before[metric]:>9.1f} ms{summary[metric]:>9.1f} ms{change:>+9.0f}%"
+                  + ("  REGRESSION" if regressed else ""))
+
+            if regressed:
+                regressions.append((size, name, change))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000", help="comma-separated numbers of users")
+    parser.add_argument("--requests", type=int, default=50, help="samples per run of a measurement")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement (the figures are the median of the runs)")
+    parser.add_argument("--warmup", type=int, default=5, help="untimed calls before a measurement")
+    parser.add_argument("--threads", type=int, default=1, help="clients sending requests at the same time")
+    parser.add_argument("--output", help="store the results as JSON")
+    parser.add_argument("--baseline", help="JSON of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=20, help="allowed slowdown in percent")
+    parser.add_argument("--min-delta", type=float, default=1.0, help="allowed slowdown in ms, whatever the percentage")
+    parser.add_argument("--metric", default="p50_ms", choices=["p50_ms", "p95_ms", "mean_ms"])
+    args = parser.parse_args()
+
+    # The baseline is read before the working directory changes
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+        # Latencies with several clients at once are not comparable with those of one client
+        if (baseline["requests"], baseline.get("repeat", 1), baseline["threads"]) != (args.requests, args.repeat, args.threads):
+            print(f"Note: the baseline was measured with {baseline.get('repeat', 1)} x {baseline['requests']} samples "
+                  f"and {baseline['threads']} thread(s)\n")
+
+    output = os.path.abspath(args.output) if args.output else None
+
+    # Work on a copy of the database, the app opens tippspiel.db relative to the working directory
+    workdir = tempfile.mkdtemp()
+    shutil.copy(os.path.join(repo_root, "tippspiel.db"), workdir)
+    os.chdir(workdir)
+    os.environ["TIPPSPIEL_SYNC"] = "0"
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = {}
+    server_holder = []
+
+    try:
+        for users in (int(size) for size in args.sizes.split(",")):
+            results[str(users)] = run_size(users, args, server_holder)
+
+            print(f"{users} users, {args.repeat} x {args.requests} samples (median of the runs), {args.threads} thread(s)")
+            print(f"{'':<24}{'p50':>10}{'p95':>10}{'mean':>10}{'per s':>10}")
+            for name, summary in results[str(users)].items():
+                print(f"{name:<24}{summary['p50_ms']:>7.1f} ms{summary['p95_ms']:>7.1f} ms{summary['mean_ms']:>7.1f} ms"
+                      f"{summary['throughput_per_s']:>10.1f}")
+            print()
+
+    finally:
+        for server in server_holder:
+            server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump({"created": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+                       "requests": args.requests, "repeat": args.repeat, "warmup": args.warmup, "threads": args.threads,
+                       "results": results}, f, indent=1)
+
+    if baseline:
+        regressions = compare(results, baseline["results"], args.metric, args.threshold, args.min_delta)
+
+        if regressions:
+            print(f"\n{len(regressions)} measurement(s) slower than {args.threshold:g}% and {args.min_delta:g} ms over the baseline")
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
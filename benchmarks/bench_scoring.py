@@ -0,0 +1,128 @@
+"""
+Scoring cost on a generated league (default 10k users × 34 matches, every user predicts every match).
+
+Measures evaluating one newly finished match (the usual case during the season) with the previous
+update_user_scores (one UPDATE per prediction plus four full-table recomputes of the users table)
+and with the set-based scoring.update_user_scores.
+
+Usage: python benchmarks/bench_scoring.py [--users 10000] [--skip-before]
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from common import create_database
+
+
+def evaluate_all_but_last(db_path):
+    # State after matchday 33: everything evaluated except the last match
+    import scoring
+
+    connection = sqlite3.connect(db_path)
+    last_match = connection.execute("SELECT id FROM FCH_matches ORDER BY matchday DESC LIMIT 1").fetchone()[0]
+    connection.execute("UPDATE FCH_matches SET matchIsFinished = 0 WHERE id = ?", (last_match,))
+    connection.commit()
+
+    scoring.update_user_scores()
+
+    connection.execute("UPDATE FCH_matches SET matchIsFinished = 1 WHERE id = ?", (last_match,))
+    connection.commit()
+    connection.close()
+
+
+def update_user_scores_before(db):
+    # update_user_scores before the set-based scoring engine
+    matches = db.execute("SELECT * FROM FCH_matches")
+    db.execute("SELECT * FROM predictions")
+
+    for match in matches:
+        if match["matchIsFinished"] == 1 and match["predictions_evaluated"] == 0:
+            team1_score = match["team1_score"]
+            team2_score = match["team2_score"]
+            goal_diff = team1_score - team2_score
+            winner = 1 if team1_score > team2_score else 2 if team1_score < team2_score else 0
+
+            for prediction in db.execute("SELECT * FROM predictions WHERE match_id = ?", match["id"]):
+                if team1_score == prediction["team1_score"] and team2_score == prediction["team2_score"]:
+                    awarded_points = 4
+                elif goal_diff == prediction["goal_diff"]:
+                    awarded_points = 3
+                elif winner == prediction["winner"]:
+                    awarded_points = 2
+                else:
+                    awarded_points = 0
+
+                db.execute("UPDATE predictions SET points = ? WHERE id = ?", awarded_points, prediction["id"])
+
+            db.execute("UPDATE FCH_matches SET predictions_evaluated = 1 WHERE id = ?", match["id"])
+
+    for column, points in [("total_points", None), ("correct_result", 4), ("correct_goal_diff", 3), ("correct_tendency", 2)]:
+        value = "SUM(points)" if points is None else f"COUNT(*) FILTER (WHERE points = {points})"
+        db.execute(f"""
+                   UPDATE users SET {column} = (SELECT {value} FROM predictions WHERE user_id = users.id)
+                   WHERE id IN (SELECT DISTINCT user_id FROM predictions)
+                   """)
+
+
+def read_totals(db_path):
+    connection = sqlite3.connect(db_path)
+    totals = connection.execute("""
+                                SELECT id, total_points, correct_result, correct_goal_diff, correct_tendency
+                                FROM users ORDER BY id
+                                """).fetchall()
+    connection.close()
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--skip-before", action="store_true", help="don't run the (slow) previous implementation")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, "tippspiel.db")
+    os.chdir(workdir)
+
+    try:
+        start = time.perf_counter()
+        create_database(db_path, args.users)
+        print(f"Generated {args.users} users × 34 matches in {time.perf_counter() - start:.1f} s")
+
+        import helpers
+        import scoring
+
+        evaluate_all_but_last(db_path)
+
+        # Copy the file only while no connection is open (the WAL is written back on close)
+        helpers.db.close()
+        shutil.copy(db_path, db_path + ".before")
+
+        # Newly finished last match, set-based
+        start = time.perf_counter()
+        scoring.update_user_scores()
+        after = time.perf_counter() - start
+        print(f"one new match, set-based:         {after * 1000:>10.1f} ms")
+        totals_after = read_totals(db_path)
+
+        if not args.skip_before:
+            helpers.db.close()
+            shutil.copy(db_path + ".before", db_path)
+
+            start = time.perf_counter()
+            update_user_scores_before(helpers.db)
+            before = time.perf_counter() - start
+            print(f"one new match, before:            {before * 1000:>10.1f} ms ({before / after:.0f}x slower)")
+
+            if read_totals(db_path) != totals_after:
+                print("WARNING: totals differ between the two implementations")
+
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
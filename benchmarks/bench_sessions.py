@@ -0,0 +1,112 @@
+"""
+Per-request session overhead of the sessions table (sessions.py) compared with Flask-Session's filesystem
+backend that the app used before (needs the flask-session package, skipped otherwise).
+
+Every backend first gets --sessions logged in sessions, then one client does --requests requests that
+only read the session and --requests requests that change it. The session is loaded for every request, also
+for a route that does not use it ("untouched").
+
+Usage: python benchmarks/bench_sessions.py [--sessions 2000] [--requests 2000]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from flask import Flask, session
+
+from common import repo_root
+
+
+def make_app(backend, workdir):
+    app = Flask(__name__)
+    app.config["SESSION_PERMANENT"] = False
+
+    if backend == "filesystem":
+        from flask_session import Session
+        app.config["SESSION_TYPE"] = "filesystem"
+        app.config["SESSION_FILE_DIR"] = os.path.join(workdir, "flask_session")
+        Session(app)
+    else:
+        import sessions
+        sessions.init_app(app)
+
+    @app.teardown_appcontext
+    def release_connection(exception):
+        from database import db
+        db.release()
+
+    @app.route("/login/<int:user_id>")
+    def login(user_id):
+        session["user_id"] = user_id
+        return ""
+
+    @app.route("/read")
+    def read():
+        return str(session.get("user_id"))
+
+    @app.route("/write")
+    def write():
+        session["counter"] = session.get("counter", 0) + 1
+        return ""
+
+    @app.route("/none")
+    def none():
+        return ""
+
+    return app
+
+
+def time_requests(client, url, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        client.get(url)
+    return (time.perf_counter() - start) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    shutil.copy(os.path.join(repo_root, "tippspiel.db"), workdir)
+    os.chdir(workdir)
+
+    backends = ["sqlite"]
+    try:
+        import flask_session
+        backends.insert(0, "filesystem")
+    except ImportError:
+        print("flask-session is not installed, skipping the filesystem backend")
+
+    try:
+        import migrations
+        migrations.migrate()
+
+        print(f"{args.sessions} stored sessions, mean of {args.requests} requests")
+        print(f"{'':<12}{'untouched':>14}{'read':>14}{'write':>14}")
+
+        for backend in backends:
+            app = make_app(backend, workdir)
+
+            for user_id in range(args.sessions):
+                app.test_client().get(f"/login/{user_id}")
+
+            client = app.test_client()
+            client.get("/login/1")
+
+            baseline = time_requests(client, "/none", args.requests)
+            read = time_requests(client, "/read", args.requests)
+            write = time_requests(client, "/write", args.requests)
+
+            print(f"{backend:<12}{baseline * 1e6:>11.0f} µs{read * 1e6:>11.0f} µs{write * 1e6:>11.0f} µs")
+
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Wall-clock time of update_FCH_matches_db against a local fake OpenLigaDB server.
+
+Compares the previous behaviour (one request per unfinished match, one after another, every row
+autocommitted) with the bulk season fetch, the concurrent per-match fetch and the automatic choice.
+
+Usage: python benchmarks/bench_sync.py [--latency 0.05] [--unfinished 34] [--repeat 3]
+"""
+import argparse
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from common import repo_root
+from fake_openliga import FakeOpenLiga, build_fixture
+
+
+def reset_matches(db_path, unfinished):
+    # Pretend the last `unfinished` matches of the season have not been played yet locally
+    connection = sqlite3.connect(db_path)
+    connection.execute("""
+                       UPDATE FCH_matches SET matchIsFinished = 0, team1_score = NULL, team2_score = NULL,
+                       lastUpdateDateTime = '2023-01-01T00:00:00.000', last_update = CAST(strftime('%s', '2023-01-01T00:00:00', 'utc') AS INTEGER)
+                       WHERE matchday > (SELECT MAX(matchday) FROM FCH_matches) - ?
+                       """, (unfinished,))
+    connection.commit()
+    connection.close()
+
+
+def sync_sequential(helpers):
+    # update_FCH_matches_db before the sync modes existed
+    for match in helpers.db.execute("SELECT * FROM FCH_matches WHERE matchIsFinished = 0"):
+        matchdata = helpers.get_matchdata_openliga(match["id"])
+        helpers.update_match_in_db(matchdata)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds the fake server needs per response")
+    parser.add_argument("--unfinished", type=int, default=34, help="number of unfinished matches in the local db")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # Work on a copy of the database, helpers.py opens tippspiel.db relative to the working directory
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, "tippspiel.db")
+    shutil.copy(os.path.join(repo_root, "tippspiel.db"), db_path)
+    os.chdir(workdir)
+
+    import helpers
+    import migrations
+    import openliga
+
+    migrations.migrate()
+
+    # urllib3 logs every request
+    logging.getLogger("urllib3").setLevel(logging.WARNING)
+
+    server = FakeOpenLiga(build_fixture(db_path), latency=args.latency).start()
+    openliga.base_url = server.url
+
+    modes = {
+        "sequential (before)": lambda: sync_sequential(helpers),
+        "concurrent": lambda: helpers.update_FCH_matches_db("concurrent"),
+        "bulk": lambda: helpers.update_FCH_matches_db("bulk"),
+        "auto": lambda: helpers.update_FCH_matches_db("auto"),
+    }
+
+    print(f"{args.unfinished} unfinished matches, {args.latency * 1000:.0f} ms server latency, best of {args.repeat}")
+
+    try:
+        for name, sync in modes.items():
+            timings = []
+            requests_before = server.requests
+
+            for _ in range(args.repeat):
+                reset_matches(db_path, args.unfinished)
+                openliga.reset()
+
+                start = time.perf_counter()
+                sync()
+                timings.append(time.perf_counter() - start)
+
+            requests_per_run = (server.requests - requests_before) / args.repeat
+            print(f"{name:<22}{min(timings) * 1000:>10.1f} ms{requests_per_run:>8.0f} requests")
+
+    finally:
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
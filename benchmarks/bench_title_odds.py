@@ -0,0 +1,65 @@
+"""
+Title odds (title_odds.py) on a generated league (default 2000 users) with the last --open matches still to play.
+
+Times loading the season, the simulation in this process and the simulation split over the process pool.
+
+Usage: python benchmarks/bench_title_odds.py [--users 2000] [--open 10] [--iterations 20000] [--workers <cpus>]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from common import create_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--open", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, "tippspiel.db")
+    os.chdir(workdir)
+
+    try:
+        create_database(db_path, args.users)
+
+        import scoring
+        import title_odds
+        from database import db
+
+        # The last matches have not been played yet
+        db.execute("""
+                   UPDATE FCH_matches SET matchIsFinished = 0, team1_score = NULL, team2_score = NULL
+                   WHERE matchday > (SELECT MAX(matchday) FROM FCH_matches) - ?
+                   """, args.open)
+        scoring.update_user_scores()
+
+        start = time.perf_counter()
+        season = title_odds.load_season()
+        load = time.perf_counter() - start
+
+        start = time.perf_counter()
+        title_odds.simulate(season, args.iterations, 1)
+        single = time.perf_counter() - start
+
+        start = time.perf_counter()
+        title_odds.compute_title_odds(args.iterations, args.workers, seed=1)
+        pool = time.perf_counter() - start
+
+        print(f"{args.users} users, {args.open} matches to play, {args.iterations} simulated seasons")
+        print(f"load season:                   {load * 1000:>8.1f} ms")
+        print(f"simulate, one process:         {single * 1000:>8.1f} ms")
+        print(f"load + simulate, {args.workers:>2} workers:   {pool * 1000:>8.1f} ms")
+
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
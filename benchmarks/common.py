@@ -0,0 +1,46 @@
+""" Shared setup for the benchmarks """
+import os
+import random
+import shutil
+import sqlite3
+import sys
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_root)
+sys.path.insert(0, os.path.join(repo_root, "tools"))
+
+
+def create_database(db_path, users, seed=1846):
+    """
+    Copy of tippspiel.db with `users` users that predicted every match, all matches finished but not evaluated.
+    db_path has to be tippspiel.db in the working directory, because that is where the app opens it
+    """
+    shutil.copy(os.path.join(repo_root, "tippspiel.db"), db_path)
+
+    connection = sqlite3.connect(db_path)
+    connection.execute("DELETE FROM predictions")
+    connection.execute("DELETE FROM users")
+    connection.executemany("INSERT INTO users (id, username, hash) VALUES (?, ?, '')",
+                           ((user_id, f"user{user_id}") for user_id in range(1, users + 1)))
+
+    matches = connection.execute("SELECT id, matchday FROM FCH_matches").fetchall()
+    rng = random.Random(seed)
+
+    def predictions():
+        for user_id in range(1, users + 1):
+            for match_id, matchday in matches:
+                team1_score, team2_score = rng.randint(0, 3), rng.randint(0, 3)
+                winner = 1 if team1_score > team2_score else 2 if team1_score < team2_score else 0
+                yield user_id, matchday, match_id, team1_score, team2_score, team1_score - team2_score, winner
+
+    connection.executemany("""
+                           INSERT INTO predictions (user_id, matchday, match_id, team1_score, team2_score, goal_diff, winner)
+                           VALUES (?, ?, ?, ?, ?, ?, ?)
+                           """, predictions())
+    connection.execute("UPDATE FCH_matches SET predictions_evaluated = 0")
+    connection.commit()
+    connection.close()
+
+    # Same schema and indexes as the app
+    import migrations
+    migrations.migrate()
@@ -0,0 +1,54 @@
+import threading
+
+# Pages (or parts of them) that are expensive to build but only change when the data changes.
+# Every entry remembers the data version it was built from (see get_data_versions in helpers.py)
+# and is rebuilt as soon as the version moved on. Sync, scoring and saved predictions count the versions up.
+max_entries = 1024      # Mostly small per-user entries, the ranking pages are only a few
+
+_entries = {}       # key: (version, value)
+_building = {}      # key: [lock held while the value is built, number of threads using the lock]
+_lock = threading.Lock()        # Only for the two dicts, never held while building
+
+
+def get_cached(key, version, build):
+    """ Value stored for key if it was built from this version, otherwise build() it and store it """
+    entry = _entries.get(key)
+
+    if entry and entry[0] == version:
+        return entry[1]
+
+    # Only one thread builds a key, the others that miss on it wait for its result. Other keys are built at the same time
+    with _lock:
+        building = _building.setdefault(key, [threading.Lock(), 0])
+        building[1] += 1
+
+    try:
+        with building[0]:
+            entry = _entries.get(key)
+
+            if entry and entry[0] == version:
+                return entry[1]
+
+            value = build()
+
+            with _lock:
+                # Keys contain e. g. the user or the live match, drop the oldest ones instead of growing forever
+                _entries.pop(key, None)
+                while len(_entries) >= max_entries:
+                    _entries.pop(next(iter(_entries)))
+
+                _entries[key] = (version, value)
+
+    finally:
+        with _lock:
+            building[1] -= 1
+
+            if not building[1]:
+                del _building[key]
+
+    return value
+
+
+def clear():
+    with _lock:
+        _entries.clear()
@@ -0,0 +1,176 @@
+import contextlib
+import re
+import sqlite3
+import threading
+import time
+
+# Path of the database file (relative to the working directory, like before)
+database_path = "tippspiel.db"
+
+# Settings for every connection
+pragmas = {
+    "journal_mode": "WAL",              # Readers keep reading while the background sync writes
+    "synchronous": "NORMAL",            # Safe with WAL, a power cut can only lose the last commits
+    "cache_size": -32000,               # Page cache per connection in KiB (negative value = KiB, not pages)
+    "mmap_size": 256 * 1024 * 1024,     # Read the file through memory mapping instead of read() calls
+    "temp_store": "MEMORY",             # Sorting and temporary tables in memory
+    "busy_timeout": 5000,               # Wait for a running write instead of failing with "database is locked"
+}
+
+# Prepared statements kept per connection (the app has fewer distinct queries than that)
+cached_statements = 256
+
+# Connections kept open for the next request
+max_idle_connections = 8
+
+
+class Database:
+    """
+    Shared access to the SQLite database, used by app.py, helpers.py and the background sync.
+
+    Every thread works on its own connection (taken from a pool of idle connections), so a transaction
+    belongs to the thread that started it. execute() works like cs50's SQL.execute: a list of dicts for
+    queries, the new id for INSERT and the number of changed rows for UPDATE / DELETE.
+    Every thread also counts its statements and the time spent in them (get_query_stats), e. g. per request.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        # Autocommit mode (isolation_level None): transactions only where transaction() is used.
+        # check_same_thread is off, because a released connection is reused by the next thread
+        connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, cached_statements=cached_statements)
+
+        for name, value in pragmas.items():
+            connection.execute(f"PRAGMA {name} = {value}")
+
+        return connection
+
+    def connection(self):
+        """ Connection of the current thread, taken from the pool (or opened) on first use """
+        connection = getattr(self._local, "connection", None)
+
+        if connection is None:
+            with self._lock:
+                connection = self._idle.pop() if self._idle else None
+
+            if connection is None:
+                connection = self._connect()
+
+            self._local.connection = connection
+
+        return connection
+
+    def release(self):
+        """ Give the connection of the current thread back to the pool, e. g. at the end of a request """
+        connection = getattr(self._local, "connection", None)
+
+        if connection is None:
+            return
+
+        self._local.connection = None
+
+        # Never hand over a transaction someone forgot to finish
+        if connection.in_transaction:
+            connection.rollback()
+
+        with self._lock:
+            if len(self._idle) < max_idle_connections:
+                self._idle.append(connection)
+                return
+
+        connection.close()
+
+    def close(self):
+        """ Close the connection of the current thread and all idle ones, e. g. before copying the database file """
+        self.release()
+
+        with self._lock:
+            idle, self._idle = self._idle, []
+
+        # The last connection to close writes the WAL back into the database file
+        for connection in idle:
+            connection.close()
+
+    def get_query_stats(self):
+        """ (number of statements, seconds spent in them) of the current thread since reset_query_stats() """
+        return getattr(self._local, "queries", 0), getattr(self._local, "query_seconds", 0.0)
+
+    def reset_query_stats(self):
+        self._local.queries = 0
+        self._local.query_seconds = 0.0
+
+    def _count_query(self, start):
+        self._local.queries = getattr(self._local, "queries", 0) + 1
+        self._local.query_seconds = getattr(self._local, "query_seconds", 0.0) + time.perf_counter() - start
+
+    def execute(self, sql, *args):
+        start = time.perf_counter()
+
+        try:
+            return self._execute(sql, args)
+        finally:
+            self._count_query(start)
+
+    def _execute(self, sql, args):
+        cursor = self.connection().execute(sql, args)
+
+        # Queries (also INSERT ... RETURNING) return rows
+        if cursor.description is not None:
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor]
+
+        command = get_command(sql)
+
+        if command in ("INSERT", "REPLACE"):
+            return cursor.lastrowid
+
+        if command in ("UPDATE", "DELETE"):
+            return cursor.rowcount
+
+        return True
+
+    def executemany(self, sql, rows):
+        """ Run one statement for every tuple of arguments in rows. Returns the number of changed rows """
+        start = time.perf_counter()
+
+        try:
+            return self.connection().executemany(sql, rows).rowcount
+        finally:
+            self._count_query(start)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        with db.transaction(): ... commits at the end of the block and rolls back if it raises.
+        The write lock is taken at the start (BEGIN IMMEDIATE), so a transaction never fails halfway because
+        another one started writing first. Nested blocks are part of the outer transaction
+        """
+        connection = self.connection()
+
+        if connection.in_transaction:
+            yield
+            return
+
+        connection.execute("BEGIN IMMEDIATE")
+
+        try:
+            yield
+        except BaseException:
+            connection.rollback()
+            raise
+
+        connection.execute("COMMIT")
+
+
+def get_command(sql):
+    # First keyword of the statement, after leading comments
+    sql = re.sub(r"^(\s*--[^\n]*\n)*", "", sql)
+    return sql.split(None, 1)[0].upper() if sql.strip() else ""
+
+
+db = Database(database_path)
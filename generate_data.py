@@ -0,0 +1,131 @@
+import argparse
+import json
+import logging
+import time
+from werkzeug.security import generate_password_hash
+from database import db
+from helpers import bump_data_version
+from migrations import migrate
+from scoring import recompute_all
+
+logger = logging.getLogger(__name__)
+
+# Synthetic users and predictions for scaling tests, e. g. 100k users with a prediction for every match.
+# The predictions follow what people usually tip: few goals, 2:1 and 1:1 most often, the better placed team
+# (and the home team) more often as the winner. Users are written with executemany, the predictions of a batch
+# of users are drawn by SQLite itself (INSERT ... SELECT with random()): binding millions of rows from Python
+# took more than twice as long. One transaction per batch, so the memory stays the same for any number of users.
+
+batch_size = 10000          # Users per transaction
+default_password = "password"
+
+# How often a score is predicted, as (goals of the favourite, goals of the other team): weight
+score_weights = {
+    (2, 1): 24, (1, 1): 14, (2, 0): 12, (1, 0): 11, (3, 1): 9, (2, 2): 5, (3, 0): 4, (0, 0): 4,
+    (3, 2): 4, (4, 1): 3, (4, 0): 2, (3, 3): 1, (4, 2): 1, (5, 1): 1, (0, 1): 3, (1, 2): 2,
+}
+home_advantage = 0.08       # Added to the share of users that tip team1 as the favourite
+rank_influence = 0.35       # Share added at most for a team that is placed much better in the league table
+
+
+def get_score_draws():
+    """ score_weights as a JSON list with every score repeated by its weight, to draw from with random() % length """
+    return json.dumps([[favourite, other] for (favourite, other), weight in score_weights.items() for _ in range(weight)])
+
+
+def insert_predictions(first_user_id, last_user_id, coverage):
+    """ Predictions of the users first_user_id to last_user_id for every match (each with the chance coverage) """
+    teams = db.execute("""
+                       -- full scan: all teams of the league
+                       SELECT COUNT(*) AS count FROM teams
+                       """)[0]["count"]
+
+    # team1_favourite: per mille of the users that tip team1 as the favourite. The draws are made in a subquery with
+    # LIMIT, which SQLite does not merge into the outer query, so that every random() is evaluated once per row.
+    # Everybody predicted a day before kickoff
+    db.execute("""
+               -- full scan: every match of the season for a range of users
+               INSERT INTO predictions (user_id, matchday, match_id, team1_score, team2_score, goal_diff, winner, prediction_date)
+               WITH scores AS MATERIALIZED (
+                   SELECT key AS draw, value ->> 0 AS favourite, value ->> 1 AS other FROM json_each(?)
+               ),
+               matches AS MATERIALIZED (
+                   SELECT m.id, m.matchday, strftime('%Y-%m-%dT%H:%M:%S', m.kickoff - 86400, 'unixepoch', 'localtime') AS prediction_date,
+                   MIN(MAX(500 + ? + ? * (COALESCE(team2.rank, 0) - COALESCE(team1.rank, 0)), 100), 900) AS team1_favourite
+                   FROM FCH_matches AS m
+                   JOIN teams AS team1 ON team1.id = m.team1_id
+                   JOIN teams AS team2 ON team2.id = m.team2_id
+               )
+               SELECT user_id, matchday, match_id, team1_score, team2_score, team1_score - team2_score,
+               CASE WHEN team1_score > team2_score THEN 1 WHEN team1_score < team2_score THEN 2 ELSE 0 END, prediction_date
+               FROM (
+                   SELECT d.user_id, d.matchday, d.match_id, d.prediction_date,
+                   CASE WHEN d.favourite_draw < d.team1_favourite THEN s.favourite ELSE s.other END AS team1_score,
+                   CASE WHEN d.favourite_draw < d.team1_favourite THEN s.other ELSE s.favourite END AS team2_score
+                   FROM (
+                       SELECT u.id AS user_id, m.id AS match_id, m.matchday, m.prediction_date, m.team1_favourite,
+                       ABS(RANDOM()) % ? AS score_draw, ABS(RANDOM()) % 1000 AS favourite_draw
+                       FROM users AS u
+                       CROSS JOIN matches AS m
+                       WHERE u.id BETWEEN ? AND ? AND ABS(RANDOM()) % 1000 < ?
+                       LIMIT -1
+                   ) AS d
+                   JOIN scores AS s ON s.draw = d.score_draw
+               )
+               """,
+               get_score_draws(), home_advantage * 1000, rank_influence * 1000 / max(teams - 1, 1), sum(score_weights.values()),
+               first_user_id, last_user_id, round(coverage * 1000))
+
+
+def generate(users, password=default_password, coverage=1.0, replace=False):
+    """
+    Add users (named user<id>, all with the same password) and their predictions for every match.
+    replace deletes all users and predictions first. Afterwards everything is scored from scratch by recompute_all,
+    which also rebuilds standings_history (the sync would only add the new users to the latest matchday)
+    """
+    # One hash for everybody, hashing is slow on purpose
+    password_hash = generate_password_hash(password)
+
+    if replace:
+        with db.transaction():
+            # Everything that belongs to users
+            for statement in ("DELETE FROM predictions", "DELETE FROM standings", "DELETE FROM standings_history",
+                              "DELETE FROM title_odds", "DELETE FROM sessions", "DELETE FROM users"):
+                db.execute(statement)
+
+    first_id = db.execute("SELECT COALESCE(MAX(id), 0) + 1 AS id FROM users")[0]["id"]
+
+    for start in range(first_id, first_id + users, batch_size):
+        end = min(start + batch_size, first_id + users) - 1
+
+        with db.transaction():
+            db.executemany("INSERT INTO users (id, username, hash) VALUES (?, ?, ?)",
+                           ((user_id, f"user{user_id}", password_hash) for user_id in range(start, end + 1)))
+            insert_predictions(start, end, coverage)
+
+        logger.info("Generate: %d of %d users", end - first_id + 1, users)
+
+    # Points, totals, standings and the history of every matchday, for the old and the new users
+    recompute_all()
+    bump_data_version("predictions")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill the database with generated users and predictions for scaling tests. "
+                                                 "Run from the directory containing tippspiel.db")
+    parser.add_argument("--users", type=int, required=True)
+    parser.add_argument("--password", default=default_password, help="password of all generated users")
+    parser.add_argument("--coverage", type=float, default=1.0, help="share of matches each user predicted")
+    parser.add_argument("--replace", action="store_true", help="delete all users and predictions first")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    migrate()
+
+    start = time.perf_counter()
+    generate(args.users, args.password, args.coverage, args.replace)
+    print(f"Generated {args.users} users in {time.perf_counter() - start:.1f} s.")
+
+
+if __name__ == "__main__":
+    main()
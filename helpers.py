@@ -1,12 +1,19 @@
 from flask import redirect, render_template, session
-from functools import wraps
+from functools import lru_cache, wraps
 import requests
 import uuid
+import openliga
 import os
 from PIL import Image
 import json
-from datetime import datetime
-from cs50 import SQL
+import logging
+import time
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from database import db
+from cache import get_cached
+
+logger = logging.getLogger(__name__)
 
 # Prepare API requests
 league = "bl1"      # bl1 for 1. Bundesliga
@@ -15,10 +22,13 @@ season = "2023"     # 2023 for 2023/2024 season
 team = "1. FC Heidenheim 1846"
 team_id = 199
 
-# urls for openliga queries
-url_matchdata = f"https://api.openligadb.de/getmatchdata/{league}/{season}/{team}"
-url_table = f"https://api.openligadb.de/getbltable/{league}/{season}"
-url_teams = f"https://api.openligadb.de/getavailableteams/{league}/{season}"
+# User ids that may use the admin pages (comma-separated, e. g. TIPPSPIEL_ADMINS=1,7)
+admin_ids = {int(user_id) for user_id in os.environ.get("TIPPSPIEL_ADMINS", "").split(",") if user_id.strip()}
+
+# urls for openliga queries (relative to openliga.base_url)
+url_matchdata = f"/getmatchdata/{league}/{season}/{team}"
+url_table = f"/getbltable/{league}/{season}"
+url_teams = f"/getavailableteams/{league}/{season}"
 
 
 # Folder paths
@@ -26,14 +36,33 @@ local_folder_path = os.path.join(".", "static", league, season)
 img_folder =  os.path.join(local_folder_path, "team-logos")
 
 
-# Connect to the SQLite database
-db = SQL("sqlite:///tippspiel.db")
-
 # Control the update mechanism of the database concerning the openliga updates
 automatic_updates = False
 
+# From this many matches to check on, one request for the whole season is cheaper than one request per match
+bulk_sync_threshold = 3
+max_sync_workers = 8
+
+# Finished matches are checked for corrected results for this long after kickoff
+correction_window = timedelta(days=7)
+
+# A match that is not marked as finished counts as live for at most this long after kickoff
+max_live_duration = timedelta(hours=3)
+
+# Number of users shown around the own position on the home page
+around_me_size = 20
+
+# Users per page of the ranking (/rangliste loads the next page when scrolled to the end, /api/rangliste?limit= up to the maximum)
+rangliste_page_size = 50
+max_rangliste_page_size = 200
+
+# Users per matchday in /history/league (around the own rank, or ?limit= up to the maximum from a cursor on)
+history_page_size = 20
+max_history_page_size = 200
+
 def get_local_FCH_matches():
     FCH_matches_db = db.execute("""
+                            -- full scan: the whole season is shown
                             SELECT 
                             FCH_matches.*,
                             team1.teamName AS team1_name,
@@ -47,17 +76,47 @@ def get_local_FCH_matches():
                             JOIN 
                                 teams AS team1 ON FCH_matches.team1_id = team1.id
                             JOIN 
-                                teams AS team2 ON FCH_matches.team2_id = team2.id;
+                                teams AS team2 ON FCH_matches.team2_id = team2.id
+                            ORDER BY FCH_matches.matchday;
                             """)
     
     for match in FCH_matches_db:
-        match["matchDateTime"] = convert_iso_datetime_to_human_readable(match["matchDateTime"])
+        # kickoff (seconds since the epoch) is for comparisons, matchDateTime is for displaying
+        match["matchDateTime"] = format_timestamp(match["kickoff"])
 
     return FCH_matches_db
     
 
+def get_data_versions():
+    """ Current version of each kind of data (league_table, ranking, predictions, title_odds) as dict """
+    rows = db.execute("""
+                      -- full scan: one row per kind of data
+                      SELECT name, version FROM data_versions
+                      """)
+    return {row["name"]: row["version"] for row in rows}
+
+
+def bump_data_version(name):
+    # Call inside the transaction that changes the data, so that readers never see new data with an old version
+    db.execute("UPDATE data_versions SET version = version + 1 WHERE name = ?", name)
+
+
+def get_predictions_version(user_id):
+    """ Version of user_id's own predictions (counted up by bump_predictions_version) """
+    rows = db.execute("SELECT predictions_version FROM users WHERE id = ?", user_id)
+    return rows[0]["predictions_version"] if rows else 0
+
+
+def bump_predictions_version(user_id):
+    # Like bump_data_version, inside the transaction that saves the predictions
+    db.execute("UPDATE users SET predictions_version = predictions_version + 1 WHERE id = ?", user_id)
+
+
 def get_teams():
-    teams_db = db.execute("SELECT * FROM teams")
+    teams_db = db.execute("""
+                          -- full scan: all teams of the league
+                          SELECT * FROM teams
+                          """)
     return teams_db
 
 
@@ -77,6 +136,25 @@ def login_required(f):
     return decorated_function
 
 
+def is_admin():
+    """ True if the logged in user is one of admin_ids """
+    return session.get("user_id") in admin_ids
+
+
+def admin_required(f):
+    """ Decorate routes that only admins (TIPPSPIEL_ADMINS) may see """
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if session.get("user_id") is None:
+            return redirect("/login")
+        if not is_admin():
+            return apology("Nur für Admins", 403)
+        return f(*args, **kwargs)
+
+    return decorated_function
+
+
 def apology(message, code=400):
     """Render message as an apology to user."""
 
@@ -105,42 +183,72 @@ def apology(message, code=400):
 def make_image_filepath(team):
     img_file_name = team['shortName'] + os.path.splitext(team['teamIconUrl'])[1]
     img_file_path = os.path.join(img_folder, img_file_name)
-    print("bims im image filepathmaker")
+    logger.debug("Image path of %s: %s", team["shortName"], img_file_path)
 
     return img_file_path
 
 
 def get_openliga_json(url):
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-
-        return response.json()
+        # Pooled session with timeouts, retries and conditional requests (see openliga.py)
+        return openliga.get_json(url)
     
     except (KeyError, IndexError, requests.RequestException, ValueError):
         return None
     
 
-def get_league_table():
+def get_league_table(matchday=None):
+    """
+    The Bundesliga table (teams ordered by rank) and the time of its last change. rank_change is the number of places a
+    team moved up since the matchday before. With matchday: the table after that matchday, from league_table_history
+    """
+    if matchday is not None:
+        table = db.execute("""
+                           SELECT h.rank, h.points, h.goals, h.opponentGoals, h.goals - h.opponentGoals AS goalDiff,
+                           h.matches, h.won, h.draw, h.lost, t.teamName, t.shortName, t.teamIconPath,
+                           previous.rank - h.rank AS rank_change
+                           FROM league_table_history AS h
+                           JOIN teams AS t ON t.id = h.team_id
+                           LEFT JOIN league_table_history AS previous ON previous.matchday = h.matchday - 1 AND previous.team_id = h.team_id
+                           WHERE h.matchday = ?
+                           ORDER BY h.rank ASC
+                           """, matchday)
+
+        return {"teams": table, "last_update": None}
+
     if automatic_updates:
         if is_update_needed_league_table():
             update_league_table()
-        
 
-    table = db.execute("""SELECT * FROM teams
-                       ORDER BY rank ASC
+    table = db.execute("""
+                       -- full scan: all teams of the league
+                       SELECT t.*, previous.rank - t.rank AS rank_change
+                       FROM teams AS t
+                       LEFT JOIN league_table_history AS previous ON previous.team_id = t.id
+                       AND previous.matchday = (SELECT MAX(matches) FROM teams) - 1
+                       ORDER BY t.rank ASC
                        """)
-    
-    table[0]["lastUpdateTime"] = convert_iso_datetime_to_human_readable(table[0]["lastUpdateTime"])
 
-    return table
-        
+    # Only teams whose numbers changed get a new update time
+    last_update = max((team["lastUpdateTime"] for team in table if team["lastUpdateTime"]), default=None)
+
+    return {"teams": table, "last_update": convert_iso_datetime_to_human_readable(last_update) if last_update else None}
+
+
+def get_league_table_matchdays():
+    """ Matchdays with a stored table, in order """
+    rows = db.execute("""
+                      -- full scan: one row per team and matchday, walked in primary key order
+                      SELECT DISTINCT matchday FROM league_table_history ORDER BY matchday
+                      """)
+    return [row["matchday"] for row in rows]
+
 
 def get_matches_FCH():
     #create_teams_table() ###
     #insert_matches_to_db()
 
-    print("getting matches...")   
+    logger.debug("Getting matches...")
 
     if automatic_updates:
         if is_update_needed_FCH_matches():
@@ -161,133 +269,62 @@ def create_teams_table():
                    team["teamIconUrl"],
                    make_image_filepath(team))
         
-    db.execute("UPDATE teams SET lastUpdateTime = ?", get_current_datetime())
-               
-
-def update_league_table():
-    table = get_openliga_json(url_table)
-    for rank, team in enumerate(table, start=1):
-        db.execute("""
-                   UPDATE teams SET
-                   points = ?, opponentGoals = ?, goals = ?, matches = ?, won = ?, lost = ?, draw = ?, goalDiff = ?,
-                   rank = ? WHERE id = ?
-                   """,
-                   team["points"],
-                   team["opponentGoals"],
-                   team["goals"],
-                   team["matches"],
-                   team["won"],
-                   team["lost"],
-                   team["draw"],
-                   team["goalDiff"],
-                   rank,
-                   team["teamInfoId"]
-                   )
-    
-    db.execute("UPDATE teams SET lastUpdateTime = ?", get_current_datetime())
-
-
-def update_user_scores():
-    # Get data for evaluating the predictions
-    matches = get_local_FCH_matches()
-    predictions = db.execute("SELECT * FROM predictions")
-
-    # Evaluate predictions for each match
-    for match in matches:
-        if match["matchIsFinished"] == 1 and match["predictions_evaluated"] == 0:
-            # Prerequisites
-            match_id = match["id"]
-            team1_score = match["team1_score"]
-            team2_score = match["team2_score"]
-            goal_diff = team1_score - team2_score
-            winner = 1 if team1_score > team2_score else 2 if team1_score < team2_score else 0
+    db.execute("""
+               -- full scan: all teams of the league
+               UPDATE teams SET lastUpdateTime = ?
+               """, get_current_datetime())
 
-            # Get predictions for this match
-            predictions = db.execute("SELECT * FROM predictions WHERE match_id = ?", match_id)
+    bump_data_version("league_table")
 
-            for prediction in predictions:
-                awarded_points = 0                    
 
-                # Award 4 points for correct result
-                if team1_score == prediction["team1_score"] and team2_score == prediction["team2_score"]:
-                    awarded_points = 4
-                
-                # 3 points for correct goal_diff
-                elif goal_diff == prediction["goal_diff"]:
-                    awarded_points = 3
-
-                # 2 points for correct tendency
-                elif winner == prediction["winner"]:
-                    awarded_points = 2
-                
-                # 0 point for wrong prediction
-                else:
-                    awarded_points = 0
-
-                # Set points for the current prediction
-                db.execute("UPDATE predictions SET points = ? WHERE id = ?", awarded_points, prediction["id"])
+def update_league_table():
+    table = get_openliga_json(url_table)
+    now = get_current_datetime()
 
-            # Switch predictions_evaluated to 1 for the match, so that next time, only the not evaluated matches get evaluated
-            db.execute("UPDATE FCH_matches SET predictions_evaluated = 1, evaluation_Date = ? WHERE id = ?",get_current_datetime(), match["id"])
+    # Compare with the stored rows, only teams whose numbers changed are written
+    stored = {team["id"]: team for team in db.execute("""
+                                                      -- full scan: all teams of the league
+                                                      SELECT id, points, opponentGoals, goals, matches, won, lost, draw, goalDiff, rank
+                                                      FROM teams
+                                                      """)}
+    columns = ("points", "opponentGoals", "goals", "matches", "won", "lost", "draw", "goalDiff")
+    changed = []
 
-    # Update total points in the users table (Query with help from chatGPT)
-    db.execute("""
-               UPDATE users
-               SET total_points = (
-                   SELECT SUM(points)
-                   FROM predictions
-                   WHERE user_id = users.id
-               )
-               WHERE id IN (
-               SELECT DISTINCT user_id
-               FROM predictions
-               )
-               """)
-    
-    # Update correct result count in users table (with help from chatGPT)
-    db.execute("""
-               UPDATE users
-               SET correct_result = (
-                    SELECT(COUNT(*))
-                    FROM predictions
-                    WHERE points = 4
-                    AND user_id = users.id
-               )
-               WHERE id IN (
-               SELECT DISTINCT user_id
-               FROM predictions
-               )
-               """)
-    
-    # Update correct goal diff count in users table (with help from chatGPT)
-    db.execute("""
-               UPDATE users
-               SET correct_goal_diff = (
-                    SELECT(COUNT(*))
-                    FROM predictions
-                    WHERE points = 3
-                    AND user_id = users.id
-               )
-               WHERE id IN (
-               SELECT DISTINCT user_id
-               FROM predictions
-               )
-               """)
-    
-    # Update correct tendency count in users table (query with help from chatGPT)
-    db.execute("""
-               UPDATE users
-               SET correct_tendency = (
-                    SELECT(COUNT(*))
-                    FROM predictions
-                    WHERE points = 2
-                    AND user_id = users.id
-               )
-               WHERE id IN (
-               SELECT DISTINCT user_id
-               FROM predictions
-               )
-               """)
+    for rank, team in enumerate(table, start=1):
+        row = {column: team[column] for column in columns}
+        row["rank"] = rank
+
+        if any(stored.get(team["teamInfoId"], {}).get(column) != value for column, value in row.items()):
+            changed.append((*row.values(), now, team["teamInfoId"]))
+
+    # The table after the matchday the teams are at (overwritten until the next matchday starts)
+    matchday = max((team["matches"] for team in table), default=0)
+
+    # One transaction, so that the table page never shows a half updated table
+    with db.transaction():
+        if changed:
+            db.executemany("""
+                           UPDATE teams SET
+                           points = ?, opponentGoals = ?, goals = ?, matches = ?, won = ?, lost = ?, draw = ?, goalDiff = ?,
+                           rank = ?, lastUpdateTime = ? WHERE id = ?
+                           """, changed)
+
+            db.executemany("""
+                           INSERT INTO league_table_history (matchday, team_id, rank, points, goals, opponentGoals, matches, won, draw, lost)
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                           ON CONFLICT (matchday, team_id) DO UPDATE SET
+                           rank = excluded.rank, points = excluded.points, goals = excluded.goals, opponentGoals = excluded.opponentGoals,
+                           matches = excluded.matches, won = excluded.won, draw = excluded.draw, lost = excluded.lost
+                           WHERE rank != excluded.rank OR points != excluded.points OR goals != excluded.goals
+                           OR opponentGoals != excluded.opponentGoals OR matches != excluded.matches
+                           OR won != excluded.won OR draw != excluded.draw OR lost != excluded.lost
+                           """, [(matchday, team["teamInfoId"], rank, team["points"], team["goals"], team["opponentGoals"],
+                                  team["matches"], team["won"], team["draw"], team["lost"]) for rank, team in enumerate(table, start=1)])
+
+            bump_data_version("league_table")
+
+        # Compared with OpenLigaDB now, even if nothing changed (see is_update_needed_league_table)
+        db.execute("UPDATE data_versions SET synced = ? WHERE name = 'league_table'", get_current_timestamp())
 
 
 def insert_matches_to_db():
@@ -302,13 +339,13 @@ def insert_matches_to_db():
             team1_score = match["matchResults"][1]["pointsTeam1"] if matchFinished else None
             team2_score = match["matchResults"][1]["pointsTeam2"] if matchFinished else None
 
-            print(f"Save to db")
+            logger.debug("Saving match %s", match["matchID"])
 
             # Save to database
             db.execute("""
                        INSERT INTO FCH_matches(id, matchday, team1_id, team2_id, team1_score, team2_score, matchDateTime,
-                       matchIsFinished, lastUpdateDateTime)
-                       VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)
+                       matchIsFinished, lastUpdateDateTime, kickoff, last_update)
+                       VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                        """,
                        match["matchID"],
                        match["group"]["groupOrderID"],
@@ -318,57 +355,119 @@ def insert_matches_to_db():
                        team2_score,
                        match["matchDateTime"],
                        matchFinished,
-                       match["lastUpdateDateTime"] # So that it is always of same format
+                       match["lastUpdateDateTime"], # So that it is always of same format
+                       to_timestamp(match["matchDateTime"]),
+                       to_timestamp(match["lastUpdateDateTime"])
                        )
 
+        bump_data_version("ranking")
 
-def update_FCH_matches_db():
-    # Get unfinished matches of the local database
-    unfinished_matches_db = db.execute("""
-                                     SELECT * FROM FCH_matches
-                                     WHERE matchIsFinished = 0;
-                                     """)
+
+def update_FCH_matches_db(sync_mode="auto", check_all=False):
+    # Get unfinished matches of the local database, plus the recently finished ones, whose result may still get corrected.
+    # With check_all, every match of the season is compared (to catch late corrections of older results)
+    if check_all:
+        matches_db = db.execute("""
+                                -- full scan: the whole season is compared
+                                SELECT * FROM FCH_matches
+                                """)
+    else:
+        matches_db = db.execute("""
+                                SELECT * FROM FCH_matches
+                                WHERE matchIsFinished = 0 OR kickoff >= ?
+                                """, get_current_timestamp() - correction_window.total_seconds())
     
-    for match in unfinished_matches_db:
-        # Get matchdata openliga
-        matchdata_openliga = get_matchdata_openliga(match["id"])
+    if not matches_db:
+        return
 
-        # Get lastUpdateTime for match in db
-        last_update_time_openliga = matchdata_openliga["lastUpdateDateTime"]
+    # Fetch all needed matchdata first, so that the database is only touched once everything arrived
+    matchdata_openliga = get_matchdata_openliga_multiple(matches_db, sync_mode)
 
-        last_update_time_db = match["lastUpdateDateTime"]
+    # Collect the matches that changed online
+    changed_matches = []
+    for match in matches_db:
+        match_openliga = matchdata_openliga.get(match["id"])
 
-        if last_update_time_openliga and last_update_time_db:
-            # Convert dates to comparable format
-            last_update_time_openliga = datetime.strptime(last_update_time_openliga, '%Y-%m-%dT%H:%M:%S.%f')
-            last_update_time_db = datetime.strptime(last_update_time_db, '%Y-%m-%dT%H:%M:%S.%f')
+        if not match_openliga:
+            continue
+
+        # Last update online and in the db (already a number there)
+        last_update_time_openliga = match_openliga["lastUpdateDateTime"]
+
+        last_update_time_db = match["last_update"]
 
-            if last_update_time_openliga > last_update_time_db:
-                update_match_in_db(matchdata_openliga)
+        if last_update_time_openliga and last_update_time_db:
+            if to_timestamp(last_update_time_openliga) > last_update_time_db:
+                changed_matches.append(match_openliga)
         else:
             # Update if last update time is missing or inconsistent
-            update_match_in_db(matchdata_openliga)
+            changed_matches.append(match_openliga)
+
+    # Write all changes in a single transaction
+    if changed_matches:
+        with db.transaction():
+            for match in changed_matches:
+                update_match_in_db(match)
+
+            bump_data_version("ranking")
+
+
+def get_matchdata_openliga_multiple(matches, sync_mode="auto"):
+    """
+    Openliga matchdata of the given matches as dict {matchID: match}. sync_mode "bulk" fetches the whole season
+    with one request, "concurrent" fetches every match on its own in a thread pool and "auto" picks the cheaper one
+    """
+    ids = [match["id"] for match in matches]
+
+    if sync_mode == "auto":
+        sync_mode = "bulk" if len(ids) >= bulk_sync_threshold else "concurrent"
+
+    if sync_mode == "bulk":
+        season_matchdata = get_openliga_json(url_matchdata)
+
+        if season_matchdata:
+            wanted_ids = set(ids)
+            return {match["matchID"]: match for match in season_matchdata if match["matchID"] in wanted_ids}
+
+        # Fall back to single requests if the season could not be fetched
+
+    with ThreadPoolExecutor(max_workers=min(max_sync_workers, len(ids))) as executor:
+        matchdata = executor.map(get_matchdata_openliga, ids)
+
+        return {match["matchID"]: match for match in matchdata if match}
 
 
 def update_match_in_db(match):
-    print("Updating match: ", match["matchID"])
+    logger.info("Updating match %s", match["matchID"])
     # Local variable if match is finished
-    matchFinished = match["matchIsFinished"]
+    matchFinished = int(match["matchIsFinished"])
+    team1_score = match["matchResults"][1]["pointsTeam1"] if matchFinished else None
+    team2_score = match["matchResults"][1]["pointsTeam2"] if matchFinished else None
     
+    # If an already evaluated result was corrected, mark the match for re-evaluation (see scoring.update_user_scores)
     db.execute("""
                UPDATE FCH_matches SET
+               predictions_evaluated = CASE
+                   WHEN team1_score IS ? AND team2_score IS ? AND matchIsFinished = ? THEN predictions_evaluated
+                   ELSE 0
+               END,
                team1_score = ?,
                team2_score = ?,
                matchDateTime = ?,
                matchIsFinished = ?,
-               lastUpdateDateTime = ?
+               lastUpdateDateTime = ?,
+               kickoff = ?,
+               last_update = ?
                WHERE id = ?
                 """,
-                [match["matchResults"][1]["pointsTeam1"] if matchFinished else None],
-                [match["matchResults"][1]["pointsTeam2"] if matchFinished else None],
+                team1_score, team2_score, matchFinished,
+                team1_score,
+                team2_score,
                 match["matchDateTime"],
-                match["matchIsFinished"],
+                matchFinished,
                 match["lastUpdateDateTime"],
+                to_timestamp(match["matchDateTime"]),
+                to_timestamp(match["lastUpdateDateTime"]) if match["lastUpdateDateTime"] else None,
                 match["matchID"]
         )
 
@@ -383,19 +482,14 @@ def download_logos(table_data):
         for team in table_data:          
             try:
                 img_url = team['teamIconUrl']
-                response = requests.get(
-                    img_url,
-                    cookies={"session": str(uuid.uuid4())},
-                    headers={"Accept": "*/*", "User-Agent": "python-requests"},
-                )
-                response.raise_for_status()
+                content = openliga.get_content(img_url, cookies={"session": str(uuid.uuid4())})
 
                 # Create image paths
-                img_file_path = make_image_filepath(team, img_folder)
+                img_file_path = make_image_filepath(team)
 
                 # Save images
                 with open(img_file_path, 'wb') as f:
-                    f.write(response.content)
+                    f.write(content)
                 
                 # Lower resolution
                 resize_image(img_file_path)
@@ -404,86 +498,194 @@ def download_logos(table_data):
                 return None
 
 
-def add_random_predictions_to_db():
-    user_ids = db.execute("SELECT id FROM users")
-    print("USER IDS:" ,user_ids)
-
-    pass
-
-
 def get_insights():
-    predictions_rated = db.execute("""
-                                SELECT COUNT(*) AS predictions_rated
-                                FROM predictions AS p
-                                JOIN FCH_matches AS m ON m.id = p.match_id
-                                WHERE p.user_id = ?
-                                AND m.matchIsFinished = 1
-                                """, session["user_id"])
-    
-    prediction_count = db.execute("SELECT COUNT(*) AS prediction_count FROM predictions AS p WHERE p.user_id = ?", session["user_id"])
-    
-    # Get some base data for statistics
-    finished_matches = db.execute("SELECT COUNt(*) AS completed_matches FROM FCH_matches WHERE matchIsFinished = 1")
-    total_points_user = db.execute("SELECT total_points FROM users WHERE id = ?", session["user_id"])
-    rank = db.execute("""
-                      SELECT rank
-                      FROM (SELECT id, ROW_NUMBER() 
-                      OVER (
-                        ORDER BY total_points DESC) AS rank
-                        FROM users
-                      ) AS ranked_users
-                      WHERE id = ?
-                      """, session["user_id"])    # This query was created with help from chatgpt
-    
-    base_stats = db.execute("SELECT correct_result, correct_goal_diff, correct_tendency FROM users WHERE id = ?", session["user_id"])[0]
-    no_users = db.execute("SELECT COUNT(*) AS no_users FROM users")[0]["no_users"]
+    """
+    Statistics of the logged in user for the home page. Cached per user until scores or title odds change, or the user
+    adds a prediction. Other users' tips don't matter: the statistics only count the own predictions, and what they
+    are worth only changes when they are scored
+    """
+    user_id = session["user_id"]
+    versions = get_data_versions()
+    predictions = db.execute("SELECT COUNT(*) AS count FROM predictions WHERE user_id = ?", user_id)[0]["count"]
+
+    return get_cached(("insights", user_id), (versions["ranking"], versions["title_odds"], predictions),
+                      lambda: build_insights(user_id))
+
+
+def build_insights(user_id):
+    # Everything in one query, the rank comes from the standings table
+    rows = db.execute("""
+                      SELECT u.username, u.total_points, u.correct_result, u.correct_goal_diff, u.correct_tendency, s.rank,
+                      (SELECT COUNT(*) FROM predictions AS p WHERE p.user_id = u.id) AS prediction_count,
+                      (SELECT COUNT(*) FROM predictions AS p
+                          JOIN FCH_matches AS m ON m.id = p.match_id
+                          WHERE p.user_id = u.id AND m.matchIsFinished = 1) AS predictions_rated,
+                      (SELECT COUNT(*) FROM FCH_matches WHERE matchIsFinished = 1) AS completed_matches,
+                      (SELECT MAX(position) FROM standings) AS no_users,
+                      o.first AS odds_first, o.top3 AS odds_top3, o.top10 AS odds_top10
+                      FROM users AS u
+                      LEFT JOIN standings AS s ON s.user_id = u.id
+                      LEFT JOIN title_odds AS o ON o.user_id = u.id
+                      WHERE u.id = ?
+                      """, user_id)
+
+    # A user without a place in the standings (e. g. added by a script that skipped update_standings) has no rank yet,
+    # a user that no longer exists has nothing at all
+    stats = rows[0] if rows else {
+        "username": "", "total_points": 0, "correct_result": 0, "correct_goal_diff": 0, "correct_tendency": 0, "rank": None,
+        "prediction_count": 0, "predictions_rated": 0, "completed_matches": 0, "no_users": None,
+        "odds_first": None, "odds_top3": None, "odds_top10": None,
+    }
 
     # Store the statistics in the insights dictionary
     insights = {}
 
-    # If there have been predictions, count how many were made
-    if predictions_rated:
-        insights["predictions_rated"] = predictions_rated[0]['predictions_rated']
-    else:
-        insights["predictions_rated"] = 0
-
-    # Create useful statistics and store in insights dict    
-    insights["total_games_predicted"] = prediction_count[0]["prediction_count"]
-    insights["missed_games"] = finished_matches[0]["completed_matches"] - predictions_rated[0]['predictions_rated']    
-    insights["total_points"] = total_points_user[0]["total_points"]
-    insights["username"] = db.execute("SELECT username FROM users WHERE id = ?", session["user_id"])[0]["username"]
-    insights["no_users"] = no_users
-    insights["rank"] = rank[0]["rank"]
-    insights["corr_result"] = base_stats["correct_result"]
-    insights["corr_goal_diff"] = base_stats["correct_goal_diff"]
-    insights["corr_tendency"] = base_stats["correct_tendency"]
+    # Create useful statistics and store in insights dict
+    insights["predictions_rated"] = stats["predictions_rated"]
+    insights["total_games_predicted"] = stats["prediction_count"]
+    insights["missed_games"] = stats["completed_matches"] - stats["predictions_rated"]
+    insights["total_points"] = stats["total_points"]
+    insights["username"] = stats["username"]
+    insights["no_users"] = stats["no_users"]
+    insights["rank"] = stats["rank"]
+    insights["corr_result"] = stats["correct_result"]
+    insights["corr_goal_diff"] = stats["correct_goal_diff"]
+    insights["corr_tendency"] = stats["correct_tendency"]
+    insights["around_me"] = get_standings_around(user_id)
+
+    # Title odds in percent (None until the scheduler computed them)
+    insights["odds"] = None if stats["odds_first"] is None else {
+        "first": round(stats["odds_first"] * 100, 1),
+        "top3": round(stats["odds_top3"] * 100, 1),
+        "top10": round(stats["odds_top10"] * 100, 1),
+    }
     insights["wrong_predictions"] = insights["predictions_rated"] - insights["corr_result"] - insights["corr_goal_diff"] - insights["corr_tendency"]
 
     # Differentiate if predictions have been rated to avoid dividing by 0 for the percentage
     if insights["predictions_rated"] != 0:
-        insights["corr_result_p"] = round((base_stats["correct_result"] / insights["predictions_rated"])*100)
-        insights["corr_goal_diff_p"] = round(base_stats["correct_goal_diff"] / insights["predictions_rated"]*100)
-        insights["corr_tendency_p"] = round(base_stats["correct_tendency"] / insights["predictions_rated"]*100)
-        insights["wrong_predictions_p"] = round(insights["wrong_predictions"] / insights["predictions_rated"]*100) 
-        insights["points_per_tip"] = round(total_points_user[0]["total_points"] / insights["predictions_rated"], 2)
+        insights["corr_result_p"] = round((stats["correct_result"] / insights["predictions_rated"])*100)
+        insights["corr_goal_diff_p"] = round(stats["correct_goal_diff"] / insights["predictions_rated"]*100)
+        insights["corr_tendency_p"] = round(stats["correct_tendency"] / insights["predictions_rated"]*100)
+        insights["wrong_predictions_p"] = round(insights["wrong_predictions"] / insights["predictions_rated"]*100)
+        insights["points_per_tip"] = round(stats["total_points"] / insights["predictions_rated"], 2)
     else:
         insights["corr_result_p"] = 0
         insights["corr_goal_diff_p"] = 0
         insights["corr_tendency_p"] = 0
         insights["wrong_predictions_p"] = 0
         insights["points_per_tip"] = 0
-    
+
     return insights
 
+
+def get_standings_around(user_id, size=around_me_size):
+    """ size users around user_id in the standings (more below at the top, more above at the bottom) """
+    standing = db.execute("""
+                          SELECT position, (SELECT MAX(position) FROM standings) AS last_position
+                          FROM standings WHERE user_id = ?
+                          """, user_id)
+
+    if not standing:
+        return []
+
+    # Center the own position, but always fill the window
+    first = standing[0]["position"] - size // 2
+    first = max(1, min(first, standing[0]["last_position"] - size + 1))
+
+    return db.execute("""
+                      SELECT s.rank, u.id, u.username, u.total_points
+                      FROM standings AS s
+                      JOIN users AS u ON u.id = s.user_id
+                      WHERE s.position >= ?
+                      ORDER BY s.position
+                      LIMIT ?
+                      """, first, size)
+
+
+def get_user_history(user_id):
+    """ Points and rank of a user after every evaluated matchday (one range scan on the primary key) """
+    return db.execute("""
+                      SELECT matchday, total_points, correct_result, correct_goal_diff, correct_tendency, rank
+                      FROM standings_history
+                      WHERE user_id = ?
+                      ORDER BY matchday
+                      """, user_id)
+
+
+def get_league_history(first_matchday, last_matchday, user_id, after=None, limit=history_page_size):
+    """
+    Standings after each evaluated matchday from first_matchday to last_matchday as {matchday: (rows, cursor of the next
+    rows or None)}. Per matchday up to limit users in the order of rank (ties by user id): the ones after the cursor after
+    (see get_history_cursor) if given, else the ones around user_id (the top if the user has no standings that matchday).
+    Each is a search in the standings_history_matchday index, so the work is bounded by limit, not by the number of users
+    """
+    matchdays = db.execute("""
+                           SELECT DISTINCT matchday FROM FCH_matches
+                           WHERE predictions_evaluated = 1 AND matchday BETWEEN ? AND ?
+                           ORDER BY matchday
+                           """, first_matchday, last_matchday)
+
+    history = {}
+    for matchday in (row["matchday"] for row in matchdays):
+        before = []
+        start = after
+
+        if start is None:
+            own = db.execute("SELECT rank FROM standings_history WHERE user_id = ? AND matchday = ?", user_id, matchday)
+
+            if own:
+                # Half of the rows above the user, the rest from the user on (after the rank and id just before the user)
+                before = db.execute("""
+                                    SELECT h.rank, h.user_id, u.username, h.total_points
+                                    FROM standings_history AS h
+                                    JOIN users AS u ON u.id = h.user_id
+                                    WHERE h.matchday = ? AND (h.rank, h.user_id) < (?, ?)
+                                    ORDER BY h.rank DESC, h.user_id DESC
+                                    LIMIT ?
+                                    """, matchday, own[0]["rank"], user_id, limit // 2)[::-1]
+                start = (own[0]["rank"], user_id - 1)
+            else:
+                start = (0, 0)
+
+        # One more than asked for tells whether there are more rows
+        rows = db.execute("""
+                          SELECT h.rank, h.user_id, u.username, h.total_points
+                          FROM standings_history AS h
+                          JOIN users AS u ON u.id = h.user_id
+                          WHERE h.matchday = ? AND (h.rank, h.user_id) > (?, ?)
+                          ORDER BY h.rank, h.user_id
+                          LIMIT ?
+                          """, matchday, *start, limit - len(before) + 1)
+
+        next_cursor = get_history_cursor(rows[-2]) if len(rows) > limit - len(before) else None
+        history[matchday] = (before + rows[:limit - len(before)], next_cursor)
+
+    return history
+
+
+def get_history_cursor(row):
+    """ Place of a row of get_league_history as text, for the rows that come after it """
+    return f"{row['rank']}.{row['user_id']}"
+
+
+def parse_history_cursor(cursor):
+    """ A cursor of get_history_cursor as tuple (rank, user_id), None if it isn't one """
+    try:
+        values = tuple(int(value) for value in cursor.split("."))
+    except ValueError:
+        return None
+
+    return values if len(values) == 2 else None
+
+
 def is_update_needed_league_table():
     # Get current matchday by online query (returns the upcoming matchday after the middle of the week)
     current_matchday = get_current_matchday_openliga()
 
     # Get current matchday of the local database
     current_match_db = db.execute("""
-                                     SELECT matches AS matchday, lastUpdateTime FROM teams
-                                     ORDER BY matches DESC
-                                     LIMIT 1;
+                                     SELECT (SELECT MAX(matches) FROM teams) AS matchday, synced AS lastUpdateTime
+                                     FROM data_versions WHERE name = 'league_table'
                                      """)
     
     if current_matchday > current_match_db[0]["matchday"] + 1:  # +1 bcs of the current matchday calc. by openliga
@@ -497,11 +699,7 @@ def is_update_needed_league_table():
         lastUpdateTime_db = current_match_db[0]["lastUpdateTime"]
         
         if lastUpdateTime_db:
-            # Convert dates to comparable format
-            lastUpdateTime_openliga = datetime.strptime(lastUpdateTime_openliga,  '%Y-%m-%dT%H:%M:%S.%f')
-            lastUpdateTime_db = datetime.fromisoformat(lastUpdateTime_db)
-
-            # If online data is more recent, update the database
+            # If online data is more recent, update the database (both are seconds since the epoch)
             if lastUpdateTime_openliga > lastUpdateTime_db:
                 return True
             
@@ -515,7 +713,10 @@ def is_update_needed_league_table():
 
 def is_update_needed_FCH_matches():
     # If table is empty, fill fch_matches table
-    empty_check_db  = db.execute("SELECT * FROM FCH_matches")
+    empty_check_db  = db.execute("""
+                                 -- full scan: stops at the first row
+                                 SELECT id FROM FCH_matches LIMIT 1
+                                 """)
 
     if not empty_check_db:
         insert_matches_to_db() 
@@ -523,19 +724,10 @@ def is_update_needed_FCH_matches():
     # Get current matchday from API (gets the closest in time matchday)
     current_matchday_API = get_current_matchday_openliga()
 
-    # Get current match from db based on which match is closest in time
-    current_datetime = get_current_datetime()
-    current_matchday_db = db.execute("""
-                                     SELECT
-                                        matchday, id
-                                     FROM 
-                                        FCH_matches
-                                     ORDER BY
-                                        ABS(strftime('%s', matchDateTime) - strftime('%s', ?))
-                                     """, current_datetime)[0]  # query with chatgpt help
+    # Get current match from db based on which match is closest in time (the next or the previous kickoff)
+    current_matchday_db = get_nearest_match(get_current_timestamp())
 
-    print("Current matchday local: ", current_matchday_db["matchday"])
-    print("Current matchday API: ", current_matchday_API)
+    logger.debug("Current matchday local: %s, API: %s", current_matchday_db["matchday"], current_matchday_API)
 
     ### Compare matchdays and if they're the same check for update times
 
@@ -550,21 +742,15 @@ def is_update_needed_FCH_matches():
         lastUpdateTime_openliga = current_match_matchdata["lastUpdateDateTime"]
 
         # Get last update time of the locally saved db
-        lastUpdateTime_db = db.execute("""
-                                        SELECT lastUpdateDateTime FROM FCH_matches
-                                        WHERE id = ?
-                                        """,
-                                        current_matchday_db["id"])
+        lastUpdateTime_db = current_matchday_db["last_update"]
         
         # If a last update time exists for the next match
-        if lastUpdateTime_db[0]["lastUpdateDateTime"] and lastUpdateTime_openliga:
+        if lastUpdateTime_db and lastUpdateTime_openliga:
             # Convert dates to comparable format
-            lastUpdateTime_openliga = datetime.strptime(lastUpdateTime_openliga, '%Y-%m-%dT%H:%M:%S.%f')
-            lastUpdateTime_db = datetime.fromisoformat(lastUpdateTime_db[0]["lastUpdateDateTime"])
+            lastUpdateTime_openliga = to_timestamp(lastUpdateTime_openliga)
 
             # If online data is more recent, update the database
-            print("Last update time openliga:", lastUpdateTime_openliga)
-            print("Last update time db:", lastUpdateTime_db)
+            logger.debug("Last update time openliga: %s, db: %s", lastUpdateTime_openliga, lastUpdateTime_db)
             if lastUpdateTime_openliga > lastUpdateTime_db:
                 return True
             
@@ -580,39 +766,23 @@ def is_update_needed_FCH_matches():
 
 
 def get_matchdata_openliga(id):
-    url = f"https://api.openligadb.de/getmatchdata/{id}"
+    url = f"/getmatchdata/{id}"
 
     matchdata = get_openliga_json(url)
 
     return matchdata
 
 
-def convert_to_6_decimals(date_string):
-    # Format dates of the API to make them usable with the datetime module. Intended to use with ISO formatted dates
-    split_string = date_string.split('.')
-
-    pre_decimals = split_string[0]
-    decimals = split_string[1]
-
-    while len(decimals) < 6:
-        decimals += "0"
-        
-    return f"{pre_decimals}.{decimals}"
-
-
 def get_last_online_change(matchday_id):
     # Make url to get last online change
-    url = f"https://api.openligadb.de/getlastchangedate/{league}/{season}/{matchday_id}"
-
-    # Query API and convert to correct format
-    # (to ensure that the datetime module works correctly)
-    online_change = convert_to_6_decimals(get_openliga_json(url))
+    url = f"/getlastchangedate/{league}/{season}/{matchday_id}"
 
-    return online_change
+    # Query API, as seconds since the epoch
+    return to_timestamp(get_openliga_json(url))
 
 def get_current_matchday_openliga():
     # Openliga DB API
-    url = f"https://api.openligadb.de/getcurrentgroup/{league}"
+    url = f"/getcurrentgroup/{league}"
 
     # Query API
     current_matchday = get_openliga_json(url)
@@ -640,50 +810,190 @@ def get_current_datetime():
     return datetime.now().isoformat()
 
 
-def convert_iso_datetime_to_human_readable(datetime_iso_string):
-    date = datetime.fromisoformat(datetime_iso_string)
+def get_current_timestamp():
+    """ Now in seconds since the epoch, to compare with kickoff and last_update """
+    return int(time.time())
+
+
+@lru_cache(maxsize=4096)
+def to_timestamp(datetime_iso_string):
+    """
+    Seconds since the epoch of an ISO date in local time (like the dates of OpenLigaDB). Fractions of a second are cut off,
+    so every number of decimals OpenLigaDB sends works
+    """
+    return int(datetime.fromisoformat(datetime_iso_string[:19]).timestamp())
 
-    date.weekday()
+
+@lru_cache(maxsize=4096)
+def format_timestamp(timestamp):
+    """ Human readable date like "Sa. 19.08.2023 15:30". Memoized, the same kickoffs are shown on every page """
+    date = datetime.fromtimestamp(timestamp)
 
     weekday_names = ["Mo.", "Di.", "Mi.", "Do.", "Fr.", "Sa.", "So."]
 
     # Format the datetime object into a more readable format
-    match_time_readable = f"{weekday_names[date.weekday()]} {date.strftime('%d.%m.%Y %H:%M')}"
-
-    return match_time_readable
-
-
-def get_rangliste_data():
-    predictions = db.execute("""SELECT u.id, u.username, u.total_points, u.correct_result, u.correct_goal_diff, u.correct_tendency, 
-                             s.matchday, s.match_id, s.team1_score, s.team2_score, s.points
-                             FROM users AS u
-                             LEFT JOIN (
-                                SELECT p.user_id, p.matchday, p.match_id, p.team1_score, p.team2_score, p.points
-                                FROM predictions AS p
-                                ORDER BY p.matchday ASC
-                             ) AS s
-                             ON u.id = s.user_id
-                             ORDER BY u.total_points DESC, u.correct_result DESC, u.correct_goal_diff DESC, u. correct_tendency
-                    """) # query with help from chatGPT
-    
-    
-    user_predictions = {}
+    return f"{weekday_names[date.weekday()]} {date.strftime('%d.%m.%Y %H:%M')}"
+
+
+def convert_iso_datetime_to_human_readable(datetime_iso_string):
+    return format_timestamp(to_timestamp(datetime_iso_string))
+
+
+def get_next_match(timestamp):
+    """ The first match that kicks off at or after timestamp (index range scan on kickoff), else None """
+    match = db.execute("""
+                       SELECT id, matchday, kickoff, last_update FROM FCH_matches
+                       WHERE kickoff >= ?
+                       ORDER BY kickoff ASC
+                       LIMIT 1
+                       """, timestamp)
+
+    return match[0] if match else None
+
+
+def get_nearest_match(timestamp):
+    """ The match whose kickoff is closest to timestamp: the next or the previous one, one index seek each """
+    match = db.execute("""
+                       SELECT * FROM (
+                           SELECT * FROM (
+                               SELECT id, matchday, kickoff, last_update FROM FCH_matches
+                               WHERE kickoff >= ?
+                               ORDER BY kickoff ASC
+                               LIMIT 1
+                           )
+                           UNION ALL
+                           SELECT * FROM (
+                               SELECT id, matchday, kickoff, last_update FROM FCH_matches
+                               WHERE kickoff < ?
+                               ORDER BY kickoff DESC
+                               LIMIT 1
+                           )
+                       )
+                       ORDER BY ABS(kickoff - ?)
+                       LIMIT 1
+                       """, timestamp, timestamp, timestamp)
+
+    return match[0] if match else None
+
+
+def get_rangliste_cursor(user):
+    """ Place of a user in the ranking order as text, for the page that starts after this user (see get_rangliste_page_data) """
+    return ".".join(str(user[key]) for key in ("total_points", "correct_result", "correct_goal_diff", "correct_tendency", "id"))
+
+
+def parse_rangliste_cursor(cursor):
+    """ A cursor of get_rangliste_cursor as tuple (total_points, correct_result, correct_goal_diff, correct_tendency, id), None if it isn't one """
+    try:
+        values = tuple(int(value) for value in cursor.split("."))
+    except ValueError:
+        return None
+
+    return values if len(values) == 5 else None
+
+
+def get_rangliste_page_data(matches, user_id, live_match_id=None, after=None, limit=rangliste_page_size):
+    """
+    One page of the ranking: up to limit users in the ranking order (more points, correct results, goal differences and
+    tendencies first, ties by id) that come after the cursor after (None for the top), with their rank and cells for matches
+    (see add_rangliste_cells). Returns the users and the cursor of the next page, None on the last page.
+    Keyset pagination: the cursor holds the values of the last user, so every page is one search in the users_ranking index,
+    as fast at the end of the ranking as at the top, and a page doesn't shift when the standings change in between
+    """
+    # One more than asked for tells whether there is a next page
+    if after is None:
+        users = db.execute("""
+                           SELECT u.id, u.username, u.total_points, u.correct_result, u.correct_goal_diff, u.correct_tendency, s.rank
+                           FROM users AS u
+                           JOIN standings AS s ON s.user_id = u.id
+                           ORDER BY u.total_points DESC, u.correct_result DESC, u.correct_goal_diff DESC, u.correct_tendency DESC, u.id
+                           LIMIT ?
+                           """, limit + 1)
+    else:
+        # The rest of the users that are equal to the cursor in all four, then the ones below. Two searches, because
+        # one condition with OR could not use the index
+        users = db.execute("""
+                           SELECT u.id, u.username, u.total_points, u.correct_result, u.correct_goal_diff, u.correct_tendency, s.rank
+                           FROM users AS u
+                           JOIN standings AS s ON s.user_id = u.id
+                           WHERE (u.total_points, u.correct_result, u.correct_goal_diff, u.correct_tendency) = (?, ?, ?, ?) AND u.id > ?
+                           ORDER BY u.id
+                           LIMIT ?
+                           """, *after, limit + 1)
+
+        if len(users) <= limit:
+            users += db.execute("""
+                                SELECT u.id, u.username, u.total_points, u.correct_result, u.correct_goal_diff, u.correct_tendency, s.rank
+                                FROM users AS u
+                                JOIN standings AS s ON s.user_id = u.id
+                                WHERE (u.total_points, u.correct_result, u.correct_goal_diff, u.correct_tendency) < (?, ?, ?, ?)
+                                ORDER BY u.total_points DESC, u.correct_result DESC, u.correct_goal_diff DESC, u.correct_tendency DESC, u.id
+                                LIMIT ?
+                                """, *after[:4], limit + 1 - len(users))
+
+    next_cursor = get_rangliste_cursor(users[limit - 1]) if len(users) > limit else None
+    users = users[:limit]
+
+    add_rangliste_cells(users, matches, user_id, live_match_id)
+
+    return users, next_cursor
+
+
+def get_rangliste_user(matches, user_id, live_match_id=None):
+    """ Rank, totals and cells (see add_rangliste_cells) of one user as the user sees them, None if there is no such user """
+    users = db.execute("""
+                       SELECT u.id, u.username, u.total_points, u.correct_result, u.correct_goal_diff, u.correct_tendency, s.rank
+                       FROM users AS u
+                       JOIN standings AS s ON s.user_id = u.id
+                       WHERE u.id = ?
+                       """, user_id)
+
+    add_rangliste_cells(users, matches, user_id, live_match_id)
+
+    return users[0] if users else None
+
+
+def add_rangliste_cells(users, matches, user_id, live_match_id=None):
+    """
+    Give every user one cell per match (same order as matches): a tuple (team1_score, team2_score, points) or None if
+    there is no prediction or it must not be shown yet. Other users' predictions are only shown once the match is underway,
+    those of user_id always. points is "?" until the match is evaluated. Only the predictions of these users and matches are read
+    """
+    # Resolve per match once, instead of per cell in the template
+    columns = {match["id"]: column for column, match in enumerate(matches)}
+    visible = [match["matchIsFinished"] == 1 or match["id"] == live_match_id for match in matches]
+    evaluated = [match["predictions_evaluated"] == 1 for match in matches]
+
+    cells_by_user = {}
+    for user in users:
+        user["cells"] = [None] * len(matches)
+        cells_by_user[user["id"]] = user["cells"]
+
+    if not users or not matches:
+        return
+
+    predictions = db.execute("""
+                             SELECT user_id, match_id, team1_score, team2_score, points FROM predictions
+                             WHERE user_id IN (SELECT value FROM json_each(?)) AND match_id IN (SELECT value FROM json_each(?))
+                             """, json.dumps(list(cells_by_user)), json.dumps(list(columns)))
+
     for prediction in predictions:
-        id, username, total_points, correct_result, correct_goal_diff, correct_tendency, matchday, match_id, team1_score, team2_score, points = prediction.values()
-        if id not in user_predictions:
-            user_predictions[id] = {'username':username, 'id':id, 'total_points':total_points, 'correct_result':correct_result, 
-                                    'correct_goal_diff':correct_goal_diff, 'correct_tendency':correct_tendency, 'predictions':[]}
-
-        user_predictions[id]['predictions'].append({
-            'matchday': matchday,
-            'match_id': match_id,
-            'team1_score': team1_score,
-            'team2_score': team2_score,
-            'points': points})
-    
-    
-    user_predictions_list = []
-    for key in user_predictions.keys():
-        user_predictions_list.append(user_predictions[key])
+        column = columns[prediction["match_id"]]
+
+        if visible[column] or prediction["user_id"] == user_id:
+            points = prediction["points"] if evaluated[column] else "?"
+            cells_by_user[prediction["user_id"]][column] = (prediction["team1_score"], prediction["team2_score"], points)
+
+
+def get_live_match_id():
+    """ Id of the FCH match that is underway right now (its predictions are shown to everyone), else None """
+    now = get_current_timestamp()
+
+    # Live from kickoff until OpenLigaDB marks the match as finished (extra time, delays), but not forever
+    live_match = db.execute("""
+                            SELECT id FROM FCH_matches
+                            WHERE matchIsFinished = 0 AND kickoff <= ? AND kickoff >= ?
+                            ORDER BY kickoff DESC
+                            LIMIT 1
+                            """, now, now - max_live_duration.total_seconds())
 
-    return user_predictions_list
\ No newline at end of file
+    return live_match[0]["id"] if live_match else None
@@ -0,0 +1,217 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from database import db
+from helpers import get_live_match_id, get_matchdata_openliga
+from scoring import get_points_case
+
+logger = logging.getLogger(__name__)
+
+# While a FCH match is underway, one thread polls its score and pushes changes to all open ranking pages
+# (Server-Sent Events on /live). Browsers never poll OpenLigaDB or the database themselves.
+# The poller runs in one process only (see scheduler.run_in_one_process). It also stores the state in the live_state table,
+# from where a follower thread in every other process picks it up for the streams of that process.
+
+live_poll_interval = 15         # Seconds between two polls of the running match
+idle_poll_interval = 60         # Seconds between two checks whether a match has started
+keepalive_interval = 25         # Seconds after which an idle event stream gets a comment (keeps proxies from closing it)
+follow_interval = 2             # Seconds between two reads of the stored state in the processes without the poller
+
+# Every open stream holds a worker thread of the server for as long as the page is open. Beyond this many per process,
+# /live answers 503 (the page tries again later), so that the streams can't take all workers from normal requests.
+# For many viewers run the app with an async worker (e. g. gunicorn -k gevent) and raise the limit
+max_streams = int(os.environ.get("TIPPSPIEL_MAX_STREAMS", "100"))
+retry_after = 60                # Seconds a rejected page waits before it tries again
+
+# Latest state, sent to every new subscriber and to all open streams when it changes
+_condition = threading.Condition()
+_version = 0
+_state = {"match_id": None}
+_poller = None
+_poller_lock = threading.Lock()
+_follower = None
+_streams = 0
+_streams_lock = threading.Lock()
+
+
+def get_final_result(match):
+    """ (team1_score, team2_score) of the final result of a match in OpenLigaDB format, None if there is none yet """
+    for result in match.get("matchResults") or []:
+        if result["resultTypeID"] == 2:
+            return result["pointsTeam1"], result["pointsTeam2"]
+
+    return None
+
+
+def get_live_score(match):
+    """ (team1_score, team2_score) of a match in OpenLigaDB format, also while it is running """
+    # Once the match is finished the final result counts (as for the stored result): OpenLigaDB corrects it
+    # without always rewriting the goals
+    if match.get("matchIsFinished") and get_final_result(match):
+        return get_final_result(match)
+
+    # During the match the score is in the goals, the last goal has the highest score
+    if match.get("goals"):
+        goal = max(match["goals"], key=lambda goal: (goal["scoreTeam1"] or 0) + (goal["scoreTeam2"] or 0))
+        return goal["scoreTeam1"], goal["scoreTeam2"]
+
+    return get_final_result(match) or (0, 0)
+
+
+def get_provisional_points(match_id, team1_score, team2_score):
+    """ Points every predicted score would get if the match ended now, as {"2:1": 4, ...} """
+    points_case, points_args = get_points_case(team1_score, team2_score)
+
+    rows = db.execute(f"""
+                      SELECT DISTINCT team1_score, team2_score, {points_case} AS points
+                      FROM predictions
+                      WHERE match_id = ?
+                      """, *points_args, match_id)
+
+    return {f"{row['team1_score']}:{row['team2_score']}": row["points"] for row in rows}
+
+
+def get_state():
+    """ Latest published state ({"match_id": None} if no match is live) """
+    with _condition:
+        return _state
+
+
+def publish(state):
+    """ Send state to all subscribers, if it differs from the last one. Returns True if it did """
+    global _version, _state
+
+    with _condition:
+        if state == _state:
+            return False
+
+        _state = state
+        _version += 1
+        _condition.notify_all()
+        return True
+
+
+def store(state):
+    """ Publish state in this process and save it for the other processes """
+    if publish(state):
+        db.execute("UPDATE live_state SET state = ? WHERE id = 1", json.dumps(state))
+
+
+def load():
+    """ State saved by the poller of whichever process has it """
+    return json.loads(db.execute("SELECT state FROM live_state WHERE id = 1")[0]["state"])
+
+
+def poll():
+    """ Check the running match once and publish its score. Returns True if a match is live """
+    match_id = get_live_match_id()
+
+    if match_id is None:
+        store({"match_id": None})
+        return False
+
+    match = get_matchdata_openliga(match_id)
+
+    if not match:
+        return True
+
+    team1_score, team2_score = get_live_score(match)
+
+    store({
+        "match_id": match_id,
+        "team1_score": team1_score,
+        "team2_score": team2_score,
+        "finished": bool(match["matchIsFinished"]),
+        "points": get_provisional_points(match_id, team1_score, team2_score),
+        "updated": datetime.now().isoformat(timespec="seconds"),
+    })
+
+    return True
+
+
+def _run():
+    while True:
+        try:
+            live = poll()
+        except Exception:
+            logger.exception("Live: polling failed")
+            live = True     # Try again soon
+
+        finally:
+            db.release()
+
+        time.sleep(live_poll_interval if live else idle_poll_interval)
+
+
+def _follow():
+    while True:
+        try:
+            # The process with the poller publishes right away
+            if _poller is None:
+                publish(load())
+        except Exception:
+            logger.exception("Live: reading the stored state failed")
+
+        finally:
+            db.release()
+
+        time.sleep(follow_interval)
+
+
+def start_live_poller():
+    """ Start the live poll thread (only once per process, and only in one process, see scheduler.run_in_one_process) """
+    global _poller
+
+    with _poller_lock:
+        if _poller is None:
+            _poller = threading.Thread(target=_run, name="live-poller", daemon=True)
+            _poller.start()
+
+
+def start_live_follower():
+    """ Start the thread that passes the state stored by the poller on to the streams of this process (once per process) """
+    global _follower
+
+    with _poller_lock:
+        if _follower is None:
+            _follower = threading.Thread(target=_follow, name="live-follower", daemon=True)
+            _follower.start()
+
+
+def open_stream():
+    """ Count one more open stream, False if max_streams are open already. Call close_stream() when it ends """
+    global _streams
+
+    with _streams_lock:
+        if _streams >= max_streams:
+            return False
+
+        _streams += 1
+        return True
+
+
+def close_stream():
+    global _streams
+
+    with _streams_lock:
+        _streams -= 1
+
+
+def stream():
+    """ Server-Sent Events: the current state right away, then every change """
+    seen = None
+
+    while True:
+        with _condition:
+            _condition.wait_for(lambda: _version != seen, timeout=keepalive_interval)
+
+            if _version == seen:
+                event = None
+            else:
+                seen = _version
+                event = f"id: {_version}\nevent: score\ndata: {json.dumps(_state)}\n\n"
+
+        yield event or ": keepalive\n\n"
@@ -0,0 +1,129 @@
+import contextlib
+import os
+import threading
+import time
+
+# Counters and latency histograms of the app, served in the Prometheus text format on /metrics.
+# Opt-in: only collected (and /metrics only exists) with TIPPSPIEL_METRICS=1
+enabled = os.environ.get("TIPPSPIEL_METRICS", "0") == "1"
+
+# Upper bounds (in seconds, or queries for sql_queries_per_request) of the histogram buckets
+latency_buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+query_count_buckets = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# Help text of every metric, also decides the order in the output
+descriptions = {
+    "http_request_duration_seconds": "Time to build the response of a route",
+    "sql_queries_per_request": "SQL statements run by one request",
+    "sql_seconds_per_request": "Time one request spent in SQL statements",
+    "template_render_seconds": "Time to render a Jinja template",
+    "openliga_request_duration_seconds": "Duration of one request to OpenLigaDB (per attempt)",
+    "sync_duration_seconds": "Duration of one step of the background sync",
+    "sync_failures_total": "Failed steps of the background sync",
+    "scoring_duration_seconds": "Duration of evaluating one match",
+}
+
+# {(name, labels): [count per bucket..., sum, count]} and {(name, labels): value}, labels as sorted tuple of pairs
+_histograms = {}
+_counters = {}
+_lock = threading.Lock()
+
+
+def observe(name, value, buckets=latency_buckets, **labels):
+    """ Add one value to the histogram name (with these labels) """
+    if not enabled:
+        return
+
+    key = (name, tuple(sorted(labels.items())))
+
+    with _lock:
+        histogram = _histograms.get(key)
+
+        if histogram is None:
+            histogram = _histograms[key] = {"buckets": buckets, "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+
+        for index, bound in enumerate(buckets):
+            if value <= bound:
+                histogram["counts"][index] += 1
+
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+
+def increment(name, value=1, **labels):
+    if not enabled:
+        return
+
+    key = (name, tuple(sorted(labels.items())))
+
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+@contextlib.contextmanager
+def timed(name, **labels):
+    """ with timed("sync_duration_seconds", step="league_table"): ... observes how long the block took """
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def format_labels(labels, **extra):
+    labels = list(labels) + list(extra.items())
+
+    if not labels:
+        return ""
+
+    # Backslashes, quotes and newlines have to be escaped in label values
+    values = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, values)) + "}"
+
+
+def render(extra_counters=()):
+    """
+    All metrics in the Prometheus text format. extra_counters: (name, help, {labels tuple: value}) of counters
+    that are kept elsewhere (e. g. the OpenLigaDB call counts in openliga.py)
+    """
+    with _lock:
+        histograms = {key: {**histogram, "counts": list(histogram["counts"])} for key, histogram in _histograms.items()}
+        counters = dict(_counters)
+
+    lines = []
+    names = sorted({name for name, _ in histograms} | {name for name, _ in counters},
+                   key=lambda name: (list(descriptions).index(name) if name in descriptions else len(descriptions), name))
+
+    for name in names:
+        kind = "histogram" if any(key[0] == name for key in histograms) else "counter"
+        lines.append(f"# HELP {name} {descriptions.get(name, name)}")
+        lines.append(f"# TYPE {name} {kind}")
+
+        if kind == "counter":
+            for (_, labels), value in sorted(item for item in counters.items() if item[0][0] == name):
+                lines.append(f"{name}{format_labels(labels)} {value}")
+            continue
+
+        for (_, labels), histogram in sorted((item for item in histograms.items() if item[0][0] == name), key=lambda item: item[0]):
+            for bound, count in zip(histogram["buckets"], histogram["counts"]):
+                lines.append(f"{name}_bucket{format_labels(labels, le=bound)} {count}")
+
+            lines.append(f"{name}_bucket{format_labels(labels, le='+Inf')} {histogram['count']}")
+            lines.append(f"{name}_sum{format_labels(labels)} {histogram['sum']}")
+            lines.append(f"{name}_count{format_labels(labels)} {histogram['count']}")
+
+    for name, help_text, values in extra_counters:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+
+        for labels, value in sorted(values.items()):
+            lines.append(f"{name}{format_labels(labels)} {value}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,209 @@
+import logging
+from database import db
+
+logger = logging.getLogger(__name__)
+
+# Schema changes, applied once and in order at startup. The version of a database is stored in PRAGMA user_version.
+# Never change a migration that was already released, add a new one instead
+migrations = [
+    # 1: Indexes for the hot queries and one prediction per user and match
+    [
+        # Keep only the latest prediction if a user has several for the same match
+        """
+        DELETE FROM predictions WHERE id NOT IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY user_id, match_id
+                    ORDER BY prediction_date DESC, id DESC
+                ) AS position
+                FROM predictions
+            )
+            WHERE position = 1
+        )
+        """,
+        "CREATE UNIQUE INDEX predictions_user_match ON predictions (user_id, match_id)",
+        # Totals may have counted removed duplicates (after the index, so that the subqueries can use it)
+        """
+        UPDATE users SET
+        total_points = COALESCE((SELECT SUM(points) FROM predictions WHERE user_id = users.id), 0),
+        correct_result = (SELECT COUNT(*) FROM predictions WHERE user_id = users.id AND points = 4),
+        correct_goal_diff = (SELECT COUNT(*) FROM predictions WHERE user_id = users.id AND points = 3),
+        correct_tendency = (SELECT COUNT(*) FROM predictions WHERE user_id = users.id AND points = 2)
+        """,
+        "CREATE INDEX predictions_match ON predictions (match_id)",
+        "CREATE INDEX FCH_matches_finished_datetime ON FCH_matches (matchIsFinished, matchDateTime)",
+        "CREATE INDEX FCH_matches_datetime ON FCH_matches (matchDateTime)",
+        "CREATE INDEX FCH_matches_evaluated ON FCH_matches (predictions_evaluated)",
+        "CREATE INDEX FCH_matches_evaluation_date ON FCH_matches (evaluation_Date)",
+        "CREATE INDEX FCH_matches_last_update ON FCH_matches (lastUpdateDateTime)",
+        "CREATE INDEX teams_rank ON teams (rank)",
+        "CREATE INDEX teams_matches ON teams (matches)",
+    ],
+    # 2: Data versions, counted up whenever the data behind a cached page changes (see cache.py)
+    [
+        "CREATE TABLE data_versions (name TEXT PRIMARY KEY NOT NULL, version INTEGER NOT NULL DEFAULT 0)",
+        "INSERT INTO data_versions (name) VALUES ('league_table'), ('ranking'), ('predictions')",
+    ],
+    # 3: Ranking order of the users (rangliste and the rank on the home page)
+    [
+        "CREATE INDEX users_ranking ON users (total_points, correct_result, correct_goal_diff, correct_tendency)",
+    ],
+    # 4: Materialized standings (kept up to date by scoring.update_standings)
+    [
+        """
+        CREATE TABLE standings (
+            user_id INTEGER PRIMARY KEY NOT NULL REFERENCES users (id),
+            position INTEGER NOT NULL,
+            rank INTEGER NOT NULL
+        )
+        """,
+        """
+        INSERT INTO standings (user_id, position, rank)
+        SELECT id,
+        ROW_NUMBER() OVER (ORDER BY total_points DESC, correct_result DESC, correct_goal_diff DESC, correct_tendency DESC, id),
+        RANK() OVER (ORDER BY total_points DESC, correct_result DESC, correct_goal_diff DESC, correct_tendency DESC)
+        FROM users
+        """,
+        # Not unique: positions are swapped row by row when the standings change
+        "CREATE INDEX standings_position ON standings (position)",
+    ],
+    # 5: Server-side sessions (see sessions.py), expires in seconds since the epoch
+    [
+        "CREATE TABLE sessions (id TEXT PRIMARY KEY NOT NULL, data TEXT NOT NULL, expires REAL NOT NULL) WITHOUT ROWID",
+        "CREATE INDEX sessions_expires ON sessions (expires)",
+    ],
+    # 6: Title odds of every user (see title_odds.py), probabilities from 0 to 1
+    [
+        """
+        CREATE TABLE title_odds (
+            user_id INTEGER PRIMARY KEY NOT NULL REFERENCES users (id),
+            first REAL NOT NULL,
+            top3 REAL NOT NULL,
+            top10 REAL NOT NULL
+        )
+        """,
+        "INSERT INTO data_versions (name) VALUES ('title_odds')",
+    ],
+    # 7: Standings after every evaluated matchday (kept up to date by scoring.update_history), filled from the predictions once
+    [
+        """
+        CREATE TABLE standings_history (
+            user_id INTEGER NOT NULL REFERENCES users (id),
+            matchday INTEGER NOT NULL,
+            total_points INTEGER NOT NULL,
+            correct_result INTEGER NOT NULL,
+            correct_goal_diff INTEGER NOT NULL,
+            correct_tendency INTEGER NOT NULL,
+            rank INTEGER NOT NULL,
+            PRIMARY KEY (user_id, matchday)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX standings_history_matchday ON standings_history (matchday, rank)",
+        """
+        INSERT INTO standings_history (user_id, matchday, total_points, correct_result, correct_goal_diff, correct_tendency, rank)
+        SELECT user_id, matchday, total_points, correct_result, correct_goal_diff, correct_tendency,
+        RANK() OVER (PARTITION BY matchday ORDER BY total_points DESC, correct_result DESC, correct_goal_diff DESC, correct_tendency DESC)
+        FROM (
+            SELECT u.id AS user_id, m.matchday,
+            SUM(COALESCE(p.points, 0)) OVER running AS total_points,
+            SUM(COALESCE(p.points, 0) = 4) OVER running AS correct_result,
+            SUM(COALESCE(p.points, 0) = 3) OVER running AS correct_goal_diff,
+            SUM(COALESCE(p.points, 0) = 2) OVER running AS correct_tendency
+            FROM FCH_matches AS m
+            CROSS JOIN users AS u
+            LEFT JOIN predictions AS p ON p.user_id = u.id AND p.match_id = m.id
+            WHERE m.predictions_evaluated = 1
+            WINDOW running AS (PARTITION BY u.id ORDER BY m.matchday)
+        )
+        """,
+    ],
+    # 8: Bundesliga table after every matchday (see helpers.update_league_table) and the time of the last league table sync
+    [
+        """
+        CREATE TABLE league_table_history (
+            matchday INTEGER NOT NULL,
+            team_id INTEGER NOT NULL REFERENCES teams (id),
+            rank INTEGER NOT NULL,
+            points INTEGER NOT NULL,
+            goals INTEGER NOT NULL,
+            opponentGoals INTEGER NOT NULL,
+            matches INTEGER NOT NULL,
+            won INTEGER NOT NULL,
+            draw INTEGER NOT NULL,
+            lost INTEGER NOT NULL,
+            PRIMARY KEY (matchday, team_id)
+        ) WITHOUT ROWID
+        """,
+        """
+        INSERT INTO league_table_history (matchday, team_id, rank, points, goals, opponentGoals, matches, won, draw, lost)
+        SELECT (SELECT MAX(matches) FROM teams), id, rank, points, goals, opponentGoals, matches, won, draw, lost
+        FROM teams
+        WHERE rank IS NOT NULL
+        """,
+        "ALTER TABLE data_versions ADD COLUMN synced DATETIME",
+        "UPDATE data_versions SET synced = (SELECT MAX(lastUpdateTime) FROM teams) WHERE name = 'league_table'",
+    ],
+    # 9: Kickoff and last update of the matches as seconds since the epoch (compared as numbers, see helpers.to_timestamp).
+    # The ISO columns stay as they come from OpenLigaDB, the time of the last league table sync becomes a number as well
+    [
+        "ALTER TABLE FCH_matches ADD COLUMN kickoff INTEGER",
+        "ALTER TABLE FCH_matches ADD COLUMN last_update INTEGER",
+        """
+        UPDATE FCH_matches SET
+        kickoff = CAST(strftime('%s', matchDateTime, 'utc') AS INTEGER),
+        last_update = CAST(strftime('%s', substr(lastUpdateDateTime, 1, 19), 'utc') AS INTEGER)
+        """,
+        "UPDATE data_versions SET synced = CAST(strftime('%s', substr(synced, 1, 19), 'utc') AS INTEGER) WHERE synced IS NOT NULL",
+        "DROP INDEX FCH_matches_finished_datetime",
+        "DROP INDEX FCH_matches_datetime",
+        "DROP INDEX FCH_matches_last_update",
+        "CREATE INDEX FCH_matches_finished_kickoff ON FCH_matches (matchIsFinished, kickoff)",
+        "CREATE INDEX FCH_matches_kickoff ON FCH_matches (kickoff)",
+        "CREATE INDEX FCH_matches_last_update ON FCH_matches (last_update)",
+    ],
+    # 10: The ranking index in the exact ranking order (ties by id), so that a page of the ranking is one index search
+    # from any position (keyset pagination, see helpers.get_rangliste_page_data) and the standings need no sorting
+    [
+        "DROP INDEX users_ranking",
+        "CREATE INDEX users_ranking ON users (total_points DESC, correct_result DESC, correct_goal_diff DESC, correct_tendency DESC, id)",
+    ],
+    # 11: Counted up whenever the user saves predictions, so that pages showing the own tips don't depend on everybody's
+    # (the predictions data version changes with every tip of anyone)
+    [
+        "ALTER TABLE users ADD COLUMN predictions_version INTEGER NOT NULL DEFAULT 0",
+    ],
+    # 12: The latest live state (see live.py), written by the one process that polls OpenLigaDB and read by all others
+    [
+        """
+        CREATE TABLE live_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            state TEXT NOT NULL
+        )
+        """,
+        """INSERT INTO live_state (id, state) VALUES (1, '{"match_id": null}')""",
+    ],
+]
+
+
+def get_schema_version():
+    return db.execute("SELECT user_version FROM pragma_user_version")[0]["user_version"]
+
+
+def migrate():
+    """ Apply all migrations the database does not have yet, each one in its own transaction """
+    version = get_schema_version()
+
+    for number, statements in enumerate(migrations, start=1):
+        if number <= version:
+            continue
+
+        with db.transaction():
+            # Another process (worker, scoring.py) may have applied it while this one waited for the write lock
+            if get_schema_version() >= number:
+                continue
+
+            logger.info("Migrating database to version %d...", number)
+            for statement in statements:
+                db.execute(statement)
+
+            db.execute(f"PRAGMA user_version = {number}")
@@ -0,0 +1,184 @@
+import json
+import os
+import random
+import threading
+import time
+import requests
+import metrics
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+
+# Base url of the OpenLigaDB API. Paths starting with "/" are resolved against it.
+# TIPPSPIEL_OPENLIGA_URL points the app at another server, e. g. tools/fake_openliga.py for offline tests
+base_url = os.environ.get("TIPPSPIEL_OPENLIGA_URL", "https://api.openligadb.de").rstrip("/")
+
+# Timeouts (connect, read) in seconds per endpoint (= first path segment of the url)
+timeouts = {
+    "getmatchdata": (3.05, 10),
+    "getbltable": (3.05, 10),
+    "getavailableteams": (3.05, 10),
+    "getcurrentgroup": (3.05, 5),
+    "getlastchangedate": (3.05, 5),
+}
+default_timeout = (3.05, 15)    # Everything else, e. g. downloading the team logos
+
+# Retries with exponential backoff and full jitter
+max_retries = 3
+backoff_base = 0.5
+backoff_max = 8
+retry_statuses = {429, 500, 502, 503, 504}
+
+# Headers that are sent with every request
+default_headers = {"Accept": "*/*", "User-Agent": "python-requests"}
+
+# Shared session so that connections are kept alive and reused
+session = requests.Session()
+session.headers.update(default_headers)
+session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+# Validators and raw content of the last successful response per url, used for conditional requests
+_revalidation_cache = {}
+
+# Counters per endpoint
+_stats = {}
+_lock = threading.Lock()
+
+
+def make_url(url):
+    if url.startswith("/"):
+        return base_url + url
+
+    return url
+
+
+def get_endpoint(url):
+    """ Name used for timeouts and counters, e. g. "getmatchdata" for https://api.openligadb.de/getmatchdata/66635 """
+    parts = urlsplit(url)
+
+    if make_url("/") != f"{parts.scheme}://{parts.netloc}/":
+        return parts.netloc
+
+    return parts.path.strip("/").split("/")[0]
+
+
+def _count(endpoint, **values):
+    with _lock:
+        counters = _stats.setdefault(endpoint, {
+            "calls": 0,
+            "not_modified": 0,
+            "retries": 0,
+            "errors": 0,
+            "bytes": 0,
+            "latency_seconds": 0.0,
+        })
+
+        for key, value in values.items():
+            counters[key] += value
+
+
+def get_stats():
+    """ Copy of the counters per endpoint (calls, not_modified, retries, errors, bytes, latency_seconds) """
+    with _lock:
+        return {endpoint: dict(counters) for endpoint, counters in _stats.items()}
+
+
+def reset():
+    """ Forget the counters and the cached validators """
+    with _lock:
+        _stats.clear()
+        _revalidation_cache.clear()
+
+
+def _backoff(attempt, response=None):
+    # Respect the server's wish if it tells us how long to wait
+    if response is not None and response.headers.get("Retry-After", "").isdigit():
+        return min(int(response.headers["Retry-After"]), backoff_max)
+
+    return random.uniform(0, min(backoff_max, backoff_base * 2 ** attempt))
+
+
+def request(url, headers=None, **kwargs):
+    """
+    GET url with the shared session, the endpoint's timeout and retries for connection errors
+    and 429/5xx responses. Raises requests.RequestException when all attempts failed.
+    """
+    url = make_url(url)
+    endpoint = get_endpoint(url)
+    timeout = timeouts.get(endpoint, default_timeout)
+
+    for attempt in range(max_retries + 1):
+        start = time.perf_counter()
+
+        try:
+            response = session.get(url, headers=headers, timeout=timeout, **kwargs)
+
+        except (requests.ConnectionError, requests.Timeout):
+            _count(endpoint, calls=1, errors=1, latency_seconds=time.perf_counter() - start)
+            metrics.observe("openliga_request_duration_seconds", time.perf_counter() - start, endpoint=endpoint)
+
+            if attempt == max_retries:
+                raise
+
+            _count(endpoint, retries=1)
+            time.sleep(_backoff(attempt))
+            continue
+
+        _count(endpoint, calls=1, bytes=len(response.content), latency_seconds=time.perf_counter() - start)
+        metrics.observe("openliga_request_duration_seconds", time.perf_counter() - start, endpoint=endpoint)
+
+        if response.status_code in retry_statuses:
+            _count(endpoint, errors=1)
+
+            if attempt < max_retries:
+                _count(endpoint, retries=1)
+                time.sleep(_backoff(attempt, response))
+                continue
+
+        if response.status_code >= 400:
+            if response.status_code not in retry_statuses:
+                _count(endpoint, errors=1)
+            response.raise_for_status()
+
+        return response
+
+
+def get_json(url):
+    """
+    Parsed JSON of url. Revalidates with ETag/If-Modified-Since, so that an unchanged
+    payload only costs a 304 response. Raises requests.RequestException or ValueError on failure.
+    """
+    url = make_url(url)
+
+    with _lock:
+        cached = _revalidation_cache.get(url)
+
+    headers = {}
+    if cached:
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    response = request(url, headers=headers)
+
+    if response.status_code == 304 and cached:
+        _count(get_endpoint(url), not_modified=1)
+        return json.loads(cached["content"])
+
+    payload = response.json()
+
+    # Only remember responses the server can revalidate
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+
+    if etag or last_modified:
+        with _lock:
+            _revalidation_cache[url] = {"etag": etag, "last_modified": last_modified, "content": response.content}
+
+    return payload
+
+
+def get_content(url, **kwargs):
+    """ Raw bytes of url (e. g. an image), fetched through the shared session """
+    return request(url, **kwargs).content
@@ -0,0 +1,128 @@
+import contextlib
+import cProfile
+import os
+import pstats
+import random
+import re
+import threading
+import time
+
+# Opt-in profiling of single requests (and background syncs) with cProfile. Off unless TIPPSPIEL_PROFILE=1; then a
+# request is profiled if an admin adds ?profile=1 or it is picked by the sample rate. Profiles of runs slower than the
+# threshold (explicitly requested ones always) are saved to profile_dir, only the newest max_profiles are kept.
+# /admin/profiles lists them with their hottest functions. When off, no hook is installed at all
+enabled = os.environ.get("TIPPSPIEL_PROFILE", "0") == "1"
+sample_rate = float(os.environ.get("TIPPSPIEL_PROFILE_SAMPLE_RATE", "0"))       # Share of requests profiled without ?profile=1
+slow_threshold = float(os.environ.get("TIPPSPIEL_PROFILE_THRESHOLD", "0.5"))   # Seconds
+profile_dir = "profiles"
+max_profiles = 50
+
+# cProfile can only run once at a time (Python 3.12+ allows one profiler per process), others run unprofiled
+_lock = threading.Lock()
+
+
+def is_sampled():
+    return sample_rate > 0 and random.random() < sample_rate
+
+
+@contextlib.contextmanager
+def profiled(name, force=False):
+    """
+    with profiled("GET /rangliste"): ... runs the block under cProfile (if nobody else is profiled right now).
+    The profile is saved if the block took longer than slow_threshold, or always with force
+    """
+    if not _lock.acquire(blocking=False):
+        yield
+        return
+
+    profile = cProfile.Profile()
+    start = time.perf_counter()
+
+    try:
+        profile.enable()
+        yield
+    finally:
+        profile.disable()
+        duration = time.perf_counter() - start
+
+        try:
+            if force or duration >= slow_threshold:
+                save(profile, name, duration)
+        finally:
+            _lock.release()
+
+
+class Profiled:
+    """ Same as profiled(), for a start and a stop that happen in different functions (Flask's before/after_request) """
+
+    def __init__(self, name, force=False):
+        self._context = profiled(name, force)
+        self._context.__enter__()
+
+    def stop(self):
+        self._context.__exit__(None, None, None)
+
+
+def save(profile, name, duration):
+    os.makedirs(profile_dir, exist_ok=True)
+
+    # Sortable by time, name and duration readable from the file name
+    now = time.time()
+    stamp = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}.{int(now % 1 * 1000):03d}"
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_")
+    path = os.path.join(profile_dir, f"{stamp}-{round(duration * 1000)}ms-{slug}.prof")
+    profile.dump_stats(path)
+
+    # Rotate: only keep the newest profiles
+    for old in list_profiles()[max_profiles:]:
+        os.remove(os.path.join(profile_dir, old["file"]))
+
+
+def list_profiles():
+    """ Saved profiles, newest first, as dicts with file, time, duration_ms and name """
+    if not os.path.isdir(profile_dir):
+        return []
+
+    profiles = []
+    for file in os.listdir(profile_dir):
+        match = re.fullmatch(r"(\d{8}-\d{6}\.\d{3})-(\d+)ms-(.*)\.prof", file)
+
+        if match:
+            profiles.append({"file": file, "time": match[1], "duration_ms": int(match[2]), "name": match[3]})
+
+    return sorted(profiles, key=lambda profile: profile["file"], reverse=True)
+
+
+def get_short_path(filename):
+    """ Path relative to the app or to site-packages ("" for built-ins, which cProfile files under "~") """
+    if filename == "~":
+        return ""
+    if "site-packages" in filename:
+        return filename.split("site-packages" + os.sep, 1)[-1]
+    if filename.startswith(os.getcwd()):
+        return os.path.relpath(filename)
+    return filename
+
+
+def get_hot_functions(files, limit=30, sort="tottime"):
+    """ Top functions of the given profiles (added up) as dicts, sorted by own time (tottime) or cumulative time """
+    paths = [os.path.join(profile_dir, os.path.basename(file)) for file in files]
+    paths = [path for path in paths if os.path.isfile(path)]
+
+    if not paths:
+        return []
+
+    stats = pstats.Stats(*paths)
+    functions = []
+
+    for (filename, line, function), (_, calls, tottime, cumtime, _) in stats.stats.items():
+        functions.append({
+            "function": function,
+            "location": f"{get_short_path(filename)}:{line}" if line else get_short_path(filename),
+            "calls": calls,
+            "tottime_ms": round(tottime * 1000, 2),
+            "cumtime_ms": round(cumtime * 1000, 2),
+        })
+
+    key = "cumtime_ms" if sort == "cumtime" else "tottime_ms"
+    return sorted(functions, key=lambda function: function[key], reverse=True)[:limit]
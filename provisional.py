@@ -0,0 +1,99 @@
+import numpy as np
+from cache import get_cached
+from database import db
+from helpers import get_data_versions
+from scoring import points_result, points_goal_diff, points_tendency
+
+# Provisional standings while a match is live: "if it ends like this, the table looks like this".
+# The predictions for the match and the current totals are loaded once into arrays (per ranking version), every
+# hypothetical score is then scored for all users in one vectorized pass and re-ranked with one sort.
+
+# Users in the standings of /live/standings (?limit= up to the maximum)
+standings_size = 20
+max_standings_size = 200
+
+
+def load_match(match_id):
+    """ Totals of all users (without the match) and their predictions for the match, as numpy arrays """
+    users = db.execute("""
+                       -- full scan: the provisional standings include all users
+                       SELECT u.id, u.username, u.total_points, u.correct_result, u.correct_goal_diff, u.correct_tendency,
+                       p.team1_score, p.team2_score, p.goal_diff, p.winner, COALESCE(p.points, 0) AS points
+                       FROM users AS u
+                       LEFT JOIN predictions AS p ON p.user_id = u.id AND p.match_id = ?
+                       """, match_id)
+
+    def column(name, fill=0):
+        return np.array([fill if user[name] is None else user[name] for user in users], dtype=np.int64)
+
+    points = column("points")
+
+    # Take back points the match already gave (if a result was evaluated and then reopened)
+    return {
+        "id": column("id"),
+        "username": [user["username"] for user in users],
+        "total_points": column("total_points") - points,
+        "correct_result": column("correct_result") - (points == points_result),
+        "correct_goal_diff": column("correct_goal_diff") - (points == points_goal_diff),
+        "correct_tendency": column("correct_tendency") - (points == points_tendency),
+        "predicted": np.array([user["team1_score"] is not None for user in users]),
+        "team1_score": column("team1_score", -1),
+        "team2_score": column("team2_score", -1),
+        "goal_diff": column("goal_diff"),
+        "winner": column("winner", -1),
+    }
+
+
+def score(match, team1_score, team2_score):
+    """ Points of every user's prediction (0 without one) if the match ends team1_score:team2_score """
+    winner = 1 if team1_score > team2_score else 2 if team1_score < team2_score else 0
+
+    result = (match["team1_score"] == team1_score) & (match["team2_score"] == team2_score)
+    goal_diff = match["predicted"] & (match["goal_diff"] == team1_score - team2_score)
+    tendency = match["winner"] == winner
+
+    return np.select([result, goal_diff, tendency], [points_result, points_goal_diff, points_tendency], 0)
+
+
+def rank(total_points, correct_result, correct_goal_diff, correct_tendency, ids):
+    """ Order (indices) and shared ranks, same rule as scoring.update_standings """
+    order = np.lexsort((ids, -correct_tendency, -correct_goal_diff, -correct_result, -total_points))
+    keys = np.stack([total_points, correct_result, correct_goal_diff, correct_tendency])[:, order]
+
+    # A new rank starts wherever one of the four numbers differs from the row before
+    starts = np.ones(len(order), dtype=bool)
+    starts[1:] = (keys[:, 1:] != keys[:, :-1]).any(axis=0)
+    ranks = np.maximum.accumulate(np.where(starts, np.arange(1, len(order) + 1), 0))
+
+    return order, ranks
+
+
+def get_provisional_standings(match_id, team1_score, team2_score, limit=None, user_id=None):
+    """
+    Standings as if match_id ended team1_score:team2_score: {"standings": [first limit users (all if None)],
+    "user": user_id's entry or None}. An entry has rank, id, username, provisional total_points and the points of the match
+    """
+    # Tips for the match are closed from kickoff on, so only scoring and new users change what is loaded
+    match = get_cached(("provisional", match_id), get_data_versions()["ranking"], lambda: load_match(match_id))
+
+    points = score(match, team1_score, team2_score)
+    total_points = match["total_points"] + points
+    order, ranks = rank(total_points,
+                        match["correct_result"] + (points == points_result),
+                        match["correct_goal_diff"] + (points == points_goal_diff),
+                        match["correct_tendency"] + (points == points_tendency),
+                        match["id"])
+
+    # Only build the entries that are returned
+    def entry(position):
+        index = order[position]
+        return {"rank": int(ranks[position]), "id": int(match["id"][index]), "username": match["username"][index],
+                "total_points": int(total_points[index]), "points": int(points[index])}
+
+    user = None
+    if user_id is not None:
+        positions = np.flatnonzero(match["id"][order] == user_id)
+        user = entry(positions[0]) if len(positions) else None
+
+    return {"standings": [entry(position) for position in range(len(order) if limit is None else min(limit, len(order)))],
+            "user": user}
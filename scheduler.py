@@ -0,0 +1,179 @@
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from helpers import is_update_needed_league_table, update_league_table, is_update_needed_FCH_matches, update_FCH_matches_db, get_next_match
+from scoring import update_user_scores
+from title_odds import is_update_needed_title_odds, update_title_odds
+from database import database_path
+import metrics
+import profiler
+
+try:
+    import fcntl
+except ImportError:     # Windows: a single process is assumed
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Poll intervals (in seconds) for the different phases of the season
+interval_live = 60              # Shortly before kickoff until some time after the final whistle
+interval_matchday = 15 * 60     # On days with a FCH match, outside of the live window
+interval_idle = 6 * 60 * 60     # On days without a FCH match (other Bundesliga matches still change the table)
+interval_retry = 5 * 60         # After a failed sync
+interval_corrections = 24 * 60 * 60    # Compare every match of the season to catch late corrections of results
+
+# Time windows around a match in which the live interval is used
+match_duration = timedelta(minutes=90+15+10)
+window_before_kickoff = timedelta(minutes=15)
+window_after_full_time = timedelta(minutes=45)     # OpenLigaDB usually confirms the final result within that time
+
+# Every process of the app imports app.py (several workers, the debug reloader), but only one may sync and poll the
+# live match: the one holding an exclusive lock on this file (next to the database). The other processes wait for the
+# lock, so one of them takes over when that process ends
+sync_lock_path = database_path + ".sync-lock"
+
+# State of the background thread
+_stop_event = threading.Event()
+_thread = None
+_thread_lock = threading.Lock()
+_last_correction_check = None
+_sync_lock_file = None      # Kept open for as long as the process runs, closing it would release the lock
+
+
+def run_sync():
+    """ Update league table, FCH matches, user scores and title odds if there is new data. Returns False if a step failed """
+    global _last_correction_check
+    success = True
+
+    try:
+        with metrics.timed("sync_duration_seconds", step="league_table"):
+            if is_update_needed_league_table():
+                logger.info("Sync: updating league table...")
+                update_league_table()
+
+    except Exception:
+        logger.exception("Sync: updating league table failed")
+        metrics.increment("sync_failures_total", step="league_table")
+        success = False
+
+    try:
+        with metrics.timed("sync_duration_seconds", step="matches"):
+            now = datetime.now()
+            check_all = _last_correction_check is None or now - _last_correction_check >= timedelta(seconds=interval_corrections)
+
+            if check_all or is_update_needed_FCH_matches():
+                logger.info("Sync: updating FCH matches...")
+                update_FCH_matches_db(check_all=check_all)
+
+                if check_all:
+                    _last_correction_check = now
+
+    except Exception:
+        logger.exception("Sync: updating fch matches failed")
+        metrics.increment("sync_failures_total", step="matches")
+        success = False
+
+    # Every run, not only after new match data: if scoring failed after the matches were written, the next run would
+    # find nothing new and the match would stay unscored. Without an unscored match it is one query on an index
+    try:
+        with metrics.timed("sync_duration_seconds", step="scoring"):
+            update_user_scores()
+
+    except Exception:
+        logger.exception("Sync: scoring failed")
+        metrics.increment("sync_failures_total", step="scoring")
+        success = False
+
+    try:
+        with metrics.timed("sync_duration_seconds", step="title_odds"):
+            if is_update_needed_title_odds():
+                logger.info("Sync: updating title odds...")
+                update_title_odds()
+
+    except Exception:
+        logger.exception("Sync: updating title odds failed")
+        metrics.increment("sync_failures_total", step="title_odds")
+        success = False
+
+    return success
+
+
+def get_poll_interval(now):
+    """ Seconds until the next sync, based on how close the next (or running) FCH match is """
+    # Earliest match that has not yet left the live window (running, just finished or upcoming)
+    match = get_next_match((now - match_duration - window_after_full_time).timestamp())
+
+    # Season is over, nothing to watch closely
+    if not match:
+        return interval_idle
+
+    kickoff = datetime.fromtimestamp(match["kickoff"])
+    live_window_start = kickoff - window_before_kickoff
+
+    if live_window_start <= now:
+        return interval_live
+
+    seconds_to_live_window = (live_window_start - now).total_seconds()
+
+    # On matchdays poll regularly, otherwise back off (but wake up in time for the live window)
+    if kickoff.date() == now.date():
+        return min(interval_matchday, seconds_to_live_window)
+
+    return min(interval_idle, seconds_to_live_window)
+
+
+def _run():
+    while not _stop_event.is_set():
+        if profiler.enabled:
+            with profiler.profiled("sync"):
+                success = run_sync()
+        else:
+            success = run_sync()
+
+        try:
+            interval = get_poll_interval(datetime.now()) if success else interval_retry
+        except Exception:
+            logger.exception("Sync: computing poll interval failed")
+            interval = interval_retry
+
+        logger.info("Sync: next run in %d s", round(interval))
+        _stop_event.wait(max(interval, 1))
+
+
+def start_scheduler():
+    """ Start the background sync thread (only once per process) """
+    global _thread
+
+    with _thread_lock:
+        if _thread and _thread.is_alive():
+            return
+
+        _stop_event.clear()
+        _thread = threading.Thread(target=_run, name="openliga-sync", daemon=True)
+        _thread.start()
+
+
+def run_in_one_process(*functions):
+    """ Call functions (e. g. start_scheduler) once this process holds the sync lock, from a thread that waits for it """
+    def wait():
+        global _sync_lock_file
+
+        if fcntl:
+            lock_file = open(sync_lock_path, "w")
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            _sync_lock_file = lock_file
+
+        logger.info("Sync: process %d runs the background sync", os.getpid())
+
+        for function in functions:
+            function()
+
+    threading.Thread(target=wait, name="sync-lock", daemon=True).start()
+
+
+def stop_scheduler():
+    _stop_event.set()
+
+    if _thread:
+        _thread.join(timeout=10)
@@ -0,0 +1,349 @@
+import argparse
+import logging
+from database import db
+from helpers import bump_data_version, get_current_datetime
+from migrations import migrate
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Points per prediction
+points_result = 4       # Correct result
+points_goal_diff = 3    # Correct goal difference
+points_tendency = 2     # Correct winner / draw
+
+# Number of predictions handled at once by recompute_all()
+recompute_chunk_size = 50000
+
+
+def update_user_scores():
+    """
+    Evaluate every finished match that has not been evaluated yet. This includes matches whose result
+    was corrected after the evaluation (update_match_in_db resets predictions_evaluated for them)
+    """
+    matches = db.execute("""
+                         SELECT id, team1_score, team2_score, matchIsFinished FROM FCH_matches
+                         WHERE predictions_evaluated = 0
+                         AND (matchIsFinished = 1 OR evaluation_Date IS NOT NULL)
+                         """)
+
+    for match in matches:
+        if match["matchIsFinished"] == 1:
+            score_match(match["id"], match["team1_score"], match["team2_score"])
+
+        # A result that was evaluated before is no longer final, take its points back
+        else:
+            score_match(match["id"], None, None)
+
+
+def update_standings():
+    """
+    Bring the standings table in line with the users' totals. One rule for the whole app: more points first, then more
+    correct results, goal differences and tendencies. Users that are equal in all four share a rank, their position
+    (the order of the rows) goes by registration. Only rows whose position or rank changed are written
+    """
+    db.execute("""
+               -- full scan: the standings are sorted from all users
+               INSERT INTO standings (user_id, position, rank)
+               SELECT id,
+               ROW_NUMBER() OVER (ORDER BY total_points DESC, correct_result DESC, correct_goal_diff DESC, correct_tendency DESC, id),
+               RANK() OVER (ORDER BY total_points DESC, correct_result DESC, correct_goal_diff DESC, correct_tendency DESC)
+               FROM users
+               WHERE true
+               ON CONFLICT (user_id) DO UPDATE SET position = excluded.position, rank = excluded.rank
+               WHERE position != excluded.position OR rank != excluded.rank
+               """)
+
+
+def add_to_standings(user_id):
+    """
+    Give a new user (no points yet and the highest id) the last place in the standings, without re-sorting everybody:
+    the rank is shared with the last user if that one has no points either, otherwise it is the new position
+    """
+    last = db.execute("""
+                      SELECT s.position, s.rank,
+                      u.total_points + u.correct_result + u.correct_goal_diff + u.correct_tendency = 0 AS empty
+                      FROM standings AS s
+                      JOIN users AS u ON u.id = s.user_id
+                      ORDER BY s.position DESC
+                      LIMIT 1
+                      """)
+
+    position = last[0]["position"] + 1 if last else 1
+    rank = last[0]["rank"] if last and last[0]["empty"] else position
+
+    db.execute("INSERT INTO standings (user_id, position, rank) VALUES (?, ?, ?)", user_id, position, rank)
+
+
+def get_points_case(team1_score, team2_score):
+    """ SQL CASE expression (and its arguments) for the points of a prediction, 0 for every prediction if there is no result """
+    if team1_score is None or team2_score is None:
+        return "0", []
+
+    goal_diff = team1_score - team2_score
+    winner = 1 if team1_score > team2_score else 2 if team1_score < team2_score else 0
+
+    case = """
+           CASE
+               WHEN team1_score = ? AND team2_score = ? THEN ?
+               WHEN goal_diff = ? THEN ?
+               WHEN winner = ? THEN ?
+               ELSE 0
+           END
+           """
+
+    return case, [team1_score, team2_score, points_result, goal_diff, points_goal_diff, winner, points_tendency]
+
+
+def score_match(match_id, team1_score, team2_score):
+    """
+    Award the points for one match and apply the difference to the users' totals.
+    The points the predictions got before (0 if the match was never evaluated) are taken back first, so this also
+    handles corrected results. Only the predictions for this match are read and only users whose points changed are written.
+    Without a result (team1_score and team2_score None) all points of the match are taken back.
+    """
+    points_case, points_args = get_points_case(team1_score, team2_score)
+
+    with metrics.timed("scoring_duration_seconds"), db.transaction():
+        # Apply old -> new difference to the users that predicted the match
+        changed_users = db.execute(f"""
+                   UPDATE users SET
+                   total_points = users.total_points + delta.points,
+                   correct_result = users.correct_result + delta.correct_result,
+                   correct_goal_diff = users.correct_goal_diff + delta.correct_goal_diff,
+                   correct_tendency = users.correct_tendency + delta.correct_tendency
+                   FROM (
+                       SELECT user_id,
+                       SUM(new_points - old_points) AS points,
+                       SUM(new_points = ?) - SUM(old_points = ?) AS correct_result,
+                       SUM(new_points = ?) - SUM(old_points = ?) AS correct_goal_diff,
+                       SUM(new_points = ?) - SUM(old_points = ?) AS correct_tendency
+                       FROM (
+                           SELECT user_id, COALESCE(points, 0) AS old_points, {points_case} AS new_points
+                           FROM predictions
+                           WHERE match_id = ?
+                       )
+                       GROUP BY user_id
+                       HAVING SUM(new_points != old_points) > 0
+                   ) AS delta
+                   WHERE users.id = delta.user_id
+                   """,
+                   points_result, points_result, points_goal_diff, points_goal_diff, points_tendency, points_tendency,
+                   *points_args, match_id)
+
+        if changed_users:
+            update_standings()
+
+        # Same difference for the history (before the predictions get their new points, it reads the old ones)
+        update_history(match_id, team1_score, team2_score)
+
+        # Points for all predictions of the match in one statement
+        db.execute(f"UPDATE predictions SET points = {points_case} WHERE match_id = ?", *points_args, match_id)
+
+        # Switch predictions_evaluated to 1 for the match, so that next time, only the not evaluated matches get evaluated
+        if team1_score is None:
+            db.execute("UPDATE FCH_matches SET predictions_evaluated = 0, evaluation_Date = NULL WHERE id = ?", match_id)
+        else:
+            db.execute("UPDATE FCH_matches SET predictions_evaluated = 1, evaluation_Date = ? WHERE id = ?", get_current_datetime(), match_id)
+
+        bump_data_version("ranking")
+
+
+def update_history(match_id, team1_score, team2_score):
+    """
+    Keep standings_history in line with a match getting the points for team1_score:team2_score (None: taken back).
+    Call after the users' totals and the standings were updated, but before the predictions get their new points.
+    A matchday whose result was taken back is removed. For the latest matchday (the usual case) the row of each user is a
+    copy of the current totals and standings. Otherwise (a corrected or postponed match) the matchday starts as a copy of
+    the latest matchday before it, every later matchday changes by the same difference and those matchdays are re-ranked
+    """
+    points_case, points_args = get_points_case(team1_score, team2_score)
+    evaluated = team1_score is not None
+    matchday = db.execute("SELECT matchday FROM FCH_matches WHERE id = ?", match_id)[0]["matchday"]
+    later = db.execute("SELECT 1 FROM standings_history WHERE matchday > ? LIMIT 1", matchday)
+
+    if not later:
+        if evaluated:
+            db.execute("""
+                       -- full scan: every user gets a row for the matchday
+                       INSERT INTO standings_history (user_id, matchday, total_points, correct_result, correct_goal_diff, correct_tendency, rank)
+                       SELECT u.id, ?, u.total_points, u.correct_result, u.correct_goal_diff, u.correct_tendency, s.rank
+                       FROM users AS u
+                       JOIN standings AS s ON s.user_id = u.id
+                       WHERE true
+                       ON CONFLICT (user_id, matchday) DO UPDATE SET
+                       total_points = excluded.total_points, correct_result = excluded.correct_result,
+                       correct_goal_diff = excluded.correct_goal_diff, correct_tendency = excluded.correct_tendency, rank = excluded.rank
+                       WHERE rank != excluded.rank OR total_points != excluded.total_points OR correct_result != excluded.correct_result
+                       OR correct_goal_diff != excluded.correct_goal_diff OR correct_tendency != excluded.correct_tendency
+                       """, matchday)
+        else:
+            db.execute("DELETE FROM standings_history WHERE matchday = ?", matchday)
+        return
+
+    exists = db.execute("SELECT 1 FROM standings_history WHERE matchday = ? LIMIT 1", matchday)
+    added = evaluated and not exists
+
+    if added:
+        db.execute("""
+                   -- full scan: every user gets a row for the matchday
+                   INSERT INTO standings_history (user_id, matchday, total_points, correct_result, correct_goal_diff, correct_tendency, rank)
+                   SELECT u.id, ?, COALESCE(h.total_points, 0), COALESCE(h.correct_result, 0),
+                   COALESCE(h.correct_goal_diff, 0), COALESCE(h.correct_tendency, 0), 0
+                   FROM users AS u
+                   LEFT JOIN standings_history AS h ON h.user_id = u.id
+                   AND h.matchday = (SELECT MAX(matchday) FROM standings_history WHERE matchday < ?)
+                   """, matchday, matchday)
+
+    elif not evaluated and exists:
+        db.execute("DELETE FROM standings_history WHERE matchday = ?", matchday)
+
+    changed = db.execute(f"""
+                         UPDATE standings_history SET
+                         total_points = standings_history.total_points + delta.points,
+                         correct_result = standings_history.correct_result + delta.correct_result,
+                         correct_goal_diff = standings_history.correct_goal_diff + delta.correct_goal_diff,
+                         correct_tendency = standings_history.correct_tendency + delta.correct_tendency
+                         FROM (
+                             SELECT user_id,
+                             SUM(new_points - old_points) AS points,
+                             SUM(new_points = ?) - SUM(old_points = ?) AS correct_result,
+                             SUM(new_points = ?) - SUM(old_points = ?) AS correct_goal_diff,
+                             SUM(new_points = ?) - SUM(old_points = ?) AS correct_tendency
+                             FROM (
+                                 SELECT user_id, COALESCE(points, 0) AS old_points, {points_case} AS new_points
+                                 FROM predictions
+                                 WHERE match_id = ?
+                             )
+                             GROUP BY user_id
+                             HAVING SUM(new_points != old_points) > 0
+                         ) AS delta
+                         WHERE standings_history.user_id = delta.user_id AND standings_history.matchday >= ?
+                         """,
+                         points_result, points_result, points_goal_diff, points_goal_diff, points_tendency, points_tendency,
+                         *points_args, match_id, matchday)
+
+    if added or changed:
+        db.execute("""
+                   UPDATE standings_history SET rank = ranked.rank
+                   FROM (
+                       SELECT user_id, matchday,
+                       RANK() OVER (PARTITION BY matchday ORDER BY total_points DESC, correct_result DESC, correct_goal_diff DESC, correct_tendency DESC) AS rank
+                       FROM standings_history
+                       WHERE matchday >= ?
+                   ) AS ranked
+                   WHERE standings_history.user_id = ranked.user_id AND standings_history.matchday = ranked.matchday
+                   AND standings_history.rank != ranked.rank
+                   """, matchday)
+
+
+def rebuild_history():
+    """ Fill standings_history from the points of the predictions (recompute_all, same as migration 7) """
+    db.execute("""
+               -- full scan: rebuilt from scratch
+               DELETE FROM standings_history
+               """)
+    db.execute("""
+               -- full scan: running totals of every user over all evaluated matchdays
+               INSERT INTO standings_history (user_id, matchday, total_points, correct_result, correct_goal_diff, correct_tendency, rank)
+               SELECT user_id, matchday, total_points, correct_result, correct_goal_diff, correct_tendency,
+               RANK() OVER (PARTITION BY matchday ORDER BY total_points DESC, correct_result DESC, correct_goal_diff DESC, correct_tendency DESC)
+               FROM (
+                   SELECT u.id AS user_id, m.matchday,
+                   SUM(COALESCE(p.points, 0)) OVER running AS total_points,
+                   SUM(COALESCE(p.points, 0) = ?) OVER running AS correct_result,
+                   SUM(COALESCE(p.points, 0) = ?) OVER running AS correct_goal_diff,
+                   SUM(COALESCE(p.points, 0) = ?) OVER running AS correct_tendency
+                   FROM FCH_matches AS m
+                   CROSS JOIN users AS u
+                   LEFT JOIN predictions AS p ON p.user_id = u.id AND p.match_id = m.id
+                   WHERE m.predictions_evaluated = 1
+                   WINDOW running AS (PARTITION BY u.id ORDER BY m.matchday)
+               )
+               """, points_result, points_goal_diff, points_tendency)
+
+
+def recompute_all(chunk_size=recompute_chunk_size):
+    """
+    Recalculate the points of every prediction and the totals of every user from scratch (disaster recovery).
+    Predictions are processed in chunks of ids, so only the per-user totals are held in memory.
+    """
+    finished = db.execute("SELECT id, team1_score, team2_score FROM FCH_matches WHERE matchIsFinished = 1")
+    totals = {}     # user_id: [total_points, correct_result, correct_goal_diff, correct_tendency]
+
+    with db.transaction():
+        db.execute("""
+                   -- full scan: recompute starts from scratch
+                   UPDATE predictions SET points = 0
+                   """)
+
+        # Points per finished match (one set-based statement each)
+        for match in finished:
+            points_case, points_args = get_points_case(match["team1_score"], match["team2_score"])
+            db.execute(f"UPDATE predictions SET points = {points_case} WHERE match_id = ?", *points_args, match["id"])
+
+        # Sum up the points chunk by chunk
+        last_id = 0
+        while True:
+            rows = db.execute("""
+                              SELECT id, user_id, points FROM predictions
+                              WHERE id > ?
+                              ORDER BY id
+                              LIMIT ?
+                              """, last_id, chunk_size)
+
+            if not rows:
+                break
+
+            for row in rows:
+                user_totals = totals.setdefault(row["user_id"], [0, 0, 0, 0])
+                user_totals[0] += row["points"]
+                user_totals[1] += row["points"] == points_result
+                user_totals[2] += row["points"] == points_goal_diff
+                user_totals[3] += row["points"] == points_tendency
+
+            last_id = rows[-1]["id"]
+            logger.info("Recompute: %d predictions processed", last_id)
+
+        db.execute("""
+                   -- full scan: recompute starts from scratch
+                   UPDATE users SET total_points = 0, correct_result = 0, correct_goal_diff = 0, correct_tendency = 0
+                   """)
+
+        # One prepared statement for all users
+        db.executemany("UPDATE users SET total_points = ?, correct_result = ?, correct_goal_diff = ?, correct_tendency = ? WHERE id = ?",
+                       ((*user_totals, user_id) for user_id, user_totals in totals.items()))
+
+        db.execute("UPDATE FCH_matches SET predictions_evaluated = 1, evaluation_Date = ? WHERE matchIsFinished = 1", get_current_datetime())
+        db.execute("UPDATE FCH_matches SET predictions_evaluated = 0, evaluation_Date = NULL WHERE matchIsFinished = 0")
+        update_standings()
+        rebuild_history()
+        bump_data_version("ranking")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scoring maintenance. Run from the directory containing tippspiel.db")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    recompute_parser = subparsers.add_parser("recompute", help="re-evaluate predictions (by default all of them, from scratch)")
+    scope = recompute_parser.add_mutually_exclusive_group()
+    scope.add_argument("--all", action="store_true", help="recalculate every prediction and user total from scratch (the default)")
+    scope.add_argument("--pending", action="store_true", help="only evaluate the finished matches that were not evaluated yet, as the sync does")
+    recompute_parser.add_argument("--chunk-size", type=int, default=recompute_chunk_size)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    # The standings and history tables come from migrations
+    migrate()
+
+    if args.command == "recompute":
+        if args.pending:
+            update_user_scores()
+        else:
+            recompute_all(args.chunk_size)
+        print("Recompute finished.")
+
+
+if __name__ == "__main__":
+    main()
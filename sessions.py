@@ -0,0 +1,127 @@
+import logging
+import secrets
+import threading
+import time
+from datetime import timedelta
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+from database import db
+
+logger = logging.getLogger(__name__)
+
+# Server-side sessions in the sessions table of tippspiel.db (instead of one file per session in flask_session/).
+# The cookie only holds a random session id
+
+# A session is dropped after this long without a request
+session_ttl = timedelta(days=7)
+
+# The expiry is only pushed back (= written) once less than this is left, not on every request
+session_refresh_after = session_ttl / 2
+
+# Expired sessions are deleted by a background thread this often (in seconds)
+sweep_interval = 60 * 60
+
+_serializer = TaggedJSONSerializer()
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+class SQLiteSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, expires=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires = expires
+        self.new = new
+        self.modified = False
+
+
+class SQLiteSessionInterface(SessionInterface):
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+
+        if sid:
+            row = db.execute("SELECT data, expires FROM sessions WHERE id = ? AND expires > ?", sid, time.time())
+
+            if row:
+                return SQLiteSession(_serializer.loads(row[0]["data"]), sid=sid, expires=row[0]["expires"])
+
+        return SQLiteSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def regenerate(self, session):
+        """ Give session a new id and delete the row of the old one (on login, so that an id known before stays useless) """
+        if not session.new:
+            db.execute("DELETE FROM sessions WHERE id = ?", session.sid)
+
+        session.sid = secrets.token_urlsafe(32)
+        session.expires = None
+        session.new = True
+        session.modified = True
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        # Emptied session (e. g. logout): forget it on both sides
+        if not session:
+            if session.modified and not session.new:
+                db.execute("DELETE FROM sessions WHERE id = ?", session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = time.time()
+        needs_refresh = session.expires is not None and session.expires - now < session_refresh_after.total_seconds()
+
+        if not (session.modified or needs_refresh):
+            return
+
+        db.execute("""
+                   INSERT INTO sessions (id, data, expires) VALUES(?, ?, ?)
+                   ON CONFLICT (id) DO UPDATE SET data = excluded.data, expires = excluded.expires
+                   """, session.sid, _serializer.dumps(dict(session)), now + session_ttl.total_seconds())
+
+        response.set_cookie(name, session.sid,
+                            expires=self.get_expiration_time(app, session),
+                            httponly=self.get_cookie_httponly(app),
+                            domain=domain,
+                            path=path,
+                            secure=self.get_cookie_secure(app),
+                            samesite=self.get_cookie_samesite(app))
+
+
+def sweep_sessions():
+    """ Delete expired sessions, returns how many """
+    return db.execute("DELETE FROM sessions WHERE expires <= ?", time.time())
+
+
+def _sweep():
+    while True:
+        try:
+            deleted = sweep_sessions()
+
+            if deleted:
+                logger.info("Sessions: %d expired sessions deleted", deleted)
+
+        except Exception:
+            logger.exception("Sessions: sweeping failed")
+
+        finally:
+            db.release()
+
+        time.sleep(sweep_interval)
+
+
+def init_app(app):
+    """ Use the sessions table for app's sessions and start sweeping expired ones (once per process) """
+    global _sweeper
+
+    app.session_interface = SQLiteSessionInterface()
+
+    with _sweeper_lock:
+        if _sweeper is None:
+            _sweeper = threading.Thread(target=_sweep, name="session-sweeper", daemon=True)
+            _sweeper.start()
@@ -0,0 +1,55 @@
+// Live score of the running match on the ranking page. The server pushes the score and the points every
+// predicted score would get right now (Server-Sent Events, see live.py), this script puts them into the table.
+(function () {
+    const table = document.getElementById("rangliste");
+
+    if (!table || !window.EventSource) {
+        return;
+    }
+
+    // The browser reconnects by itself after a dropped connection, but not after an error response
+    // (503: too many open streams on the server), then it tries again a minute later
+    function connect() {
+        const events = new EventSource("/live");
+        events.addEventListener("score", update);
+        events.addEventListener("error", function () {
+            if (events.readyState === EventSource.CLOSED) {
+                setTimeout(connect, 60 * 1000);
+            }
+        });
+    }
+
+    function update(event) {
+        const state = JSON.parse(event.data);
+
+        if (!state.match_id) {
+            return;
+        }
+
+        const header = table.querySelector('[data-match-id="' + state.match_id + '"]');
+
+        if (!header) {
+            return;
+        }
+
+        header.textContent = state.team1_score + ":" + state.team2_score;
+        header.classList.toggle("live-score", !state.finished);
+
+        // Cells of the match: position and name come first in every row
+        const column = Number(header.dataset.column) + 2;
+
+        for (const row of table.querySelectorAll("tbody tr")) {
+            const cell = row.cells[column];
+            const points = cell && cell.querySelector("sub");
+
+            if (!points) {
+                continue;
+            }
+
+            const prediction = cell.firstChild.textContent.trim();
+            points.textContent = prediction in state.points ? state.points[prediction] : "?";
+        }
+    }
+
+    connect();
+})();
@@ -0,0 +1,93 @@
+// Endless ranking: the page comes with the first rows, the next ones are loaded from /api/rangliste when the end of
+// the table scrolls into view. data-next of the table holds the cursor of the next page (empty after the last page).
+(function () {
+    const table = document.getElementById("rangliste");
+    const more = document.getElementById("rangliste-more");
+
+    if (!table || !more || !window.IntersectionObserver || !window.fetch) {
+        return;
+    }
+
+    const rows = table.tBodies[table.tBodies.length - 1];
+    let loading = false;
+
+    // Same cells as templates/rangliste_row.html
+    function addCell(row, text) {
+        const cell = row.insertCell();
+        cell.textContent = text;
+        return cell;
+    }
+
+    function addRow(user) {
+        const row = rows.insertRow();
+
+        if (String(user.id) === table.dataset.userId) {
+            row.className = "table-primary";
+        }
+
+        addCell(row, user.rank);
+        addCell(row, user.username);
+
+        for (const prediction of user.cells) {
+            if (!prediction) {
+                addCell(row, "-:-");
+                continue;
+            }
+
+            const cell = addCell(row, prediction[0] + ":" + prediction[1] + " ");
+            const points = document.createElement("sub");
+            points.textContent = prediction[2];
+            cell.appendChild(points);
+        }
+
+        addCell(row, user.correct_result);
+        addCell(row, user.correct_goal_diff);
+        addCell(row, user.correct_tendency);
+        addCell(row, user.total_points);
+    }
+
+    function load() {
+        if (loading || !table.dataset.next) {
+            return;
+        }
+
+        loading = true;
+        const query = new URLSearchParams({after: table.dataset.next, first: table.dataset.first, last: table.dataset.last});
+
+        fetch("/api/rangliste?" + query)
+            .then(function (response) {
+                if (!response.ok) {
+                    throw new Error(response.status);
+                }
+                return response.json();
+            })
+            .then(function (page) {
+                page.users.forEach(addRow);
+                table.dataset.next = page.next || "";
+                loading = false;
+
+                if (!page.next) {
+                    observer.disconnect();
+                    more.remove();
+                    return;
+                }
+
+                // Observe again: if the end is still in view (a tall window), the next page follows right away
+                observer.unobserve(more);
+                observer.observe(more);
+            })
+            .catch(function () {
+                loading = false;
+                more.textContent = "Weitere Tipper konnten nicht geladen werden.";
+            });
+    }
+
+    // Start loading a bit before the end is reached
+    const observer = new IntersectionObserver(function (entries) {
+        if (entries[0].isIntersecting) {
+            load();
+        }
+    }, {rootMargin: "400px"});
+
+    observer.observe(more);
+})();
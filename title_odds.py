@@ -0,0 +1,236 @@
+import argparse
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from database import db
+from helpers import get_data_versions, bump_data_version, get_current_timestamp
+from scoring import points_result, points_goal_diff, points_tendency
+
+# Title odds: how likely each user is to finish first, in the top 3 or in the top 10 at the end of the season.
+# The remaining FCH matches are played out many times with a Poisson goal model (expected goals from the goals and
+# opponentGoals of both teams in the league table). Every simulated season is scored for all users at once, the
+# iterations are split over a process pool. The result is stored in the title_odds table and recomputed by the
+# scheduler after a sync if scores or the league table changed, or if predictions changed and a match kicked off since.
+# Users without a prediction for a remaining match get 0 points for it (they might still predict it later).
+
+simulation_iterations = 20000
+simulation_cells = 2_000_000        # Max. iterations x users per step, bounds the memory of a worker (int32 matrices)
+simulation_workers = os.cpu_count() or 1
+default_goals = 1.5                 # Expected goals per team and match while the league table is still empty
+top_positions = (1, 3, 10)          # Columns of the title_odds table: first, top3, top10
+
+# The four numbers that decide the standings, packed into one integer per user (each count is below 64, the points
+# are at most 4 per match). Comparing the keys gives the same order and shared ranks as scoring.update_standings
+key_points, key_result, key_goal_diff, key_tendency = 64 ** 3, 64 ** 2, 64, 1
+
+# Versions and number of kicked off matches the stored odds were computed for (per process, the scheduler only
+# recomputes when they change)
+_computed_versions = None
+_computed_kicked_off = None
+
+
+def get_expected_goals(team, opponent, goals_per_team):
+    """ Expected goals of team against opponent: own attack times the opponent's defence, relative to the league average """
+    if not team["matches"] or not opponent["matches"] or not goals_per_team:
+        return default_goals
+
+    attack = team["goals"] / team["matches"] / goals_per_team
+    defence = opponent["opponentGoals"] / opponent["matches"] / goals_per_team
+    return max(attack * defence * goals_per_team, 0.05)
+
+
+def load_season():
+    """ Users, their current keys and the remaining matches with the predictions for them, ready for simulate() """
+    users = db.execute("""
+                       -- full scan: odds for all users
+                       SELECT id, total_points, correct_result, correct_goal_diff, correct_tendency FROM users ORDER BY id
+                       """)
+    ids = np.array([user["id"] for user in users], dtype=np.int64)
+    keys = np.array([user["total_points"] * key_points + user["correct_result"] * key_result
+                     + user["correct_goal_diff"] * key_goal_diff + user["correct_tendency"] * key_tendency
+                     for user in users], dtype=np.int32)
+
+    league = db.execute("""
+                        -- full scan: all teams of the league
+                        SELECT SUM(goals) AS goals, SUM(matches) AS matches FROM teams
+                        """)[0]
+    goals_per_team = league["goals"] / league["matches"] if league["matches"] else 0
+
+    # Matches that are not in the users' totals yet (a finished one keeps its result)
+    matches = db.execute("""
+                         SELECT m.id, m.matchIsFinished, m.team1_score, m.team2_score,
+                         team1.goals AS team1_goals, team1.opponentGoals AS team1_opponent_goals, team1.matches AS team1_matches,
+                         team2.goals AS team2_goals, team2.opponentGoals AS team2_opponent_goals, team2.matches AS team2_matches
+                         FROM FCH_matches AS m
+                         JOIN teams AS team1 ON team1.id = m.team1_id
+                         JOIN teams AS team2 ON team2.id = m.team2_id
+                         WHERE m.predictions_evaluated = 0
+                         """)
+
+    remaining = []
+    for match in matches:
+        team1 = {"goals": match["team1_goals"], "opponentGoals": match["team1_opponent_goals"], "matches": match["team1_matches"]}
+        team2 = {"goals": match["team2_goals"], "opponentGoals": match["team2_opponent_goals"], "matches": match["team2_matches"]}
+
+        predictions = db.execute("SELECT user_id, team1_score, team2_score FROM predictions WHERE match_id = ?", match["id"])
+
+        # Every user points to one of the distinct predicted scores (or to the last entry: no prediction)
+        scores = sorted({(prediction["team1_score"], prediction["team2_score"]) for prediction in predictions})
+        score_index = {score: index for index, score in enumerate(scores)}
+        predicted = np.full(len(ids), len(scores), dtype=np.int32)
+        predicted[np.searchsorted(ids, [prediction["user_id"] for prediction in predictions])] = \
+            [score_index[(prediction["team1_score"], prediction["team2_score"])] for prediction in predictions]
+
+        result = (match["team1_score"], match["team2_score"]) if match["matchIsFinished"] else None
+
+        remaining.append({
+            "expected_goals": (get_expected_goals(team1, team2, goals_per_team), get_expected_goals(team2, team1, goals_per_team)),
+            "result": result,
+            "scores": np.array(scores, dtype=np.int32).reshape(-1, 2),
+            "predicted": predicted,
+        })
+
+    return {"ids": ids, "keys": keys, "matches": remaining}
+
+
+def score_keys(scores, team1_goals, team2_goals):
+    """ Key increment (iterations x distinct scores + 1) of each predicted score for simulated results of one match """
+    team1_goals, team2_goals = team1_goals[:, None], team2_goals[:, None]
+    team1_scores, team2_scores = scores[:, 0], scores[:, 1]
+
+    result = (team1_scores == team1_goals) & (team2_scores == team2_goals)
+    goal_diff = (team1_scores - team2_scores) == (team1_goals - team2_goals)
+    tendency = np.sign(team1_scores - team2_scores) == np.sign(team1_goals - team2_goals)
+
+    increments = np.select([result, goal_diff, tendency],
+                           [points_result * key_points + key_result,
+                            points_goal_diff * key_points + key_goal_diff,
+                            points_tendency * key_points + key_tendency], 0).astype(np.int32)
+
+    # No prediction: no points
+    return np.hstack([increments, np.zeros((len(increments), 1), dtype=np.int32)])
+
+
+def simulate(season, iterations, seed):
+    """ How often each user ends up within each of top_positions (shared ranks count), as (len(top_positions), users) """
+    rng = np.random.default_rng(seed)
+    users = len(season["ids"])
+    hits = np.zeros((len(top_positions), users), dtype=np.int64)
+
+    if not users:
+        return hits
+
+    top = min(max(top_positions), users)
+    chunk = max(1, simulation_cells // users)
+
+    for start in range(0, iterations, chunk):
+        size = min(chunk, iterations - start)
+        keys = np.broadcast_to(season["keys"], (size, users)).copy()
+
+        for match in season["matches"]:
+            if match["result"]:
+                team1_goals, team2_goals = np.full(size, match["result"][0]), np.full(size, match["result"][1])
+            else:
+                team1_goals = rng.poisson(match["expected_goals"][0], size)
+                team2_goals = rng.poisson(match["expected_goals"][1], size)
+
+            # Scored once per distinct predicted score, then looked up for every user
+            keys += np.take(score_keys(match["scores"], team1_goals, team2_goals), match["predicted"], axis=1)
+
+        # A user is within the top n if fewer than n users have a higher key, i.e. the key is at least the n-th highest.
+        # One partition moves the highest keys to the end of each row, only those get sorted
+        highest = np.sort(np.partition(keys, users - top, axis=1)[:, users - top:], axis=1)
+        for row, position in enumerate(top_positions):
+            threshold = highest[:, top - min(position, users)]
+            hits[row] += (keys >= threshold[:, None]).sum(axis=0)
+
+    return hits
+
+
+def get_pool_context():
+    """
+    Start the workers from a fresh process (forkserver, spawn where there is none), never by forking the app: a fork
+    copies the locks and sqlite connections that the app's other threads (scheduler, live poller, requests) hold right then
+    """
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+
+    # The fork server imports numpy and this module once, not every worker
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(["title_odds"])
+    return context
+
+
+def compute_title_odds(iterations=simulation_iterations, workers=simulation_workers, seed=None):
+    """ Probabilities per user as {user_id: (first, top3, top10)} """
+    season = load_season()
+
+    # One job per worker, each with its own random stream
+    jobs = [iterations // workers + (job < iterations % workers) for job in range(workers)]
+    jobs = [job for job in jobs if job]
+    seeds = np.random.SeedSequence(seed).spawn(len(jobs))
+
+    if len(jobs) == 1:
+        hits = simulate(season, jobs[0], seeds[0])
+    else:
+        with ProcessPoolExecutor(max_workers=len(jobs), mp_context=get_pool_context()) as pool:
+            hits = sum(pool.map(simulate, [season] * len(jobs), jobs, seeds))
+
+    odds = hits / iterations
+    return {int(user_id): tuple(float(p) for p in odds[:, column]) for column, user_id in enumerate(season["ids"])}
+
+
+def update_title_odds(iterations=simulation_iterations, workers=simulation_workers):
+    """ Recompute the title odds and store them """
+    global _computed_versions, _computed_kicked_off
+
+    versions = get_data_versions()
+    kicked_off = get_kicked_off_count()
+    odds = compute_title_odds(iterations, workers)
+
+    with db.transaction():
+        db.execute("""
+                   -- full scan: replaced as a whole
+                   DELETE FROM title_odds
+                   """)
+        db.executemany("INSERT INTO title_odds (user_id, first, top3, top10) VALUES (?, ?, ?, ?)",
+                       [(user_id, *user_odds) for user_id, user_odds in odds.items()])
+        bump_data_version("title_odds")
+
+    _computed_versions = versions
+    _computed_kicked_off = kicked_off
+
+
+def get_kicked_off_count():
+    return db.execute("SELECT COUNT(*) AS count FROM FCH_matches WHERE kickoff <= ?", get_current_timestamp())[0]["count"]
+
+
+def is_update_needed_title_odds():
+    """
+    True if scores or the league table changed since the odds were computed (by this process). Changed predictions only
+    count once another match kicked off: before a matchday tips are saved every minute, and the simulation shouldn't run
+    again for each of them. The predictions of a match that kicked off are final
+    """
+    versions = get_data_versions()
+
+    if _computed_versions is None or any(versions[name] != _computed_versions[name] for name in ("league_table", "ranking")):
+        return True
+
+    return versions["predictions"] != _computed_versions["predictions"] and get_kicked_off_count() != _computed_kicked_off
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute the title odds. Run from the directory containing tippspiel.db")
+    parser.add_argument("--iterations", type=int, default=simulation_iterations)
+    parser.add_argument("--workers", type=int, default=simulation_workers)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    update_title_odds(args.iterations, args.workers)
+    print("Title odds updated.")
+
+
+if __name__ == "__main__":
+    main()
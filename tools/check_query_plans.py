@@ -0,0 +1,132 @@
+"""
+Runs EXPLAIN QUERY PLAN for every query the app sends through db.execute and fails if one of them
+scans a whole table instead of using an index.
+
+Queries that are meant to read a whole table (e. g. the full season or the whole ranking) have to say so
+with a "-- full scan: <reason>" comment in the SQL. Walking an index in order until a LIMIT is reached
+(ORDER BY indexed column LIMIT n) does not count as a full scan.
+
+Usage: python tools/check_query_plans.py [files...]  (default: all .py files in the root directory)
+Exit code 1 if a query falls back to a full scan or cannot be explained.
+"""
+import ast
+import glob
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_root)
+
+full_scan_marker = "-- full scan:"
+explained_commands = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+def find_queries(path):
+    """ (line, sql) of every db.execute / db.executemany call with a literal (or f-string) query """
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr in ("execute", "executemany")):
+            continue
+
+        if not (isinstance(node.func.value, ast.Name) and node.func.value.id == "db" and node.args):
+            continue
+
+        query = node.args[0]
+
+        if isinstance(query, ast.Constant) and isinstance(query.value, str):
+            yield node.lineno, query.value
+
+        # Parts of f-strings (like the points CASE in scoring.py) are replaced with a constant
+        elif isinstance(query, ast.JoinedStr):
+            yield node.lineno, "".join(part.value if isinstance(part, ast.Constant) else "0" for part in query.values)
+
+
+def count_placeholders(sql):
+    # Ignore question marks inside string literals and comments
+    sql = re.sub(r"'[^']*'", "", sql)
+    sql = re.sub(r"--[^\n]*", "", sql)
+    return sql.count("?")
+
+
+def get_full_scans(connection, sql):
+    """ Tables (or their aliases) the query scans completely """
+    tables = {row[0].lower() for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+    # Aliases like "predictions AS p" or "teams team1"
+    for table, alias in re.findall(r"(?=\b(\w+)\s+(?:AS\s+)?(\w+))", sql, re.IGNORECASE):
+        if table.lower() in tables:
+            tables.add(alias.lower())
+
+    plan = connection.execute("EXPLAIN QUERY PLAN " + sql, [None] * count_placeholders(sql)).fetchall()
+    scans = []
+
+    for row in plan:
+        detail = row[-1]
+        match = re.match(r"SCAN (\w+)", detail)
+
+        if not match or match.group(1).lower() not in tables:
+            continue
+
+        # Top-n along an index stops early
+        if " USING " in detail and re.search(r"\bLIMIT\b", sql, re.IGNORECASE):
+            continue
+
+        scans.append(detail)
+
+    return scans
+
+
+def main():
+    files = sys.argv[1:] or sorted(glob.glob(os.path.join(repo_root, "*.py")))
+
+    # Explain against a migrated copy of the database
+    workdir = tempfile.mkdtemp()
+    shutil.copy(os.path.join(repo_root, "tippspiel.db"), workdir)
+    os.chdir(workdir)
+
+    import migrations
+    migrations.migrate()
+
+    connection = sqlite3.connect("tippspiel.db")
+    failures = 0
+    checked = 0
+
+    try:
+        for path in files:
+            for line, sql in find_queries(path):
+                command = re.sub(r"--[^\n]*", "", sql).strip().upper()
+
+                if not command.startswith(explained_commands):
+                    continue
+
+                location = f"{os.path.relpath(path, repo_root)}:{line}"
+                checked += 1
+
+                try:
+                    scans = get_full_scans(connection, sql)
+                except sqlite3.Error as e:
+                    print(f"{location}: cannot explain query: {e}")
+                    failures += 1
+                    continue
+
+                if scans and full_scan_marker not in sql:
+                    print(f"{location}: full scan ({'; '.join(scans)})")
+                    print("    " + " ".join(sql.split()))
+                    failures += 1
+
+    finally:
+        connection.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{checked} queries checked, {failures} problems")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
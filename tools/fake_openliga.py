@@ -0,0 +1,468 @@
+"""
+Local stand-in for the parts of the OpenLigaDB API used by helpers.py, for benchmarks and offline testing.
+
+The season it serves is built from a local database (--db) or replayed from a recorded fixture (--fixture, written
+by --record from the real API). Responses can be slowed down (--latency, --jitter) and fail at random (--error-rate:
+429/5xx answers, --drop-rate: connections closed without an answer), so that the retries and backoff of openliga.py
+get exercised. --scenario plays out a matchday on the last match of the season: kickoff, goals, final whistle and
+a late correction of the result, sped up by --speed.
+
+Usage: python tools/fake_openliga.py [--db tippspiel.db | --fixture season.json] [--port 8765] [--latency 0.05]
+                                     [--error-rate 0.1] [--drop-rate 0.05] [--scenario] [--speed 60]
+       python tools/fake_openliga.py --record season.json
+Then point the app at it with TIPPSPIEL_OPENLIGA_URL=http://127.0.0.1:8765
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Statuses of simulated errors (openliga.py retries all of them)
+error_statuses = (429, 500, 502, 503)
+
+
+def build_fixture(db_path):
+    """ Season data in OpenLigaDB's JSON format, built from the matches and teams of a local database """
+    connection = sqlite3.connect(db_path)
+    connection.row_factory = sqlite3.Row
+
+    teams = {row["id"]: dict(row) for row in connection.execute("SELECT * FROM teams")}
+    matches = []
+
+    for row in connection.execute("SELECT * FROM FCH_matches ORDER BY matchday"):
+        match = {
+            "matchID": row["id"],
+            "matchDateTime": row["matchDateTime"],
+            "group": {"groupOrderID": row["matchday"], "groupName": f"{row['matchday']}. Spieltag"},
+            "team1": {"teamId": int(row["team1_id"]), "teamName": teams[int(row["team1_id"])]["teamName"]},
+            "team2": {"teamId": int(row["team2_id"]), "teamName": teams[int(row["team2_id"])]["teamName"]},
+            "lastUpdateDateTime": row["lastUpdateDateTime"],
+            "matchIsFinished": bool(row["matchIsFinished"]),
+            "matchResults": [],
+            "goals": [],
+        }
+
+        if row["matchIsFinished"]:
+            match["matchResults"] = [
+                {"resultTypeID": 1, "resultName": "Halbzeit", "pointsTeam1": 0, "pointsTeam2": 0},
+                {"resultTypeID": 2, "resultName": "Endergebnis", "pointsTeam1": row["team1_score"], "pointsTeam2": row["team2_score"]},
+            ]
+
+        matches.append(match)
+
+    table = []
+    for team in sorted(teams.values(), key=lambda team: team["rank"] or 99):
+        table.append({
+            "teamInfoId": team["id"],
+            "teamName": team["teamName"],
+            "shortName": team["shortName"],
+            "teamIconUrl": team["teamIconUrl"],
+            "points": team["points"],
+            "opponentGoals": team["opponentGoals"],
+            "goals": team["goals"],
+            "matches": team["matches"],
+            "won": team["won"],
+            "lost": team["lost"],
+            "draw": team["draw"],
+            "goalDiff": team["goalDiff"],
+        })
+
+    connection.close()
+
+    return {"matches": matches, "table": table, "teams": get_teams(table)}
+
+
+def get_teams(table):
+    """ getavailableteams payload, derived from the league table """
+    return [{"teamId": team["teamInfoId"], "teamName": team["teamName"], "shortName": team["shortName"],
+             "teamIconUrl": team["teamIconUrl"]} for team in table]
+
+
+def record_fixture(base_url="https://api.openligadb.de"):
+    """ Season fixture with the responses of the real API (the same urls helpers.py syncs from) """
+    sys.path.insert(0, repo_root)
+    import helpers
+    import openliga
+
+    openliga.base_url = base_url.rstrip("/")
+
+    return {
+        "matches": openliga.get_json(helpers.url_matchdata),
+        "table": openliga.get_json(helpers.url_table),
+        "teams": openliga.get_json(helpers.url_teams),
+    }
+
+
+def load_fixture(path):
+    with open(path, encoding="utf-8") as f:
+        fixture = json.load(f)
+
+    fixture.setdefault("teams", get_teams(fixture["table"]))
+    return fixture
+
+
+def save_fixture(fixture, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(fixture, f, ensure_ascii=False, indent=1)
+
+
+def now_iso():
+    # OpenLigaDB sends local times with fractions of a second
+    return datetime.now().isoformat(timespec="milliseconds")
+
+
+class FakeOpenLiga:
+    """
+    Threaded HTTP server answering OpenLigaDB requests from a fixture. The fixture may be changed while the server
+    runs (see MatchdayScenario), as long as it is done while holding server.lock
+    """
+
+    def __init__(self, fixture, latency=0.0, port=0, jitter=0.0, error_rate=0.0, drop_rate=0.0, seed=None):
+        self.fixture = fixture
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.requests = 0
+        self.errors = 0
+        self.not_modified = 0
+        self.lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def current_matchday(self):
+        # First matchday with an unfinished match, like OpenLigaDB's getcurrentgroup
+        for match in self.fixture["matches"]:
+            if not match["matchIsFinished"]:
+                return match["group"]["groupOrderID"]
+
+        return self.fixture["matches"][-1]["group"]["groupOrderID"]
+
+    def route(self, path):
+        """ Payload for a request path, or None for unknown paths """
+        parts = path.strip("/").split("/")
+        matches = self.fixture["matches"]
+
+        if parts[0] == "getmatchdata" and len(parts) == 2:
+            return next((match for match in matches if str(match["matchID"]) == parts[1]), None)
+
+        if parts[0] == "getmatchdata":
+            return matches
+
+        if parts[0] == "getbltable":
+            return self.fixture["table"]
+
+        if parts[0] == "getavailableteams":
+            return self.fixture["teams"]
+
+        if parts[0] == "getcurrentgroup":
+            matchday = self.current_matchday()
+            return {"groupName": f"{matchday}. Spieltag", "groupOrderID": matchday}
+
+        if parts[0] == "getlastchangedate":
+            return max(match["lastUpdateDateTime"] or "" for match in matches) or now_iso()
+
+        return None
+
+    def draw_latency(self):
+        """ Seconds to wait before answering: the latency plus up to jitter """
+        with self.lock:
+            return self.latency + self._random.uniform(0, self.jitter)
+
+    def draw_failure(self):
+        """ "drop", an error status or None, at the configured rates """
+        with self.lock:
+            chance = self._random.random()
+
+            if chance < self.drop_rate:
+                return "drop"
+            if chance < self.drop_rate + self.error_rate:
+                return self._random.choice(error_statuses)
+
+        return None
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep connections alive like the real API does
+            protocol_version = "HTTP/1.1"
+
+            def send_empty(self, status, headers=()):
+                self.send_response(status)
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_GET(self):
+                with server.lock:
+                    server.requests += 1
+
+                if server.latency or server.jitter:
+                    time.sleep(server.draw_latency())
+
+                failure = server.draw_failure()
+
+                if failure:
+                    with server.lock:
+                        server.errors += 1
+
+                    # The client sees a connection error
+                    if failure == "drop":
+                        self.close_connection = True
+                        return
+
+                    self.send_empty(failure, [("Retry-After", "1")] if failure == 429 else [])
+                    return
+
+                with server.lock:
+                    payload = server.route(self.path.split("?")[0])
+                    body = None if payload is None else json.dumps(payload).encode()
+
+                if body is None:
+                    self.send_empty(404)
+                    return
+
+                # Conditional requests, like the real API (openliga.get_json revalidates with If-None-Match)
+                etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+
+                if self.headers.get("If-None-Match") == etag:
+                    with server.lock:
+                        server.not_modified += 1
+
+                    self.send_empty(304, [("ETag", etag)])
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+class MatchdayScenario:
+    """
+    Plays out one match of the fixture: it is reset to "not started" with the kickoff kickoff_in seconds from now,
+    then kickoff, the goals, half time, the final whistle (the league table is updated) and optionally a late
+    correction of the result happen at their match minute. speed is the number of match seconds per real second,
+    e. g. 60 plays a minute per second. The kickoff is a real date, so the app sees the match as live.
+
+    goals: [(minute, team)] with team 1 or 2. correction: (team1_score, team2_score) set correction_after minutes
+    after the final whistle. events lists what already happened as (time, description)
+    """
+
+    def __init__(self, server, match_id=None, goals=((23, 1), (51, 2), (78, 1)), correction=None, correction_after=20,
+                 kickoff_in=0, speed=60):
+        self.server = server
+        matches = server.fixture["matches"]
+        self.match = matches[-1] if match_id is None else next(match for match in matches if match["matchID"] == match_id)
+        self.goals = sorted(goals)
+        self.correction = correction
+        self.correction_after = correction_after
+        self.speed = speed
+        self.events = []
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        with server.lock:
+            # Take back what the match already contributed to the table
+            if self.match["matchIsFinished"]:
+                self._apply_to_table(*self._final_score(), sign=-1)
+
+            self.kickoff = datetime.now().replace(microsecond=0) + timedelta(seconds=kickoff_in)
+            self.match.update({"matchDateTime": self.kickoff.isoformat(), "matchIsFinished": False, "matchResults": [],
+                               "goals": [], "lastUpdateDateTime": now_iso()})
+
+    @property
+    def final_score(self):
+        """ The score the match ends with (after the correction, if there is one) """
+        if self.correction:
+            return tuple(self.correction)
+
+        return sum(team == 1 for _, team in self.goals), sum(team == 2 for _, team in self.goals)
+
+    def timeline(self):
+        """ (match minute, description, action) of everything that happens, in order """
+        events = [(0, "kickoff", self._kickoff)]
+        events += [(minute, f"goal team {team}", lambda team=team, minute=minute: self._goal(team, minute))
+                   for minute, team in self.goals if minute <= 45]
+        events.append((45, "half time", self._half_time))
+        events += [(minute, f"goal team {team}", lambda team=team, minute=minute: self._goal(team, minute))
+                   for minute, team in self.goals if minute > 45]
+        events.append((90, "final whistle", self._final_whistle))
+
+        if self.correction:
+            events.append((90 + self.correction_after, "correction {}:{}".format(*self.correction), self._correct))
+
+        return events
+
+    def run(self):
+        """ Play the timeline in (sped up) real time, blocks until the match is over or stop() is called """
+        for minute, description, action in self.timeline():
+            due = self.kickoff + timedelta(seconds=minute * 60 / self.speed)
+            wait = (due - datetime.now()).total_seconds()
+
+            if wait > 0 and self._stop_event.wait(wait):
+                return
+
+            self.step(description, action)
+
+    def play_all(self):
+        """ Apply the whole timeline at once (no waiting) """
+        for _, description, action in self.timeline():
+            self.step(description, action)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+
+    def join(self, timeout=None):
+        self._thread.join(timeout)
+
+    @property
+    def finished(self):
+        return self._thread is not None and not self._thread.is_alive()
+
+    def step(self, description, action):
+        with self.server.lock:
+            action()
+            self.match["lastUpdateDateTime"] = now_iso()
+            self.events.append((time.time(), description))
+
+    def _score(self):
+        if not self.match["goals"]:
+            return 0, 0
+
+        return self.match["goals"][-1]["scoreTeam1"], self.match["goals"][-1]["scoreTeam2"]
+
+    def _final_score(self):
+        result = next(result for result in self.match["matchResults"] if result["resultTypeID"] == 2)
+        return result["pointsTeam1"], result["pointsTeam2"]
+
+    def _kickoff(self):
+        self.match["goals"] = []
+
+    def _goal(self, team, minute):
+        team1_score, team2_score = self._score()
+        self.match["goals"].append({
+            "goalID": len(self.match["goals"]) + 1,
+            "scoreTeam1": team1_score + (team == 1),
+            "scoreTeam2": team2_score + (team == 2),
+            "matchMinute": minute,
+            "goalGetterName": f"Spieler {len(self.match['goals']) + 1}",
+        })
+
+    def _half_time(self):
+        self.match["matchResults"] = [{"resultTypeID": 1, "resultName": "Halbzeit",
+                                       "pointsTeam1": self._score()[0], "pointsTeam2": self._score()[1]}]
+
+    def _final_whistle(self):
+        team1_score, team2_score = self._score()
+        self.match["matchIsFinished"] = True
+        self.match["matchResults"] = self.match["matchResults"][:1] + [
+            {"resultTypeID": 2, "resultName": "Endergebnis", "pointsTeam1": team1_score, "pointsTeam2": team2_score}]
+        self._apply_to_table(team1_score, team2_score)
+
+    def _correct(self):
+        self._apply_to_table(*self._final_score(), sign=-1)
+        self.match["matchResults"][-1].update({"pointsTeam1": self.correction[0], "pointsTeam2": self.correction[1]})
+        self._apply_to_table(*self.correction)
+
+    def _apply_to_table(self, team1_score, team2_score, sign=1):
+        """ Add (sign=-1: take back) the result to the league table and sort it again """
+        table = {team["teamInfoId"]: team for team in self.server.fixture["table"]}
+
+        for team_id, goals, opponent_goals in ((self.match["team1"]["teamId"], team1_score, team2_score),
+                                               (self.match["team2"]["teamId"], team2_score, team1_score)):
+            team = table.get(team_id)
+
+            if team is None:
+                continue
+
+            won, draw, lost = goals > opponent_goals, goals == opponent_goals, goals < opponent_goals
+            team["matches"] += sign
+            team["goals"] += sign * goals
+            team["opponentGoals"] += sign * opponent_goals
+            team["goalDiff"] = team["goals"] - team["opponentGoals"]
+            team["won"] += sign * won
+            team["draw"] += sign * draw
+            team["lost"] += sign * lost
+            team["points"] += sign * (3 * won + draw)
+
+        self.server.fixture["table"].sort(key=lambda team: (-team["points"], -team["goalDiff"], -team["goals"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="tippspiel.db", help="database to build the season fixture from")
+    parser.add_argument("--fixture", help="replay a recorded fixture (JSON) instead of building one from --db")
+    parser.add_argument("--record", metavar="PATH", help="record the season from the real API to PATH and exit")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many seconds added on top of --latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 429/5xx")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="share of connections closed without an answer")
+    parser.add_argument("--scenario", action="store_true", help="play out the last match of the season")
+    parser.add_argument("--kickoff-in", type=float, default=60, help="seconds until the scenario match kicks off")
+    parser.add_argument("--speed", type=float, default=60, help="match seconds per real second in the scenario")
+    parser.add_argument("--correction", help="late correction of the scenario result, e. g. 2:2")
+    args = parser.parse_args()
+
+    if args.record:
+        save_fixture(record_fixture(), args.record)
+        print(f"Fixture saved to {args.record}")
+        return
+
+    fixture = load_fixture(args.fixture) if args.fixture else build_fixture(args.db)
+    server = FakeOpenLiga(fixture, latency=args.latency, port=args.port, jitter=args.jitter,
+                          error_rate=args.error_rate, drop_rate=args.drop_rate)
+    print(f"Fake OpenLigaDB listening on {server.url}")
+
+    if args.scenario:
+        correction = tuple(int(score) for score in args.correction.split(":")) if args.correction else None
+        scenario = MatchdayScenario(server, correction=correction, kickoff_in=args.kickoff_in, speed=args.speed).start()
+        print(f"Match {scenario.match['matchID']} kicks off at {scenario.kickoff:%H:%M:%S}")
+
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()